@@ -0,0 +1,43 @@
+'''
+Benchmark of hash based duplicate detection (toolbox_utils.duplicates_engine) on synthetic IDs - run from scripts folder:
+python -m benchmarks.duplicates [SIZES ...] [-r RATIO]
+'''
+import time
+import random
+import argparse
+from typing import List
+from toolbox_utils.duplicates_engine import find_duplicates
+
+
+def benchmark(sizes: List[int], duplicate_ratio: float = 0.01) -> None:
+    '''
+    Runs find_duplicates over synthetic ID columns of given sizes and prints out time per million rows - should stay constant (linear scaling).
+    '''
+    for size in sizes:
+        ids = list(range(size))
+        for i in random.sample(range(size), int(size * duplicate_ratio)):
+            ids[i] = random.randrange(size)
+        rows = zip(range(size), ids)
+
+        start = time.perf_counter()
+        duplicates = find_duplicates(rows, 0, [1])
+        elapsed = time.perf_counter() - start
+
+        print(f'{size:>10} rows: {elapsed:8.3f} s, {elapsed / size * 1e6:6.3f} s per million rows, {len(duplicates[0])} duplicated values')
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark of hash based duplicate detection on synthetic IDs.')
+    parser.add_argument('sizes', nargs='*', type=int, default=[100_000, 500_000, 1_000_000, 2_000_000, 4_000_000],
+                        help='Numbers of synthetic rows')
+    parser.add_argument('-r', '--ratio', type=float, default=0.01,
+                        help='Fraction of rows overwritten with duplicate IDs')
+
+    args = parser.parse_args()
+
+    benchmark(args.sizes, args.ratio)
+
+
+if __name__ == "__main__":
+    main()
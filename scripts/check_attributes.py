@@ -1,5 +1,9 @@
 from toolbox_utils.gdb_getter import get_gdb_path_3D_geoms
 from toolbox_utils.messages_print import aprint, log_it, setup_logging
+from toolbox_utils.parallel import get_workers, run_localities
+from toolbox_utils.fc_cache import read_columns
+from toolbox_utils.attribute_rules import REQUIRED_COLUMNS, evaluate_rules, load_rules
+from toolbox_utils.violations import ViolationStore
 import os
 import sys
 import arcpy
@@ -7,6 +11,8 @@ import logging
 from typing import (List, Union)
 numeric = Union[int, float]
 
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(__file__), 'attribute_rules.json')
+
 
 class CheckAttributeValues(object):
     '''
@@ -42,11 +48,32 @@ class CheckAttributeValues(object):
             multiValue='True'
         )
 
+        workers = arcpy.Parameter(
+            name='workers',
+            displayName='Number of worker processes for parallel checking of localities',
+            direction='Input',
+            datatype='GPLong',
+            parameterType='Optional',
+            enabled='True',
+        )
+
+        rules_path = arcpy.Parameter(
+            name='rules_path',
+            displayName='Attribute rules definition (.json)',
+            direction='Input',
+            datatype='DEFile',
+            parameterType='Optional',
+            enabled='True',
+        )
+
+        workers.value = os.cpu_count()
+        rules_path.value = DEFAULT_RULES_PATH
+        rules_path.filter.list = ['json']
         # TODO - otestovat na neulozenem projektu
         log_file_path.value = os.path.join(os.path.dirname(os.path.dirname(
             os.path.dirname(arcpy.mp.ArcGISProject("CURRENT").filePath))), 'logs')
 
-        params = [log_file_path, root_dir_lokalita_multiple]
+        params = [log_file_path, root_dir_lokalita_multiple, workers, rules_path]
 
         return params
 
@@ -80,10 +107,10 @@ def has_duplicates(lst):
 
 
 
-def log_out_problematic_features(problematic_features: dict, column_dicts) -> None:
+def log_out_problematic_features(problematic_features: ViolationStore, columns: dict) -> None:
     if problematic_features:
-        for problem_k, problem_v in problematic_features.items():
-            if len(problem_v) == len(column_dicts):
+        for problem_k in problematic_features.rules():
+            if problematic_features.count(problem_k) == problematic_features.num_rows:
                 log_it(
                     f'Problem {problem_k} found in all features in featureclass', 'warning', __name__)
             # elif (len(problem_v) > 50):
@@ -91,121 +118,50 @@ def log_out_problematic_features(problematic_features: dict, column_dicts) -> No
             #         f'Problem {problem_k} found in more than 50 ID_PLO: {problem_v[:50]}', 'warning', __name__)
             #     log_it(f'Due to large amount, not all results have been prited into the console, please check the data manualy', 'warning', __name__)
             else:
+                # ids are materialised only here
+                problem_v = problematic_features.ids(problem_k, columns[problematic_features.id_field(problem_k)])
                 if (has_duplicates(problem_v)):
                     uniqued = tuple(set(problem_v))
                     log_it(f'Problem {problem_k} occured for ID_SEG in {uniqued}', 'warning', __name__)
                 else:
                     log_it(f'Problem {problem_k} occured for ID_PLO in {tuple(problem_v)}', 'warning', __name__)
 
+        faulty = problematic_features.count_bits(problematic_features.union(*problematic_features.rules()))
+        log_it(f'{faulty} of {problematic_features.num_rows} features violate at least one rule', 'info', __name__)
+
     else:
         log_it('Attribute values are correct', 'info', __name__)
     return
 
 
-def decide_rimsa_column_name(fc: dict) -> str:
-    conflicting_col_name = 'RIMSA_VYSKA'
-    if 'HORIZ_VYSKA' in fc.keys():
-        conflicting_col_name = 'HORIZ_VYSKA'
-    return conflicting_col_name
-
-
-def check_codelist(feature, column, start, stop) -> bool:
-    return True if feature[f'{column}'] not in range(start, stop+1) else False
-
+def evaluate_conds(conds: List[tuple], num_rows: int) -> ViolationStore:
+    '''
+    Stores masks of conditions as packed bit-arrays of faulty features.
+    '''
+    problems = ViolationStore(num_rows)
+    for cond_name, mask, id_col in conds:
+        problems.add(cond_name, mask, id_col)
 
-def evaluate_conds(conds, feature, problems):
-    for cond_name, cond_val in conds.items():
-        if cond_val:
-            if cond_name == 'RIMSA_VYSKA HAS ABNORMALY SMALL VALUES':
-                problems.setdefault(cond_name, []).append(int(feature['ID_SEG']))
-            else:
-                problems.setdefault(cond_name, []).append(int(feature['ID_PLO']))    
-            
     return problems
 
 
-def calculate_rimsa_vyska_rel(rimsa_vyska_val, pata_vyska_val, abs_vyska_val) -> numeric:
-    rimsa_vyska_frac = (rimsa_vyska_val - pata_vyska_val) / (abs_vyska_val - pata_vyska_val)
-    # log_it(f'RIMSA_VYSKA_REL: {rimsa_vyska_frac}', 'info', __name__)
-    return rimsa_vyska_frac
-
-
-def check_rimsa_vyska_rel_small(rimsa_vyska_frac) -> bool:
-    return rimsa_vyska_frac < 0.3
-
-def check_rimsa_vyska_rel_big(rimsa_vyska_frac) -> bool:
-    return rimsa_vyska_frac > 0.9
-
-# def check_rimsa_vyska_in_range(rimsa_vyska_frac, lower_bound, upper_bound) -> bool:
-#     return lower_bound <= rimsa_vyska_frac <= upper_bound
-
-
-def check_conditions(data) -> dict:
+def check_conditions(columns: dict, rules_path: str) -> ViolationStore:
     '''
-    Checks defined conditions for given columns - return dictionary with faulty features 
+    Checks conditions defined in rule file (rules_path) for given columns (numpy arrays) - return store of faulty features 
     '''
-    problems = {}
-
-    for feature in data:
-        conditions = {}
-        has_null = False
-        conflicting_col_name = decide_rimsa_column_name(feature)
-
-        for col, val in feature.items():
-            if val is None:
-                has_null = True
-                conditions[f'NULL VALUES FOUND IN {col}'] = True
-
-        if not has_null:
-            rimsa_vyska_frac = calculate_rimsa_vyska_rel(feature[f'{conflicting_col_name}'], feature['PATA_SEG_VYSKA'], feature['ABS_SEG_VYSKA'])
-            conditions = {
-                'PATA_VYSKA >= ABS_VYSKA': feature['PATA_VYSKA'] >= feature['ABS_VYSKA'],
-                'PATA_VYSKA >= HREBEN_VYSKA': feature['PATA_VYSKA'] >= feature['HREBEN_VYSKA'],
-                'PATA_SEG_VYSKA >= ABS_SEG_VYSKA': feature['PATA_SEG_VYSKA'] >= feature['ABS_SEG_VYSKA'],
-                'HORIZ_VYSKA ("RIMSA_VYSKA") > ABS_SEG_VYSKA': round(feature[f'{conflicting_col_name}'], 2) > round(feature['ABS_SEG_VYSKA'], 2),
-                'PATA_SEG_VYSKA >= HORIZ_VYSKA ("RIMSA_VYSKA")': feature['PATA_SEG_VYSKA'] >= feature[f'{conflicting_col_name}'],
-                'STRECHA_KOD CONTAINS INVALID VALUES': check_codelist(feature, 'STRECHA_KOD', 1, 7),
-                'PLOCHA_KOD CONTAINS INVALID VALUES': check_codelist(feature, 'PLOCHA_KOD', 1, 4),
-                'RIMSA_VYSKA HAS ABNORMALY SMALL VALUES': check_rimsa_vyska_rel_small(rimsa_vyska_frac),
-                # 'RIMSA_VYSKA HAS ABNORMALY BIG VALUES': check_rimsa_vyska_rel_big(rimsa_vyska_frac),
-                # 'RIMSA_VYSKA IS IN RANGE 0.3 - 0.7': check_rimsa_vyska_in_range(rimsa_vyska_frac, 0.3, 0.7),
-            }   
-
-        # Check if 'CAST_OBJEKTU' exists before adding its condition
-        if 'CAST_OBJEKTU' in feature:
-            conditions['CAST_OBJEKTU CONTAINS INVALID VALUES'] = check_codelist(
-                feature, 'CAST_OBJEKTU', 1, 5)
-
-        problems_out = evaluate_conds(conditions, feature, problems)
-
-    return problems_out
-
-
-def search_cursor_tuple_to_dict_colmn_name_keys(cursor, cols) -> List[dict]:
-    ''' 
-    creates list of dicts instead of list of tuples -> feature: {column_name: column value}
-    '''
-    column_dicts = []
-    for row in cursor:
-        row_dict = {}
-        for col_i in range(len(row)):
-            row_dict[cols[col_i]] = row[col_i]
-        column_dicts.append(row_dict)
-
-    return column_dicts
+    num_rows = len(next(iter(columns.values()))) if columns else 0
+    return evaluate_conds(evaluate_rules(load_rules(rules_path), columns), num_rows)
 
 
-def inspect_attributes(fc: str, cols: List[str]) -> None:
+def inspect_attributes(fc: str, cols: List[str], rules_path: str, gdb_path: str = None) -> None:
     '''
-    Loop over all features of given feature class (fc) and specified columns.
+    Reads all features of given feature class (fc) and specified columns into numpy arrays (cached for unchanged geodatabase gdb_path) and checks them.
     '''
 
     try:
-        with arcpy.da.SearchCursor(fc, cols) as cursor:
-            column_dicts = search_cursor_tuple_to_dict_colmn_name_keys(
-                cursor, cols)
-            log_out_problematic_features(
-                check_conditions(column_dicts), column_dicts)
+        columns = read_columns(fc, cols, gdb_path)
+        log_out_problematic_features(
+            check_conditions(columns, rules_path), columns)
 
     # TODO - Dát tohle pryč - redundantni kdyz existuje check_feature_class_columns()
     # check if column missing in fc
@@ -246,35 +202,44 @@ def init_logging(log_dir_path: str) -> None:
     setup_logging(log_dir_path, class_name, __name__)
 
 
-def main(log_dir_path: str, location_root_folder_paths: str) -> None:
+def check_locality(location_folder: str, rules_path: str) -> None:
     '''
-    Main runtime - establishes required columns, required geometry.
-    # '''
-
-    # TODO - NUTNE VYRESIT V DATECH TAKHLE TO NEJDE
-    required_cols = ["OBJECTID", "RUIAN_IBO", "ID_SEG", "ID_PLO", 'PATA_VYSKA', 'HREBEN_VYSKA', 'ABS_VYSKA', 'HORIZ_VYSKA',
-                     'STRECHA_KOD', 'PATA_SEG_VYSKA', 'ABS_SEG_VYSKA', 'PLOCHA_KOD', 'CAST_OBJEKTU', 'Shape_Area', 'Shape', 'Shape_Length']
+    Checks attributes of PolygonZ featureclasses of one locality, runs in worker process.
+    '''
+    required_cols = REQUIRED_COLUMNS
     geoms = ['PolygonZ', 'Multipatch']
 
+    gdb = get_gdb_path_3D_geoms(location_folder, geoms[0])
+    log_it(f'{"-"*100}', 'info', __name__)
+    log_it(f"CURRENT GEODATABASE: {gdb}", 'info', __name__)
+
+    arcpy.env.workspace = gdb
+    datasets = arcpy.ListDatasets()
+
+    for dat in datasets:
+        for fc in arcpy.ListFeatureClasses('', '', dat):
+
+            if check_feature_class_columns(fc, required_cols):
+                inspect_attributes(fc=fc, cols=required_cols, rules_path=rules_path, gdb_path=gdb)
+            else:
+                return
+
+
+def main(log_dir_path: str, location_root_folder_paths: str, workers: int = None, rules_path: str = None) -> None:
+    '''
+    Main runtime - checks localities in parallel worker processes.
+    '''
+
     # setup file logging
     init_logging(log_dir_path)
 
     # parse out multiple parameters (multiple folder paths)
-    for location_folder in location_root_folder_paths.split(';'):
-        gdb = get_gdb_path_3D_geoms(location_folder, geoms[0])
-        log_it(f'{"-"*100}', 'info', __name__)
-        log_it(f"CURRENT GEODATABASE: {gdb}", 'info', __name__)
-
-        arcpy.env.workspace = gdb
-        datasets = arcpy.ListDatasets()
+    # rule file is compiled once here - errors in rules are reported before any locality is checked
+    rules_path = rules_path or DEFAULT_RULES_PATH
+    load_rules(rules_path)
 
-        for dat in datasets:
-            for fc in arcpy.ListFeatureClasses('', '', dat):
-
-                if check_feature_class_columns(fc, required_cols):
-                    inspect_attributes(fc=fc, cols=required_cols)
-                else:
-                    return
+    for _ in run_localities(check_locality, location_root_folder_paths.split(';'), get_workers(workers), rules_path):
+        pass
 
 
 ###################################################
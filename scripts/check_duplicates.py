@@ -1,10 +1,16 @@
 import os
 import sys
 import arcpy
-from typing import List
+from typing import (Dict, List)
 from toolbox_utils.messages_print import aprint, log_it, setup_logging
 from toolbox_utils.gdb_getter import get_gdb_path_3D_geoms, get_gdb_path_3D_geoms_multiple
 from toolbox_utils.clear_selection import clear_selection
+from toolbox_utils.duplicates_engine import scan_columns, format_duplicates
+from toolbox_utils.geometry_hash import find_geometric_duplicates
+from toolbox_utils.geometry_arrays import feature_rings
+from toolbox_utils.fc_cache import read_columns, read_geometry
+from toolbox_utils.id_index import open_id_index, find_collisions, locality_key, update_locality
+from toolbox_utils.parallel import get_workers, run_localities
 
 
 class CheckDuplicates(object):
@@ -40,8 +46,50 @@ class CheckDuplicates(object):
             multiValue='True'
         )
 
+        approximate_stats = arcpy.Parameter(
+            name='approximate_stats',
+            displayName='Approximate statistics of RUIAN_IBO and ID_SEG (bounded memory, ID field is always checked exactly)',
+            direction='Input',
+            datatype='GPBoolean',
+            parameterType='Optional',
+            enabled='True',
+        )
+
+        geometry_tolerance = arcpy.Parameter(
+            name='geometry_tolerance',
+            displayName='Tolerance in meters for near-exact geometric duplicates of PolygonZ features',
+            direction='Input',
+            datatype='GPDouble',
+            parameterType='Optional',
+            enabled='True',
+        )
+
+        id_index_path = arcpy.Parameter(
+            name='id_index_path',
+            displayName='ID index (.sqlite) of already checked localities for cross-locality duplicate check (created if missing)',
+            direction='Input',
+            datatype='DEFile',
+            parameterType='Optional',
+            enabled='True',
+        )
+
+        workers = arcpy.Parameter(
+            name='workers',
+            displayName='Number of worker processes for parallel checking of localities',
+            direction='Input',
+            datatype='GPLong',
+            parameterType='Optional',
+            enabled='True',
+        )
+
+        approximate_stats.value = False
+        geometry_tolerance.value = 0.01
+        geometry_tolerance.filter.type = "Range"
+        geometry_tolerance.filter.list = [0, 1]
+        id_index_path.filter.list = ['sqlite']
+        workers.value = os.cpu_count()
         log_file_path.value = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(arcpy.mp.ArcGISProject("CURRENT").filePath))), 'logs')
-        params = [log_file_path,root_dir_lokalita_multiple]
+        params = [log_file_path,root_dir_lokalita_multiple,approximate_stats,id_index_path,geometry_tolerance,workers]
 
         return params
 
@@ -57,6 +105,11 @@ class CheckDuplicates(object):
     def updateMessages(self, parameters):
         """Modify the messages created by internal validation for each tool
         parameter.  This method is called after internal validation."""
+        # index is reused across runs and created by the tool on first use - only its folder has to exist
+        id_index_path = parameters[3]
+        if id_index_path.valueAsText and not os.path.exists(id_index_path.valueAsText):
+            if os.path.isdir(os.path.dirname(id_index_path.valueAsText)):
+                id_index_path.clearMessage()
         return
 
     def execute(self, parameters, messages):
@@ -71,22 +124,16 @@ class CheckDuplicates(object):
             sys.exit(1)
         return
 
-def check_unique(id_list_non_uniqe: List, id_list_unique: List, id_field: str) -> str:
+def check_unique(duplicates: Dict, id_field: str) -> None:
     '''
-    Checks if given column id has duplicates, returns coresponding string. 
+    Logs out if given column id has duplicates, with multiplicity and OBJECTIDs of every duplicated value.
     '''
-    if sorted(id_list_non_uniqe) == sorted(id_list_unique):
+    if not duplicates:
         log_it(f'FEATURE CLASS IS CORRECT - NO DUPLICATES', 'info', __name__) 
     else:
         log_it('FEATURE CLASS IS INCORRECT - HAS DUPLICATES','warning', __name__)
-        log_it(f'{get_duplicates(id_list_non_uniqe, id_field)}', 'warning', __name__)
-        pass
-
-def get_duplicates(id_list_non_uniqe: List, id_field:str) -> str:
-    '''
-    Gets duplicate values returs coresponding string with list of duplicate values. 
-    '''
-    return f'DUPLICATE VALUES OF {id_field}: {list(set([x for x in id_list_non_uniqe if id_list_non_uniqe.count(x) > 1]))}' 
+        for line in format_duplicates(duplicates, id_field):
+            log_it(line, 'warning', __name__)
 
 def build_stats(curr_col: str, num_of: int) -> str:
     '''
@@ -102,27 +149,26 @@ def build_stats(curr_col: str, num_of: int) -> str:
 
 
 
-def inspect_columns(fc: str, cols: List[str], id_field: str) -> None:
+def inspect_columns(fc: str, cols: List[str], id_field: str, approximate_cols: List[str] = ()) -> None:
     '''
-    Loops thru individual features (rows) columns (cols) and checks if given featureclass (fc) contains duplicate features based on given unique field (id_field). Prints out corresponding statistics. 
+    Streams thru individual features (rows) columns (cols) and checks if given featureclass (fc) contains duplicate features based on given unique field (id_field). Prints out corresponding statistics. 
+    Distinct values of statistics-only columns listed in approximate_cols are estimated in bounded memory (HyperLogLog), id_field is always checked exactly.
     '''
     try:
         with arcpy.da.SearchCursor(fc, cols) as cursor:
-            # list of tuples with values of given columns (cols)
-            column_list = [row for row in cursor]
-                
-            for i in range(len(cols)):
-                list_of_unique = 0
-                # list of unique values of given column
-                list_of_unique = list(set([row[cols.index(cols[i])] for row in column_list]))
-                # log stats    
-                log_it(build_stats(cols[i], len(list_of_unique)),'info', __name__)
-                # check uniqness
-                if cols[i] == id_field:
-                    # create non uniqe list of values
-                    id_field_non_unique_list = [row[cols.index(id_field)] for row in column_list]
-                    check_unique(id_field_non_unique_list,list_of_unique, id_field)
-                
+            # single pass - duplicates of id_field and distinct counts of all columns are collected while rows come off the cursor
+            approximate_indexes = [cols.index(col) for col in approximate_cols if col in cols and col != id_field]
+            duplicates, distinct_counts = scan_columns(cursor, cols.index('OBJECTID'), [cols.index(id_field)],
+                                                       range(len(cols)), approximate_indexes)
+
+        for i in range(len(cols)):
+            # log stats
+            stats = build_stats(cols[i], distinct_counts[i])
+            log_it(f'{stats} (approximate)' if i in approximate_indexes else stats, 'info', __name__)
+            # check uniqness
+            if cols[i] == id_field:
+                check_unique(duplicates[0], id_field)
+
     except RuntimeError:
         missing = set(cols) - set([str(x.name) for x in arcpy.ListFields(fc)])
         log_it('!! Feature Class is missing one or more required collumns !!','warning', __name__)
@@ -130,17 +176,73 @@ def inspect_columns(fc: str, cols: List[str], id_field: str) -> None:
         log_it(f'!! Attributes checking for {fc} aborted. Please repair {fc} !!','warning', __name__)
 
 
+def inspect_geometry(fc: str, id_field: str, tolerance: float, gdb_path: str = None) -> None:
+    '''
+    Checks if given featureclass (fc) contains geometric duplicates with different id_field values - exact (1 mm grid) and near-exact (tolerance grid).
+    Geometries are compared by hash of quantized rotation invariant vertices on two grids shifted by half of cell, not pairwise. Vertices are loaded from cache when geodatabase (gdb_path) didnt change.
+    '''
+    quanta = [0.001, tolerance] if tolerance > 0.001 else [0.001]
+
+    try:
+        table = read_geometry(fc, [id_field], gdb_path, raw=True)
+        duplicate_tables = find_geometric_duplicates(zip(table[id_field], feature_rings(table)), quanta)
+
+        reported = set()
+        for label, duplicates in zip(['EXACT', f'NEAR-EXACT ({tolerance} m)'], duplicate_tables):
+            groups = [tuple(ids) for ids in duplicates.values() if tuple(ids) not in reported]
+            reported.update(groups)
+            if groups:
+                log_it(f'FEATURE CLASS HAS {label} GEOMETRIC DUPLICATES','warning', __name__)
+                log_it(f'GEOMETRIC DUPLICATES {label} {id_field}: {[i for ids in groups for i in ids]}','warning', __name__)
+                for ids in groups:
+                    log_it(f'{id_field} {ids} share the same geometry','warning', __name__)
+            else:
+                log_it(f'FEATURE CLASS HAS NO {label} GEOMETRIC DUPLICATES', 'info', __name__)
+    except RuntimeError:
+        log_it(f'!! Geometry duplicates checking for {fc} aborted. Please repair {fc} !!','warning', __name__)
+
+
+def collect_ids(fc: str, id_fields: List[str], gdb_path: str = None) -> dict:
+    '''
+    Returns {id_field: set of values} of given featureclass (fc) for cross-locality check.
+    '''
+    values = {id_field: set() for id_field in id_fields}
+    try:
+        columns = read_columns(fc, id_fields, gdb_path, raw=True)
+        for id_field in id_fields:
+            values[id_field].update(int(val) for val in columns[id_field] if val is not None)
+    except RuntimeError:
+        log_it(f'!! Cross-locality check for {fc} aborted. Please repair {fc} !!','warning', __name__)
+        return None
+
+    return values
+
+
+def check_cross_locality(values: dict, locality: str, id_index) -> None:
+    '''
+    Checks ids of locality against on-disk index of other localities (id_index) and adds them to the index afterwards.
+    '''
+    for id_field, id_values in values.items():
+        collisions = find_collisions(id_index, locality, id_field, id_values)
+        if collisions:
+            log_it(f'VALUES ALSO FOUND IN OTHER LOCALITIES {id_field}: {list(collisions.keys())}','warning', __name__)
+            for val, other_localities in collisions.items():
+                log_it(f'{id_field} {val} also in {", ".join(other_localities)}','warning', __name__)
+        else:
+            log_it(f'NO {id_field} FOUND IN OTHER LOCALITIES', 'info', __name__)
+        update_locality(id_index, locality, id_field, id_values)
+
+
 def init_logging(log_dir_path: str) -> object:
     class_name = CheckDuplicates().name.replace(' ', '_')
     setup_logging(log_dir_path,class_name, __name__)
 
 
 
-def main(log_dir_path: str, location_root_folder_paths: str) -> None:
+def check_locality(location_folder: str, approximate_cols: List[str], geometry_tolerance: float, with_ids: bool) -> dict:
     '''
-    Establishes required field names for PolygonZ and Multipatch FeatureClass. Loops thru GDBs and datasets, checks for missing columns, duplicates and prints out statistics. 
+    Checks PolygonZ and Multipatch GDBs of one locality, runs in worker process. Returns ids of PolygonZ featureclass for cross-locality check (with_ids).
     '''
-
     # columns to be checked - id columns
     cols_fc_budovy = ["OBJECTID", "RUIAN_IBO", "ID_SEG", "ID_PLO"]
     cols_fc_mtp = ["OBJECTID", "ID_SEG"]
@@ -148,32 +250,56 @@ def main(log_dir_path: str, location_root_folder_paths: str) -> None:
     # geometries to identify each gdb
     geoms = ['PolygonZ', 'Multipatch']
 
+    ids = None
+    # gets gdb paths 
+    gdbs = get_gdb_path_3D_geoms_multiple(location_folder, geoms, __name__)
+    # main loop 
+    for gdb in gdbs:
+        log_it('-' * 15 , 'info', __name__)
+        log_it(f'Checking {location_folder}', 'info', __name__)
+        arcpy.env.workspace = gdb
+        datasets = arcpy.ListDatasets()
+        for dat in datasets:
+            for fc in arcpy.ListFeatureClasses("", "", dat):
+                log_it(f"CURRENT FEATURE CLASS: {fc} \nCURRENT DATASET: {dat}",'info',__name__)
+                clear_selection(fc)
+
+                if fc.startswith(f"lokalita"):
+                    inspect_columns(fc, cols_fc_budovy, cols_fc_budovy[-1], approximate_cols)
+                    inspect_geometry(fc, cols_fc_budovy[-1], geometry_tolerance, gdb)
+                    if with_ids:
+                        ids = collect_ids(fc, cols_fc_budovy[1:], gdb)
+                elif fc.startswith("multipatch"):
+                    inspect_columns(fc, cols_fc_mtp, cols_fc_mtp[1], approximate_cols)
+                else:
+                    log_it("Given dataset doesnt contain any correctly named Feature Class",'info',__name__)
+
+    return ids
+
+
+def main(log_dir_path: str, location_root_folder_paths: str, approximate_stats: str = 'false', id_index_path: str = None, geometry_tolerance: float = 0.01, workers: int = None) -> None:
+    '''
+    Establishes required field names for PolygonZ and Multipatch FeatureClass. Loops thru GDBs and datasets, checks for missing columns, duplicates and prints out statistics. 
+    Localities are checked in parallel worker processes, cross-locality index is updated in order of input folders.
+    '''
+
+    # statistics-only columns which can be counted approximately
+    approximate_cols = ["RUIAN_IBO", "ID_SEG"] if str(approximate_stats).lower() == 'true' else []
 
     # init logging
     init_logging(log_dir_path)
 
+    # optional on-disk index of ids for cross-locality check
+    id_index = open_id_index(id_index_path) if id_index_path else None
 
     # works for multiple input location root folders
-    for location_folder in location_root_folder_paths.split(';'):
-        # gets gdb paths 
-        gdbs = get_gdb_path_3D_geoms_multiple(location_folder, geoms, __name__)
-        # main loop 
-        for gdb in gdbs:
-            log_it('-' * 15 , 'info', __name__)
-            log_it(f'Checking {location_folder}', 'info', __name__)
-            arcpy.env.workspace = gdb
-            datasets = arcpy.ListDatasets()
-            for dat in datasets:
-                for fc in arcpy.ListFeatureClasses("", "", dat):
-                    log_it(f"CURRENT FEATURE CLASS: {fc} \nCURRENT DATASET: {dat}",'info',__name__)
-                    clear_selection(fc)
-
-                    if fc.startswith(f"lokalita"):
-                        inspect_columns(fc, cols_fc_budovy, cols_fc_budovy[-1])
-                    elif fc.startswith("multipatch"):
-                        inspect_columns(fc, cols_fc_mtp, cols_fc_mtp[1])
-                    else:
-                        log_it("Given dataset doesnt contain any correctly named Feature Class",'info',__name__)
+    for location_folder, ids in run_localities(check_locality, location_root_folder_paths.split(';'), get_workers(workers),
+                                               approximate_cols, float(geometry_tolerance or 0), id_index is not None):
+        if ids is not None:
+            check_cross_locality(ids, locality_key(location_folder), id_index)
+
+    if id_index is not None:
+        id_index.close()
 
 
 
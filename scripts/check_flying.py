@@ -3,14 +3,25 @@ from toolbox_utils.gdb_getter import get_gdb_path_3D_geoms, get_gdb_path_3D_geom
 from toolbox_utils.config_handler import get_config_data
 # log_it printuje jak do arcgis console tak do souboru
 from toolbox_utils.messages_print import aprint, log_it, setup_logging
+from toolbox_utils.parallel import get_workers, run_localities
+from toolbox_utils.columnar import cursor_to_columns
+from toolbox_utils.raster import TILE_CACHE, close_rasters
+from toolbox_utils.side_table import assign_coded_domain, make_join_view, merge_side_table, write_side_table
+from toolbox_utils.topology import feature_hashes, mix64
+from toolbox_utils.dmr_statistics import base_table, compute_vertex_statistics, compute_zonal_statistics, segment_gaps
 import os
 import sys
+import hashlib
 import arcpy
 import logging
 import json
+import numpy as np
 from typing import (List, Union)
 numeric = Union[int, float]
 
+# zonal - statistics of all DMR cells under base polygon, vertex - DMR interpolated at vertices of base polygon
+SAMPLING_MODES = ('zonal', 'vertex')
+
 
 class CheckFlyingBuildings(object):
     '''
@@ -65,6 +76,48 @@ class CheckFlyingBuildings(object):
             multiValue='False'
         )
 
+        workers = arcpy.Parameter(
+            name='workers',
+            displayName='Number of worker processes for parallel checking of localities',
+            direction='Input',
+            datatype='GPLong',
+            parameterType='Optional',
+            enabled='True',
+        )
+
+        use_dmr_pyramid = arcpy.Parameter(
+            name='use_dmr_pyramid',
+            displayName='Use min/max pyramid of DMR (built next to DMR on first run and whenever DMR changes)',
+            direction='Input',
+            datatype='GPBoolean',
+            parameterType='Optional',
+            enabled='True',
+        )
+
+        dmr_sampling = arcpy.Parameter(
+            name='dmr_sampling',
+            displayName='DMR sampling - zonal (all cells under base) or vertex (bilinear interpolation at vertices of base, much faster)',
+            direction='Input',
+            datatype='GPString',
+            parameterType='Optional',
+            enabled='True',
+        )
+
+        workers.value = os.cpu_count()
+        use_dmr_pyramid.value = True
+        create_join_view = arcpy.Parameter(
+            name='create_join_view',
+            displayName='Save layer of PolygonZ featureclass joined with table of results (.lyrx next to output workspace)',
+            direction='Input',
+            datatype='GPBoolean',
+            parameterType='Optional',
+            enabled='True',
+        )
+
+        dmr_sampling.filter.type = 'ValueList'
+        dmr_sampling.filter.list = list(SAMPLING_MODES)
+        dmr_sampling.value = SAMPLING_MODES[0]
+        create_join_view.value = False
         log_file_path.value = os.path.join(os.path.dirname(os.path.dirname(
             os.path.dirname(arcpy.mp.ArcGISProject("CURRENT").filePath))), 'logs')
 
@@ -77,18 +130,13 @@ class CheckFlyingBuildings(object):
         output_PolyZ_workspace.filter.list = ["Local Database"]
 
         params = [log_file_path, input_ground_DMR,
-                  root_dir_lokalita_multiple, output_PolyZ_workspace]
+                  root_dir_lokalita_multiple, output_PolyZ_workspace, workers, use_dmr_pyramid, dmr_sampling, create_join_view]
 
         return params
 
     def isLicensed(self):
-        try:
-            if arcpy.CheckExtension("Spatial") != "Available":
-                raise Exception
-        except Exception:
-            return False  # The tool cannot be run
-
-        return True  # The tool can be run
+        # zonal statistics are computed in-process, Spatial Analyst is not needed
+        return True
 
     def updateParameters(self, parameters):
         """Modify the values and properties of parameters before internal
@@ -153,83 +201,221 @@ def tableExists(table_name: str) -> bool:
     return table_name in [table for table in arcpy.ListTables(table_name)]
 
 
-def check_flying_buildings(input_fc: str, ground_dmr: str, workspace: str = None) -> None:
-    ''' Updates values for DTM_diff  a DTM_diff_val. Checks if feature is under or over specified terrain.'''
+# categorical codes of DTM_diff_*_info stored in side table - code is sign of difference + 1 (pod, odpovida, nad), -1 without zonal statistics
+# descriptions are attached to the fields as coded value domains of the same name
+DTM_DIFF_MIN_INFO = ('PATA_SEG_VYSKA je pod DTM', 'PATA_SEG_VYSKA odpovida DTM', 'PATA_SEG_VYSKA je nad DTM')
+DTM_DIFF_MAX_INFO = ('Segment je pod terénem', 'Segment sedí na terénu alespoň jedním bodem', 'Celý segment je nad terénem')
+DTM_DIFF_UNKNOWN_INFO = 'Chybí zonální statistika'
+
+
+def sign_codes(values: np.ndarray) -> np.ndarray:
+    '''
+    Categorical code of every value - 0 negative, 1 zero, 2 positive, -1 NULL.
+    '''
+    return np.where(np.isnan(values), -1, np.sign(np.nan_to_num(values)) + 1).astype(np.int8)
+
+
+def compute_dtm_diff(columns: dict) -> dict:
+    '''
+    Computes DTM_diff_* columns from PATA_SEG_VYSKA, MIN, MAX arrays at once - DTM_diff_max and flatness only where base is not below terrain (nan otherwise).
+    Returns result columns and mask of bases whose all points are 0.5 m or more above DMR (bad).
+    '''
+    dtm_diff_min = columns['PATA_SEG_VYSKA'] - columns['MIN']
+    dtm_diff_max = columns['PATA_SEG_VYSKA'] - columns['MAX']
+    with np.errstate(invalid='ignore'):
+        above = dtm_diff_max >= 0
+        bad = dtm_diff_max >= 0.5
+
+    return {
+        'DTM_diff_min': dtm_diff_min,
+        'DTM_diff_min_info': sign_codes(dtm_diff_min),
+        'DTM_diff_max': np.where(above, dtm_diff_max, np.nan),
+        'DTM_diff_max_info': sign_codes(dtm_diff_max),
+        'DTM_diff_min_max_flatness': np.where(above, columns['MAX'] - columns['MIN'], np.nan),
+    }, bad
+
+
+def category_domain(categories: tuple) -> dict:
+    '''
+    Coded values {code: description} of categorical column - code -1 (NULL) included.
+    '''
+    return {-1: DTM_DIFF_UNKNOWN_INFO, **dict(enumerate(categories))}
+
+
+def check_flying_buildings(input_fc: str, ground_dmr: str, workspace: str = None, zonal_table: str = None) -> dict:
+    ''' Computes DTM_diff  a DTM_diff_val. Checks if feature is under or over specified terrain.
+    Values are computed as numpy columns of all bases at once from MIN, MAX of zonal table, input_fc is not modified.
+    Returns columns of side table keyed by ID_PLO {ID_PLO, ID_SEG, MIN, MAX, DTM_diff_*} (None when zonal table is missing).'''
     log_it(f'-'*15, 'info', __name__)
-    log_it(f'Updating featureclasses with height attributes.', 'info', __name__)
+    log_it(f'Computing height attributes of {input_fc}.', 'info', __name__)
 
-    cols = ['PATA_SEG_VYSKA', 'MIN', 'MAX', 'DTM_diff_min_max_flatness',
-            'DTM_diff_max_info', 'ID_SEG', 'DTM_diff_min_info', 'DTM_diff_min', 'DTM_diff_max']
+    zonal_table = zonal_table or f'{input_fc}_zonal_stat_base'
+    if not arcpy.Exists(zonal_table):
+        log_it(f'{input_fc} has no zonal table {zonal_table}. Operation for {input_fc} skipped.', 'warning', __name__)
+        return None
 
-    bad_seg_ids = []
+    cols = ['ID_PLO', 'ID_SEG', 'PATA_SEG_VYSKA']
+    with arcpy.da.SearchCursor(input_fc, cols, where_clause='PLOCHA_KOD = 4') as cursor:
+        columns = cursor_to_columns(cursor, cols)
+    with arcpy.da.SearchCursor(zonal_table, ['ID_PLO', 'MIN', 'MAX']) as cursor:
+        zonal = cursor_to_columns(cursor, ['ID_PLO', 'MIN', 'MAX'])
 
-    with arcpy.da.UpdateCursor(input_fc, cols, where_clause='PLOCHA_KOD = 4') as cur:
-        for row in cur:
-            dtm_diff_min = row[0] - row[1]
-            dtm_diff_max = row[0] - row[2]
-            row[-2] = dtm_diff_min
-
-            if dtm_diff_min > 0:
-                row[-3] = 'PATA_SEG_VYSKA je nad DTM'
-            elif dtm_diff_min < 0:
-                row[-3] = 'PATA_SEG_VYSKA je pod DTM'
-            else:
-                row[-3] = 'PATA_SEG_VYSKA odpovida DTM'
-
-            if dtm_diff_max >= 0:
-                # log_it(f'{dtm_diff_max}', 'info', __name__)
-                row[-1] = dtm_diff_max
-                row[3] = row[2] - row[1]
-                if dtm_diff_max >= 0.5:
-                    bad_seg_ids.append(int(row[5]))
-
-            if dtm_diff_max > 0:
-                row[4] = 'Celý segment je nad terénem'
-            elif dtm_diff_max == 0:
-                row[4] = 'Segment sedí na terénu alespoň jedním bodem'
-            else:
-                # momentálně není možné
-                row[4] == 'Segment je pod terénem'
+    # MIN, MAX of every base looked up in zonal table by ID_PLO
+    keys = np.r_[zonal['ID_PLO'], np.nan]
+    order = np.argsort(keys)
+    position = order[np.searchsorted(keys, columns['ID_PLO'], sorter=order).clip(max=len(keys) - 1)]
+    found = keys[position] == columns['ID_PLO']
+    for name in ('MIN', 'MAX'):
+        columns[name] = np.where(found, np.r_[zonal[name], np.nan][position], np.nan)
+
+    result, bad = compute_dtm_diff(columns)
 
-            cur.updateRow(row)
+    bad_seg_ids = columns['ID_SEG'][bad].astype(np.int64).tolist()
 
     log_it(f'Checking {input_fc}...', 'info', __name__)
     log_it(
         f'Všechny body podstavy segmentu jsou výše nežli 0.5 m nad DMT ID_SEG: {bad_seg_ids}', 'warning', __name__)
 
+    return {'ID_PLO': columns['ID_PLO'], 'ID_SEG': columns['ID_SEG'], 'MIN': columns['MIN'], 'MAX': columns['MAX'], **result}
+
+
+def write_dtm_diff_table(fc: str, workspace: str, columns: dict, join_view: bool = False) -> None:
+    '''
+    Writes height attributes of fc in one bulk insert into side table {fc}_dtm_diff in workspace, DTM_diff_*_info as codes with coded value domains.
+    With join_view layer of fc joined with the side table is saved next to workspace.
+    '''
+    out_table = os.path.join(workspace, f'{fc}_dtm_diff')
+    write_side_table(out_table, columns)
+    assign_coded_domain(out_table, 'DTM_diff_min_info', 'DTM_diff_min_info', category_domain(DTM_DIFF_MIN_INFO))
+    assign_coded_domain(out_table, 'DTM_diff_max_info', 'DTM_diff_max_info', category_domain(DTM_DIFF_MAX_INFO))
+    log_it(f'Height attributes of {fc} written into {out_table}', 'info', __name__)
+    if join_view:
+        make_join_view(os.path.join(workspace, fc), 'ID_PLO', out_table, os.path.dirname(workspace))
+
+
+def dmr_identity(ground_dmr) -> str:
+    '''
+    Identity of DMR - path with size and modification time of raster file, path of layer otherwise.
+    '''
+    path = str(ground_dmr)
+    if os.path.isfile(path):
+        stat = os.stat(path)
+        return f'{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}'
+    return path
+
+
+def content_hashes(table: dict, key_field: str, ground_dmr, sampling: str = 'zonal') -> dict:
+    '''
+    Content hash of every key_field value - geometry and PATA_SEG_VYSKA of all its features together with identity of DMR and sampling mode.
+    Returns columns {key_field, CONTENT_HASH} (hash as 16 hex digits).
+    '''
+    has_key = ~np.isnan(table[key_field])
+    heights = np.ascontiguousarray(np.nan_to_num(table['PATA_SEG_VYSKA'], nan=-1e9)).view(np.uint64)
+    salt = int(hashlib.sha1(f'{dmr_identity(ground_dmr)}|{sampling}'.encode('utf-8')).hexdigest()[:16], 16)
+    hashes = mix64(feature_hashes(table) ^ mix64(heights ^ np.uint64(salt)))
 
-def check_tables_and_fields(fc: str, zonal_stats_table_name: str, key_field: str, workspace: str, ground_dmr) -> None:
-    '''Checks if in specified workspace exists a table or fields in existing fc if not creates them.'''
+    keys, inverse = np.unique(table[key_field][has_key], return_inverse=True)
+    key_hashes = np.zeros(len(keys), dtype=np.uint64)
+    np.bitwise_xor.at(key_hashes, inverse.reshape(-1), hashes[has_key])
+    return {key_field: keys, 'CONTENT_HASH': np.array([f'{h:016x}' for h in key_hashes.tolist()], dtype='<U16')}
+
+
+def changed_keys(hash_table: str, key_field: str, hashes: dict) -> tuple:
+    '''
+    Compares current content hashes with hashes stored by previous run.
+    Returns (keys added or changed since previous run, keys removed since previous run), all keys are changed when there are no stored hashes.
+    '''
+    if not arcpy.Exists(hash_table):
+        return hashes[key_field], np.empty(0)
+
+    with arcpy.da.SearchCursor(hash_table, [key_field, 'CONTENT_HASH']) as cursor:
+        stored = {float(key): content_hash for key, content_hash in cursor}
+    current = set(hashes[key_field].tolist())
+
+    changed = np.array([stored.get(key) != content_hash for key, content_hash in zip(hashes[key_field].tolist(), hashes['CONTENT_HASH'].tolist())], dtype=bool)
+    removed = np.array([key for key in stored if key not in current], dtype=float)
+    return hashes[key_field][changed], removed
+
+
+def replace_features(fc: str, source_fc: str, key_field: str, keys: np.ndarray, source_gdb: str) -> None:
+    '''
+    Replaces features of given keys in copy fc by current features of source_fc - features of removed keys are deleted, fields added by analysis stay NULL.
+    '''
+    selected = set(np.asarray(keys, dtype=np.int64).tolist())
+    with arcpy.da.UpdateCursor(fc, [key_field]) as cur:
+        for row in cur:
+            if row[0] is not None and int(row[0]) in selected:
+                cur.deleteRow()
+
+    workspace = arcpy.env.workspace
+    arcpy.env.workspace = source_gdb
+    fields = [field.name for field in arcpy.ListFields(source_fc) if field.editable and field.type not in ('OID', 'Geometry')]
+    key_index = fields.index(key_field) + 1
+    with arcpy.da.SearchCursor(source_fc, ['SHAPE@'] + fields) as search, \
+            arcpy.da.InsertCursor(os.path.join(workspace, fc), ['SHAPE@'] + fields) as insert:
+        for row in search:
+            if row[key_index] is not None and int(row[key_index]) in selected:
+                insert.insertRow(row)
     arcpy.env.workspace = workspace
+
+
+def check_tables_and_fields(fc: str, zonal_stats_table_name: str, key_field: str, workspace: str, ground_dmr,
+                            source_fc: str = None, source_gdb: str = None, use_pyramid: bool = False, sampling: str = 'zonal') -> None:
+    '''Checks if in specified workspace exists zonal table of fc if not creates it.
+    Geometry for zonal statistics is read from source_fc in source_gdb (cached) when given.
+    With vertex sampling the table holds DMR at vertices of bases, gaps of vertices and segments are written into tables {table}_vertices, {table}_segments.
+    Content hashes of features per key_field are kept in table {table}_content_hash - when the table already exists only keys added or changed
+    since previous run are recomputed and merged into it (and replaced in fc copied from source_fc). Fields of fc are never added or changed.'''
     out_table = os.path.join(workspace, zonal_stats_table_name)
+    hash_table = f'{out_table}_content_hash'
+
+    if source_fc:
+        arcpy.env.workspace = source_gdb
+    table = base_table(source_fc or fc, key_field, source_gdb)
+    hashes = content_hashes(table, key_field, ground_dmr, sampling)
 
+    arcpy.env.workspace = workspace
     if not tableExists(zonal_stats_table_name):
         log_it('Creating new zonal table...', 'info', __name__)
-        building_bases = arcpy.management.SelectLayerByAttribute(
-            fc, "NEW_SELECTION", "PLOCHA_KOD = 4")
-        out_table = os.path.join(workspace, zonal_stats_table_name)
-        arcpy.sa.ZonalStatisticsAsTable(
-            building_bases, key_field, ground_dmr, out_table, statistics_type='MIN_MAX_MEAN')
-    else:
-        log_it(
-            f'Zonal Statistics for given {fc} in {workspace} were already calculated if you wish to recalculate them choose another output workspace', 'info', __name__)
-
-    if not fieldExists(fc, 'MIN') and not fieldExists(fc, 'MAX'):
-        arcpy.management.JoinField(fc, key_field, out_table, key_field, 'MIN')
-        arcpy.management.JoinField(fc, key_field, out_table, key_field, 'MAX')
-        arcpy.management.AddField(fc, 'DTM_diff_min', 'DOUBLE')
-        arcpy.management.AddField(fc, 'DTM_diff_min_info', 'TEXT')
-        arcpy.management.AddField(fc, 'DTM_diff_max', 'DOUBLE')
-        arcpy.management.AddField(fc, 'DTM_diff_max_info', 'TEXT')
-        arcpy.management.AddField(fc, 'DTM_diff_min_max_flatness', 'DOUBLE')
-
-        log_it(f'Required fields were created in {fc}', 'info', __name__)
+        only_keys, replaced = None, None
     else:
-        log_it(
-            f'Field MIN and MAX already exists in {fc}. Fields MIN, MAX wont be joined from ZonalTable', 'info', __name__)
+        changed, removed = changed_keys(hash_table, key_field, hashes)
+        replaced = np.concatenate((changed, removed))
+        only_keys = changed
+        log_it(f'Zonal Statistics for given {fc} in {workspace} already exist - {len(changed)} added or changed and {len(removed)} removed '
+               f'{key_field} since previous run will be recomputed', 'info', __name__)
+
+    if replaced is None or len(replaced):
+        if source_fc:
+            arcpy.env.workspace = source_gdb
+        if sampling == 'vertex':
+            base_stats, vertices, segments = compute_vertex_statistics(source_fc or fc, key_field, ground_dmr, source_gdb, only_keys, table)
+            if replaced is None:
+                write_side_table(out_table, base_stats)
+                write_side_table(f'{out_table}_vertices', vertices)
+            else:
+                merge_side_table(out_table, key_field, replaced, base_stats)
+                merge_side_table(f'{out_table}_vertices', key_field, replaced, vertices)
+                with arcpy.da.SearchCursor(f'{out_table}_vertices', ['ID_SEG', 'GAP']) as cursor:
+                    columns = cursor_to_columns(cursor, ['ID_SEG', 'GAP'])
+                segments = segment_gaps(columns['ID_SEG'], columns['GAP'])
+            write_side_table(f'{out_table}_segments', segments)
+            log_it(f'Segments with all vertices of base 0.5 m or more above DMR ID_SEG: '
+                   f'{segments["ID_SEG"][segments["MIN_GAP"] >= 0.5].astype(np.int64).tolist()}', 'info', __name__)
+        else:
+            zonal = compute_zonal_statistics(source_fc or fc, key_field, ground_dmr, source_gdb, use_pyramid, only_keys, table)
+            if replaced is None:
+                write_side_table(out_table, zonal)
+            else:
+                merge_side_table(out_table, key_field, replaced, zonal)
+        arcpy.env.workspace = workspace
+
+        if replaced is not None and source_fc:
+            replace_features(fc, source_fc, key_field, replaced, source_gdb)
+    write_side_table(hash_table, hashes)
 
 
-def aggregate_into_new_workspace(location_root_folder_paths, path_to_copy_analysis_workspace, ground_dmr):
+def aggregate_into_new_workspace(location_root_folder_paths, path_to_copy_analysis_workspace, ground_dmr, use_pyramid=False, sampling='zonal'):
     ''' In output workspace creates copy of input PolygonZ geometry if it doesn not exist already. '''
     geoms = ['PolygonZ', 'Multipatch']
     # parse out multiple parameters (multiple folder paths)
@@ -243,7 +429,7 @@ def aggregate_into_new_workspace(location_root_folder_paths, path_to_copy_analys
         output_fc_name = f'{cur_fc}_polygonZ_geom_analysis'
 
         key_field = 'ID_PLO'
-        zonal_stats_table_name = f'{output_fc_name}_zonal_stat_base'
+        zonal_stats_table_name = f'{output_fc_name}_{"vertex" if sampling == "vertex" else "zonal"}_stat_base'
 
         if get_fc_from_gdb_direct(path_to_copy_analysis_workspace, output_fc_name) == None:
             arcpy.env.workspace = polygonZgdb
@@ -256,34 +442,49 @@ def aggregate_into_new_workspace(location_root_folder_paths, path_to_copy_analys
             log_it(f'{output_fc_name} already exists in chosen workspace:\n{path_to_copy_analysis_workspace}\n{output_fc_name} will be updated.', 'warning', __name__)
 
         check_tables_and_fields(output_fc_name, zonal_stats_table_name,
-                                key_field, path_to_copy_analysis_workspace, ground_dmr)
+                                key_field, path_to_copy_analysis_workspace, ground_dmr, cur_fc, polygonZgdb, use_pyramid, sampling)
 
 
-def main(log_dir_path: str, input_ground_DMR: str, location_root_folder_paths: str, path_to_copy_analysis_workspace: str, *args) -> None:
+def check_fc(fc: str, workspace: str, input_ground_DMR: str, sampling: str = 'zonal') -> dict:
     '''
-    Main runtime.
+    Checks one featureclass of output workspace, runs in worker process - returns columns of its side table.
     '''
+    arcpy.env.workspace = workspace
+    dirname = os.path.dirname(arcpy.Describe(fc).catalogPath)
+    clear_selection(fc)
+    zonal_table = os.path.join(dirname, f'{fc}_{"vertex" if sampling == "vertex" else "zonal"}_stat_base')
+    return check_flying_buildings(fc, input_ground_DMR, dirname, zonal_table)
 
-    arcpy.CheckOutExtension("Spatial")
+
+def main(log_dir_path: str, input_ground_DMR: str, location_root_folder_paths: str, path_to_copy_analysis_workspace: str, workers: int = None,
+         use_dmr_pyramid: str = 'true', dmr_sampling: str = 'zonal', create_join_view: str = 'false', *args) -> None:
+    '''
+    Main runtime.
+    '''
 
     # setup file logging
     init_logging(log_dir_path)
 
     log_it(location_root_folder_paths, 'info', __name__)
 
-    # copy PolygonZ fcs to specified output workspace
-    aggregate_into_new_workspace(
-        location_root_folder_paths, path_to_copy_analysis_workspace, input_ground_DMR)
-
-#   # change workspace to output workspace
-    arcpy.env.workspace = path_to_copy_analysis_workspace
-    # log_it(path_to_copy_analysis_workspace,)
-    for fc in arcpy.ListFeatureClasses():
-        # log_it(fc)
-        dirname = os.path.dirname(arcpy.Describe(fc).catalogPath)
-        clear_selection(fc)
-        check_flying_buildings(fc, input_ground_DMR, dirname)
-        pass
+    try:
+        # copy PolygonZ fcs to specified output workspace
+        # stays sequential - creating featureclasses and tables in one file gdb takes exclusive schema locks
+        aggregate_into_new_workspace(
+            location_root_folder_paths, path_to_copy_analysis_workspace, input_ground_DMR, str(use_dmr_pyramid).lower() == 'true',
+            dmr_sampling or 'zonal')
+        log_it(f'DMR tile cache: {TILE_CACHE.stats()}', 'info', __name__)
+
+#       # change workspace to output workspace
+        arcpy.env.workspace = path_to_copy_analysis_workspace
+        # every featureclass is computed by its own worker, side tables are written here - creating tables in one file gdb takes exclusive schema locks
+        for fc, columns in run_localities(check_fc, arcpy.ListFeatureClasses(), get_workers(workers),
+                                          path_to_copy_analysis_workspace, input_ground_DMR, dmr_sampling or 'zonal'):
+            if columns is not None:
+                write_dtm_diff_table(fc, path_to_copy_analysis_workspace, columns, str(create_join_view).lower() == 'true')
+    finally:
+        # DMR file must not stay mapped (locked) in ArcGIS Pro process after the tool finishes
+        close_rasters()
 
 ###################################################
 ############# Run the tool from IDE ###############
@@ -2,14 +2,26 @@ from toolbox_utils.clear_selection import clear_selection
 from toolbox_utils.gdb_getter import get_gdb_path_3D_geoms, get_gdb_path_3D_geoms_multiple
 # log_it printuje jak do arcgis console tak do souboru
 from toolbox_utils.messages_print import aprint, log_it, setup_logging
+from toolbox_utils.parallel import get_workers, run_localities
+from toolbox_utils.geometry_arrays import feature_vertex_offsets, part_vertex_offsets, segment_index, segment_reduce
+from toolbox_utils.geometry_metrics import fit_planes, newell_normals, slope_and_azimuth, unit_vectors
+from toolbox_utils.attribute_rules import group_order
+from toolbox_utils.side_table import write_side_table
+from toolbox_utils.topology import count_edge_usage, edge_keys
+from toolbox_utils.spatial_index import GridIndex
+from toolbox_utils.fc_cache import read_geometry
 import os
 import sys
 import json
 import arcpy
 import logging
-from typing import (List, Union)
+import numpy as np
+from typing import (List, Tuple, Union)
 numeric = Union[int, float]
 
+# STRECHA_KOD of flat roofs - roof faces of segments with other roof types cant be all flat
+FLAT_ROOF_TYPES = (1,)
+
 
 class CheckGeometry(object):
     '''
@@ -54,13 +66,94 @@ class CheckGeometry(object):
             enabled='True',
         )
 
+        planarity_tolerance = arcpy.Parameter(
+            name='planarity_tolerance',
+            displayName='Specify tolerance in meters for maximal distance of vertex from plane of polygon',
+            direction='Input',
+            datatype='GPDouble',
+            parameterType='Optional',
+            enabled='True',
+        )
+
+        wall_tilt_tolerance = arcpy.Parameter(
+            name='wall_tilt_tolerance',
+            displayName='Specify tolerance in degrees for tilt of walls from vertical',
+            direction='Input',
+            datatype='GPDouble',
+            parameterType='Optional',
+            enabled='True',
+        )
+
+        flat_roof_slope = arcpy.Parameter(
+            name='flat_roof_slope',
+            displayName='Specify maximal slope in degrees of roof face considered flat',
+            direction='Input',
+            datatype='GPDouble',
+            parameterType='Optional',
+            enabled='True',
+        )
+
+        orientation_workspace = arcpy.Parameter(
+            name='orientation_workspace',
+            displayName='Output workspace for tables of per-feature orientation (slope, azimuth, area, planarity)',
+            direction='Input',
+            datatype='DEWorkspace',
+            parameterType='Optional',
+            enabled='True',
+        )
+
+        topology_tolerance = arcpy.Parameter(
+            name='topology_tolerance',
+            displayName='Specify tolerance in meters for merging vertices of shared edges of walls, roofs and base',
+            direction='Input',
+            datatype='GPDouble',
+            parameterType='Optional',
+            enabled='True',
+        )
+
+        overlap_tolerance = arcpy.Parameter(
+            name='overlap_tolerance',
+            displayName='Specify tolerance in square meters for overlap area of base polygons of different segments',
+            direction='Input',
+            datatype='GPDouble',
+            parameterType='Optional',
+            enabled='True',
+        )
+
+        workers = arcpy.Parameter(
+            name='workers',
+            displayName='Number of worker processes for parallel checking of localities',
+            direction='Input',
+            datatype='GPLong',
+            parameterType='Optional',
+            enabled='True',
+        )
+
+        workers.value = os.cpu_count()
+        planarity_tolerance.value = 0.05
+        planarity_tolerance.filter.type = "Range"
+        planarity_tolerance.filter.list = [0, 500]
+        wall_tilt_tolerance.value = 2
+        wall_tilt_tolerance.filter.type = "Range"
+        wall_tilt_tolerance.filter.list = [0, 90]
+        flat_roof_slope.value = 5
+        flat_roof_slope.filter.type = "Range"
+        flat_roof_slope.filter.list = [0, 90]
+        topology_tolerance.value = 0.01
+        topology_tolerance.filter.type = "Range"
+        topology_tolerance.filter.list = [0.0001, 10]
+        overlap_tolerance.value = 0.1
+        overlap_tolerance.filter.type = "Range"
+        overlap_tolerance.filter.list = [0, 10000]
         tolerance.value = 0
         tolerance.filter.type = "Range"
         tolerance.filter.list = [0, 500]
         log_file_path.value = os.path.join(os.path.dirname(os.path.dirname(
             os.path.dirname(arcpy.mp.ArcGISProject("CURRENT").filePath))), 'logs')
 
-        params = [log_file_path, root_dir_lokalita_multiple, tolerance]
+        params = [log_file_path, root_dir_lokalita_multiple, tolerance, workers, planarity_tolerance,
+                  wall_tilt_tolerance, flat_roof_slope, orientation_workspace, topology_tolerance,
+                  overlap_tolerance]
 
         return params
 
@@ -129,103 +222,249 @@ def get_fc_from_gdb_direct(gdb_path: str, fc_name=None) -> str:
         return fc
 
 
-def no_geometry(fc_geometry_object: object, plocha_id: int) -> int:
+def read_fc(input_fc: str, gdb_path: str = None) -> dict:
     '''
-    Returns list of ID_PLO where feature has no geometry.
+    Single pass over input featureclass - collects attributes (numpy arrays) and flat vertex arrays (wkb_to_arrays) needed by all geometry checks.
+    Arrays are loaded from cache when geodatabase (gdb_path) didnt change since last reading.
     '''
-    if fc_geometry_object == None:
-        return plocha_id
+    cols = ["PLOCHA_KOD", "ID_PLO", "ID_SEG", "RUIAN_IBO", "STRECHA_KOD"]
+    table = dict(read_geometry(input_fc, cols, gdb_path))
+    table['no_geometry'] = np.diff(table['feature_offsets']) == 0
 
+    return table
 
-# TODO - muzem po nich chtit planaritu?
-# def check_if_planar()
-#     return
 
+def feature_to_polygon(table: dict, feature: int) -> object:
+    '''
+    Builds 2D arcpy polygon of given feature from flat vertex arrays.
+    '''
+    coords, ring_offsets, part_offsets = table['coords'], table['ring_offsets'], table['part_offsets']
+    feature_offsets = table['feature_offsets']
+    first_ring = part_offsets[feature_offsets[feature]]
+    last_ring = part_offsets[feature_offsets[feature + 1]]
 
-def check_id_plo_attr_against_geometry(fc_geometry_object: object, plocha_kod: str, plocha_id: int, tolerance: int, plocha_kod_spec: int = None) -> int:
-    if plocha_kod == plocha_kod_spec:
-        for part in fc_geometry_object:
-            z_vals = [pnt.Z for pnt in part if pnt]
-            if plocha_kod_spec == 3 or plocha_kod_spec == 1:
-                if len(set(z_vals)) == 1:
-                    return plocha_id
-            elif plocha_kod_spec == 2 or plocha_kod_spec == 4:
-                if len(set(z_vals)) != 1 and (max(z_vals) - min(z_vals)) > tolerance:
-                    return plocha_id
-            else:
-                log_it('Input parameters were specified incorrectly',
-                       'warning', __name__)
+    rings = arcpy.Array()
+    for ring in range(first_ring, last_ring):
+        rings.add(arcpy.Array([arcpy.Point(x, y) for x, y in coords[ring_offsets[ring]:ring_offsets[ring + 1], :2].tolist()]))
+    return arcpy.Polygon(rings)
 
 
-def check_parts_in(input_fc: str, level=None) -> List:
+def check_id_plo_attr_against_geometry(table: dict, tolerance: float) -> dict:
+    '''
+    Returns {PLOCHA_KOD: mask of features} where Z values of any part dont match PLOCHA_KOD - walls and sloped roofs cant be flat, flat roofs and bases cant be sloped more than tolerance.
+    Z ranges of all parts are computed at once with segmented reductions.
     '''
-    Function takes feature and loops over coresponding level of abstraction (building, segment, plocha) and checks for given conditions 
+    z = table['coords'][:, 2]
+    part_offsets = part_vertex_offsets(table)
+    z_min = segment_reduce(np.minimum, z, part_offsets)
+    z_max = segment_reduce(np.maximum, z, part_offsets)
+
+    part_feature = segment_index(table['feature_offsets'])
+    part_kod = table['PLOCHA_KOD'][part_feature]
+    has_vertices = ~np.isnan(z_min)
+    flat = z_min == z_max
+    sloped = has_vertices & ~flat & ((z_max - z_min) > tolerance)
+
+    invalid = {}
+    for plocha_kod in (1, 2, 3, 4):
+        wrong_parts = (part_kod == plocha_kod) & (flat if plocha_kod in (1, 3) else sloped)
+        mask = np.zeros(len(table['PLOCHA_KOD']), dtype=bool)
+        mask[part_feature[wrong_parts]] = True
+        invalid[plocha_kod] = mask
+
+    return invalid
+
+
+def check_if_planar(table: dict, tolerance: float) -> tuple:
+    '''
+    Fits least squares plane to every polygon (all polygons at once) - returns (mask of features with vertex further from the plane than tolerance, maximal deviation of every feature).
+    '''
+    _, _, max_deviation = fit_planes(table)
+    return max_deviation > tolerance, max_deviation
+
+
+def compute_orientation(table: dict) -> dict:
+    '''
+    Computes Newell normals of all features at once - returns per-feature columns {SKLON: slope in degrees, AZIMUT: azimuth in degrees, PLOCHA_3D: area}.
+    '''
+    area_vectors = newell_normals(table)
+    slope, azimuth = slope_and_azimuth(unit_vectors(area_vectors))
+    return {'SKLON': slope, 'AZIMUT': azimuth, 'PLOCHA_3D': np.linalg.norm(area_vectors, axis=1) / 2}
+
+
+def check_walls_vertical(table: dict, orientation: dict, tolerance: float) -> np.ndarray:
+    '''
+    Mask of walls (PLOCHA_KOD = 1) tilted from vertical by more than tolerance (degrees).
+    '''
+    with np.errstate(invalid='ignore'):
+        return (table['PLOCHA_KOD'] == 1) & (np.abs(90 - orientation['SKLON']) > tolerance)
+
+
+def check_roof_slope_against_type(table: dict, orientation: dict, flat_slope: float) -> List:
+    '''
+    Returns ID_SEG of segments whose roof faces (PLOCHA_KOD 2, 3) dont match STRECHA_KOD - flat roof with sloped face or other roof type with all faces flat (slope <= flat_slope degrees).
+    Ids are returned in order of first occurrence.
+    '''
+    plocha_kod = table['PLOCHA_KOD']
+    if len(plocha_kod) == 0:
+        return []
+
+    roof_slope = np.where((plocha_kod == 2) | (plocha_kod == 3), orientation['SKLON'], np.nan)
+    order, starts = group_order(table['ID_SEG'])
+    with np.errstate(invalid='ignore'):
+        max_slope = np.fmax.reduceat(roof_slope[order], starts)
+    first_rows = order[starts]
+    strecha_kod = table['STRECHA_KOD'][first_rows]
+
+    flat_type = np.isin(strecha_kod, FLAT_ROOF_TYPES)
+    with np.errstate(invalid='ignore'):
+        bad = ~np.isnan(max_slope) & ~np.isnan(strecha_kod) & np.where(flat_type, max_slope > flat_slope, max_slope <= flat_slope)
+
+    bad_rows = np.sort(first_rows[bad])
+    return table['ID_SEG'][bad_rows].astype(np.int64).tolist()
+
+
+def check_parts_in(table: dict, level=None) -> List:
+    '''
+    Function takes features and checks coresponding level of abstraction (building, segment) for given conditions 
     ID_SEG: Checks if segment has only one base polygon PLOCHA_KOD = 4 it returns ID_SEG of segments which have more than one or missing base polygon
     RUIAN_IBO: Checks if building has at least one roof face it returns RUIAN_IBO of buildings that dont have any roof polygon
+    Ids are returned in order of first occurrence.
     '''
-    parent_object = {}
-    with arcpy.da.SearchCursor(input_fc, [level, 'PLOCHA_KOD']) as cur:
-        for row in cur:
-            # create hashtable with SEG_ID/RUIAN_IBO: [*PLOCHA_KOD]
-            parent_object.setdefault(int(row[0]), []).append(int(row[1]))
-
-    ids = []
+    parent_ids, first_index, inverse = np.unique(table[level], return_index=True, return_inverse=True)
+    plocha_kod = table['PLOCHA_KOD']
 
     if level == 'ID_SEG':
-        # create list of lists segment ids that has multiple or missing base polygons
-        ids = [k for k, v in parent_object.items() if v.count(4) != 1]
+        # segment ids that has multiple or missing base polygons
+        bad = np.bincount(inverse, weights=plocha_kod == 4, minlength=len(parent_ids)) != 1
     elif level == 'RUIAN_IBO':
-        for k, v in parent_object.items():
-            if v.count(2) + v.count(3) == 0:
-                ids.append(k)
+        bad = np.bincount(inverse, weights=(plocha_kod == 2) | (plocha_kod == 3), minlength=len(parent_ids)) == 0
+    else:
+        return []
 
-    return ids
+    order = np.argsort(first_index[bad], kind='stable')
+    return parent_ids[bad][order].astype(np.int64).tolist()
 
 
-def build_stats(input_fc: str, tolerance) -> None:
+def check_shell_closed(table: dict, quantum: float) -> Tuple[List, List]:
     '''
-    Runtime function for chekcing geometry conditions
+    Checks if walls, roofs and base of every segment (ID_SEG) form closed shell - edges (vertices quantized to quantum) are hashed per segment and their uses counted,
+    every edge of closed shell is shared by exactly two faces.
+    Returns (ID_SEG of open shells - edges used once, ID_SEG of segments with non-manifold edges - used more than twice), ids in order of first occurrence.
+    '''
+    seg_ids, first_index, inverse = np.unique(table['ID_SEG'], return_index=True, return_inverse=True)
+    groups = np.where(np.isnan(table['ID_SEG']), -1, inverse.reshape(-1))
+
+    keys, edge_groups = edge_keys(table, groups, quantum)
+    usage = count_edge_usage(keys)
+
+    result = []
+    for bad_edges in (usage == 1, usage > 2):
+        bad = np.zeros(len(seg_ids), dtype=bool)
+        bad[edge_groups[bad_edges]] = True
+        order = np.argsort(first_index[bad], kind='stable')
+        result.append(seg_ids[bad][order].astype(np.int64).tolist())
+
+    return tuple(result)
+
+
+def check_overlapping_bases(table: dict, min_area: float) -> np.ndarray:
+    '''
+    Mask of base polygons (PLOCHA_KOD = 4) overlapping base polygon of another segment or building by more than min_area (m2).
+    Candidate pairs come from grid index over bounding boxes of bases, exact intersection is computed only for them.
+    '''
+    mask = np.zeros(len(table['PLOCHA_KOD']), dtype=bool)
+    bases = np.flatnonzero((table['PLOCHA_KOD'] == 4) & ~table['no_geometry'])
+    if len(bases) < 2:
+        return mask
+
+    offsets = feature_vertex_offsets(table)
+    xy = table['coords'][:, :2]
+    boxes = np.column_stack((segment_reduce(np.minimum, xy, offsets), segment_reduce(np.maximum, xy, offsets)))[bases]
+
+    first, second = GridIndex(boxes).candidate_pairs()
+    first, second = bases[first], bases[second]
+    id_seg, ruian_ibo = table['ID_SEG'], table['RUIAN_IBO']
+    different = (id_seg[first] != id_seg[second]) | (ruian_ibo[first] != ruian_ibo[second])
+
+    # polygons are built only for candidates
+    shapes = {}
+    for i, j in zip(first[different].tolist(), second[different].tolist()):
+        for k in (i, j):
+            if k not in shapes:
+                shapes[k] = feature_to_polygon(table, k)
+        if shapes[i].intersect(shapes[j], 4).area > min_area:
+            mask[i] = mask[j] = True
+
+    return mask
+
+
+def build_stats(input_fc: str, tolerance, planarity_tolerance: float = 0.05, wall_tilt_tolerance: float = 2,
+                flat_roof_slope: float = 5, topology_tolerance: float = 0.01,
+                overlap_tolerance: float = 0.1, gdb_path: str = None) -> Tuple[dict, dict]:
+    '''
+    Runtime function for chekcing geometry conditions - featureclass is read only once, all checks run from in-memory arrays.
+    Returns (stats, columns of per-feature orientation metrics).
     '''
 
     log_it(f'Lokalita: {input_fc}',  'info', __name__)
 
     stats = {}
     plocha_kod_types = {
-        'svisla-stena': 1,
-        'vodorovna-strecha': 2,
-        'sikma-stresni-plocha': 3,
-        'zakladova-deska': 4,
+        1: 'svisla-stena',
+        2: 'vodorovna-strecha',
+        3: 'sikma-stresni-plocha',
+        4: 'zakladova-deska',
     }
 
-    with arcpy.da.SearchCursor(input_fc, ["OID@", "SHAPE@", "PLOCHA_KOD", "ID_PLO", "ID_SEG"]) as cursor:
-        for row in cursor:
+    table = read_fc(input_fc, gdb_path)
+    id_plo = table['ID_PLO']
 
-            geometry_object = row[1]
-            plocha_kod = int(row[2])
-            plocha_id = int(row[3])
-            # log_it(f'build_stats looping {input_fc}, geom_obj: {geometry_object}, plocha_id {plocha_id}', 'info', __name__)
+    feature_checks = [('plochy_bez_geometrie', table['no_geometry'])]
+    for plocha_kod, mask in check_id_plo_attr_against_geometry(table, tolerance).items():
+        feature_checks.append((f'attribut_{plocha_kod_types[plocha_kod]}_se_neshoduje_s_geometrii_ploch_ID-PLO', mask))
 
-            no_geom_ids = no_geometry(geometry_object, plocha_id)
-            if no_geom_ids:
-                stats.setdefault('plochy_bez_geometrie',
-                                 []).append(no_geom_ids)
+    non_planar, max_deviation = check_if_planar(table, planarity_tolerance)
+    feature_checks.append(('neplanarni_plochy_ID-PLO', non_planar))
 
-            for k, v in plocha_kod_types.items():
-                curr_invalid_id_plo = check_id_plo_attr_against_geometry(
-                    geometry_object, plocha_kod, plocha_id, tolerance=tolerance, plocha_kod_spec=v)
-                if curr_invalid_id_plo:
-                    stats.setdefault(
-                        f'attribut_{k}_se_neshoduje_s_geometrii_ploch_ID-PLO', []).append(curr_invalid_id_plo)
+    orientation = compute_orientation(table)
+    feature_checks.append(('svisle_steny_s_odklonem_od_svislice_mimo_toleranci_ID-PLO',
+                           check_walls_vertical(table, orientation, wall_tilt_tolerance)))
+    feature_checks.append(('zakladove_desky_prekryvajici_se_s_deskou_jineho_segmentu_ID-PLO',
+                           check_overlapping_bases(table, overlap_tolerance)))
+
+    # stats ordered by first invalid feature
+    for _, k, mask in sorted((int(np.argmax(mask)), k, mask) for k, mask in feature_checks if mask.any()):
+        stats[k] = id_plo[mask].astype(np.int64).tolist()
 
     log_it(
         f'check_id_plo_attr_finished {input_fc}, {tolerance}', 'info', __name__)
 
+    if non_planar.any():
+        deviations = dict(zip(id_plo[non_planar].astype(np.int64).tolist(), np.round(max_deviation[non_planar], 3).tolist()))
+        log_it(f'Maximalni odchylka vrcholu od roviny neplanarnich ploch (m): {deviations}', 'info', __name__)
+
     stats['segmenty_bez_nebo_s_vice_nezli_jednim_polygonem_pro_plochu_zakladova_deska_ID-SEG'] = check_parts_in(
-        input_fc, level='ID_SEG')
+        table, level='ID_SEG')
     stats['budovy_bez_stresni_plochy_RUIAN-IBO'] = check_parts_in(
-        input_fc, level='RUIAN_IBO')
+        table, level='RUIAN_IBO')
+    stats['segmenty_se_sklonem_strechy_neodpovidajicim_STRECHA-KOD_ID-SEG'] = check_roof_slope_against_type(
+        table, orientation, flat_roof_slope)
+    open_shells, non_manifold = check_shell_closed(table, topology_tolerance)
+    stats['segmenty_s_neuzavrenym_plastem_ID-SEG'] = open_shells
+    stats['segmenty_s_hranou_sdilenou_vice_nez_dvema_plochami_ID-SEG'] = non_manifold
 
-    return stats
+    return stats, {'ID_PLO': id_plo, 'ID_SEG': table['ID_SEG'], 'PLOCHA_KOD': table['PLOCHA_KOD'],
+                   **orientation, 'ODCHYLKA_OD_ROVINY': max_deviation}
+
+
+def write_orientation_table(location_folder: str, orientation_workspace: str, columns: dict) -> None:
+    '''
+    Writes per-feature orientation metrics of locality into side table {locality}_orientace_ploch in orientation_workspace.
+    '''
+    orientation_table = os.path.join(orientation_workspace, f'{os.path.basename(os.path.normpath(location_folder))}_orientace_ploch')
+    write_side_table(orientation_table, columns)
+    log_it(f'Orientation of features written into {orientation_table}', 'info', __name__)
 
 
 def log_out_stats(stats: dict, fc_name: str) -> None:
@@ -242,22 +481,40 @@ def log_out_stats(stats: dict, fc_name: str) -> None:
         log_it(f'{fc_name} geometry is correct', 'info', __name__)
 
 
-def main(log_dir_path: str, location_root_folder_paths: str, tolerance: int = 0) -> None:
+def check_locality(location_folder: str, tolerance: float, planarity_tolerance: float, wall_tilt_tolerance: float,
+                   flat_roof_slope: float, topology_tolerance: float = 0.01, overlap_tolerance: float = 0.1) -> dict:
     '''
-    Main runtime.
+    Checks geometry of PolygonZ featureclass of one locality, runs in worker process - returns columns of orientation side table.
+    Side table is written by the parent process so workers dont lock the output geodatabase.
+    '''
+    geoms = ['PolygonZ', 'Multipatch']
+
+    log_it('-' * 15, 'info', __name__)
+    log_it(f'Checking {location_folder}', 'info', __name__)
+    polygonZgdb = get_gdb_path_3D_geoms(location_folder, geoms[0])
+    cur_fc = get_fc_from_gdb_within_dataset(polygonZgdb)
+    clear_selection(cur_fc)
+    stats, orientation = build_stats(cur_fc, tolerance, planarity_tolerance, wall_tilt_tolerance,
+                                     flat_roof_slope, topology_tolerance, overlap_tolerance, polygonZgdb)
+    log_out_stats(stats, cur_fc)
+    return orientation
+
+
+def main(log_dir_path: str, location_root_folder_paths: str, tolerance: int = 0, workers: int = None, planarity_tolerance: float = 0.05,
+         wall_tilt_tolerance: float = 2, flat_roof_slope: float = 5, orientation_workspace: str = None,
+         topology_tolerance: float = 0.01, overlap_tolerance: float = 0.1) -> None:
+    '''
+    Main runtime - checks localities in parallel worker processes.
     '''
     # setup file logging
     init_logging(log_dir_path)
 
-    geoms = ['PolygonZ', 'Multipatch']
-
-    for location_folder in location_root_folder_paths.split(';'):
-        log_it('-' * 15, 'info', __name__)
-        log_it(f'Checking {location_folder}', 'info', __name__)
-        polygonZgdb = get_gdb_path_3D_geoms(location_folder, geoms[0])
-        cur_fc = get_fc_from_gdb_within_dataset(polygonZgdb)
-        clear_selection(cur_fc)
-        log_out_stats(build_stats(cur_fc, float(tolerance)), cur_fc)
+    for location_folder, orientation in run_localities(check_locality, location_root_folder_paths.split(';'), get_workers(workers),
+                                                       float(tolerance), float(planarity_tolerance or 0.05), float(wall_tilt_tolerance or 2),
+                                                       float(flat_roof_slope or 5), float(topology_tolerance or 0.01),
+                                                       float(overlap_tolerance or 0.1)):
+        if orientation_workspace and orientation is not None:
+            write_orientation_table(location_folder, orientation_workspace, orientation)
 
 
 ###################################################
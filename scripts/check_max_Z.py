@@ -3,13 +3,24 @@ from toolbox_utils.clear_selection import clear_selection
 from toolbox_utils.gdb_getter import get_gdb_path_3D_geoms, get_gdb_path_3D_geoms_multiple
 # log_it printuje jak do arcgis console tak do souboru
 from toolbox_utils.messages_print import aprint, log_it, setup_logging
+from toolbox_utils.fc_cache import read_geometry, read_mesh
+from toolbox_utils.mesh import mesh_metrics
+from toolbox_utils.geometry_arrays import feature_vertex_offsets, segment_reduce
+from toolbox_utils.side_table import make_join_view, write_side_table
 import os
 import sys
 import arcpy
 import logging
+import numpy as np
 from typing import (List, Union)
 numeric = Union[int, float]
 
+# mesh plausibility - shell is closed when sum of area vectors is below MAX_CLOSURE of its area,
+# volume of closed segment has to be between MIN_FILL_RATIO and MAX_FILL_RATIO of height x footprint
+MAX_CLOSURE = 0.01
+MIN_FILL_RATIO = 0.25
+MAX_FILL_RATIO = 1.05
+
 # TODO - optional file logging
 
 
@@ -47,7 +58,38 @@ class CheckMaxZ(object):
             multiValue='False'
         )
 
+        output_workspace = arcpy.Parameter(
+            name="output_dir",
+            displayName="Output Workspace (gdb) for table of results (input workspace when empty)",
+            direction='Input',
+            datatype='DEWorkspace',
+            parameterType='Optional',
+            enabled='True',
+            multiValue='False'
+        )
+
+        create_join_view = arcpy.Parameter(
+            name='create_join_view',
+            displayName='Save layer of multipatch featureclass joined with table of results (.lyrx next to output workspace)',
+            direction='Input',
+            datatype='GPBoolean',
+            parameterType='Optional',
+            enabled='True',
+        )
+
+        compute_mesh_metrics = arcpy.Parameter(
+            name='compute_mesh_metrics',
+            displayName='Compute volume, surface area, roof area and bounding box of segments and check their plausibility',
+            direction='Input',
+            datatype='GPBoolean',
+            parameterType='Optional',
+            enabled='True',
+        )
+
         input_mtp_workspace.filter.list = ["Local Database"]
+        output_workspace.filter.list = ["Local Database"]
+        create_join_view.value = False
+        compute_mesh_metrics.value = True
         log_file_path.value = os.path.join(os.path.dirname(os.path.dirname(
             os.path.dirname(arcpy.mp.ArcGISProject("CURRENT").filePath))), 'logs')
 
@@ -56,7 +98,7 @@ class CheckMaxZ(object):
 
         input_mtp_workspace.value = get_config_data('multipatch', config_path)
 
-        params = [log_file_path, input_mtp_workspace]
+        params = [log_file_path, input_mtp_workspace, output_workspace, create_join_view, compute_mesh_metrics]
 
         return params
 
@@ -72,11 +114,6 @@ class CheckMaxZ(object):
         """Modify the messages created by internal validation for each tool
         parameter.  This method is called after internal validation."""
 
-        input_mtp_gdb_obj = parameters[1]
-        if input_mtp_gdb_obj.altered:
-            input_mtp_gdb_obj.setWarningMessage(
-                'This tool will modify input multipatch data by adding columns')
-
         # Nefunguje protoze by to muselo prochazet i data sety a muselo by to být univerzální TODO do budoucna - udělat modul Get FC from GDB kdy je jedno jestli je to zapouzdřený v datasetu nebo ne.
         # input_mtp_gdb = parameters[1].valueAsText
 
@@ -156,38 +193,103 @@ def fieldExists(dataset: str, field_name: str) -> bool:
     return field_name in [field.name for field in arcpy.ListFields(dataset)]
 
 
-def max_z_check(input_fc):
-    rows_with_faulty_Z = []
+def compute_max_z(input_fc: str, gdb_path: str = None, table: dict = None) -> dict:
+    '''
+    Single read of multipatch featureclass - maximal Z of vertices of every feature (same value as Z_Max of AddZInformation) reduced over flat vertex arrays
+    and its absolute difference from ABS_SEG_VYSKA. 3D Analyst is not needed. Already read arrays (read_mesh) can be passed as table.
+    Returns columns {OID@, ID_SEG, ABS_SEG_VYSKA, Z_Max, Z_Max_ABS_SEG_VYSKA_diff}, features without geometry get nan.
+    '''
+    if table is None:
+        table = read_geometry(input_fc, ['OID@', 'ID_SEG', 'ABS_SEG_VYSKA'], gdb_path)
+    z_max = segment_reduce(np.maximum, table['coords'][:, 2], feature_vertex_offsets(table))
+    return {'OID@': table['OID@'], 'ID_SEG': table['ID_SEG'], 'ABS_SEG_VYSKA': table['ABS_SEG_VYSKA'],
+            'Z_Max': z_max, 'Z_Max_ABS_SEG_VYSKA_diff': np.abs(table['ABS_SEG_VYSKA'] - z_max)}
+
+
+def compute_segment_mesh_metrics(table: dict) -> dict:
+    '''
+    Reduces mesh metrics of multipatches (mesh.mesh_metrics) per ID_SEG - sums of VOLUME, AREA, ROOF_AREA, FOOTPRINT, union of bounding boxes,
+    worst CLOSURE, HEIGHT of bounding box and FILL_RATIO = VOLUME / (HEIGHT * FOOTPRINT) (1 for prism, about 0.5 - 0.9 for pitched roofs).
+    '''
+    metrics = mesh_metrics(table)
+    valid = ~np.isnan(table['ID_SEG'])
+    seg_ids, index = np.unique(table['ID_SEG'][valid], return_inverse=True)
+    index = index.reshape(-1)
+
+    segments = {'ID_SEG': seg_ids}
+    for name in ('VOLUME', 'AREA', 'ROOF_AREA', 'FOOTPRINT'):
+        segments[name] = np.bincount(index, weights=metrics[name][valid], minlength=len(seg_ids))
+    for name, ufunc in (('X_MIN', np.fmin), ('Y_MIN', np.fmin), ('Z_MIN', np.fmin), ('X_MAX', np.fmax), ('Y_MAX', np.fmax), ('Z_MAX', np.fmax), ('CLOSURE', np.fmax)):
+        segments[name] = np.full(len(seg_ids), np.nan)
+        ufunc.at(segments[name], index, metrics[name][valid])
+
+    segments['HEIGHT'] = segments['Z_MAX'] - segments['Z_MIN']
+    with np.errstate(invalid='ignore', divide='ignore'):
+        segments['FILL_RATIO'] = segments['VOLUME'] / (segments['HEIGHT'] * segments['FOOTPRINT'])
+    # flat or open meshes without footprint
+    segments['FILL_RATIO'][~np.isfinite(segments['FILL_RATIO'])] = np.nan
+    return segments
+
+
+def check_mesh_plausibility(segments: dict, input_fc: str) -> None:
+    '''
+    Logs segments with open shell (volume is not defined) and closed segments whose volume doesnt fit into height x footprint.
+    Segments without geometry are skipped.
+    '''
+    with np.errstate(invalid='ignore'):
+        open_shell = segments['CLOSURE'] > MAX_CLOSURE
+        closed = segments['CLOSURE'] <= MAX_CLOSURE
+        too_large = closed & (segments['FILL_RATIO'] > MAX_FILL_RATIO)
+        too_small = closed & ~(segments['FILL_RATIO'] >= MIN_FILL_RATIO)
+
+    for mask, message in ((open_shell, 'have open multipatch shell - volume cannot be computed'),
+                          (too_large, f'have volume larger than {MAX_FILL_RATIO} x height x footprint'),
+                          (too_small, f'have volume smaller than {MIN_FILL_RATIO} x height x footprint')):
+        ids = segments['ID_SEG'][mask].astype(np.int64).tolist()
+        if ids:
+            log_it(f'FC: {input_fc} - Segments (ID_SEG: {ids}) {message}', 'warning', __name__)
+
+
+def max_z_check(input_fc, out_workspace: str = None, join_view: bool = False, gdb_path: str = None, mesh: bool = False):
+    '''
+    Compares Z_Max of multipatches with ABS_SEG_VYSKA - results are written in one bulk insert into side table {input_fc}_max_z keyed by ID_SEG
+    in out_workspace (workspace of input_fc by default), input_fc is not modified. With join_view layer of input_fc joined with the side table is saved next to out_workspace.
+    With mesh the same single read gives triangulated meshes, metrics per segment are written into {input_fc}_mesh_metrics and checked for plausibility.
+    '''
     required_fields = ['ABS_SEG_VYSKA', 'ID_SEG']
-    work_fields = ['ABS_SEG_VYSKA', 'Z_Max',
-                   'Z_Max_ABS_SEG_VYSKA_diff', 'ID_SEG']
 
     are_there = []
     for f in required_fields:
         are_there.append(fieldExists(input_fc, f))
 
     if all(i is True for i in are_there):
-        arcpy.ddd.AddZInformation(input_fc, "Z_Max", '')
-        arcpy.management.AddField(
-            input_fc, 'Z_Max_ABS_SEG_VYSKA_diff', 'DOUBLE')
-        with arcpy.da.UpdateCursor(input_fc, work_fields) as cur:
-            for row in cur:
-                # vypocita absolutni rozdil mezi ABS_SEG_VYSKA a Z_Max a ulozi do fieldu Z_Max_ABS_SEG_VYSKA_diff
-                row[2] = abs(row[0] - row[1])
-                cur.updateRow(row)
-                # pokud je Z_Max_ABS_SEG_VYSKA_diff vyssi nez 1m priradi ID_SEG dane feature do listu ktery nasledne vyloguje
-                if row[2] > 1:
-                    rows_with_faulty_Z.append(row[3])
-        del row
-        del cur
+        table = read_mesh(input_fc, ['OID@', 'ID_SEG', 'ABS_SEG_VYSKA'], gdb_path) if mesh else None
+        columns = compute_max_z(input_fc, gdb_path, table)
+        out_workspace = out_workspace or os.path.dirname(arcpy.Describe(input_fc).catalogPath)
+        out_table = write_side_table(os.path.join(out_workspace, f'{input_fc}_max_z'),
+                                     {name: columns[name] for name in ('ID_SEG', 'Z_Max', 'Z_Max_ABS_SEG_VYSKA_diff')})
+        log_it(f'Z_Max of {input_fc} written into {out_table}', 'info', __name__)
+        if join_view:
+            make_join_view(arcpy.Describe(input_fc).catalogPath, 'ID_SEG', out_table, os.path.dirname(out_workspace))
+
+        # pokud je Z_Max_ABS_SEG_VYSKA_diff vyssi nez 1m priradi ID_SEG dane feature do listu ktery nasledne vyloguje
+        with np.errstate(invalid='ignore'):
+            faulty = columns['Z_Max_ABS_SEG_VYSKA_diff'] > 1
+        rows_with_faulty_Z = [None if np.isnan(seg) else int(seg) for seg in columns['ID_SEG'][faulty].tolist()]
 
         log_maxZ_result(rows_with_faulty_Z, input_fc)
 
+        if mesh:
+            segments = compute_segment_mesh_metrics(table)
+            out_table = write_side_table(os.path.join(out_workspace, f'{input_fc}_mesh_metrics'), segments)
+            log_it(f'Mesh metrics of {input_fc} written into {out_table}', 'info', __name__)
+            check_mesh_plausibility(segments, input_fc)
+
     else:
         log_it(f'{input_fc} is missing ABS_SEG_VYSKA or ID_SEG field. Operation for {input_fc} aborted.', 'warning', __name__)
 
 
-def main(log_dir_path: str, input_mtp_workspace: str, *args) -> None:
+def main(log_dir_path: str, input_mtp_workspace: str, output_workspace: str = None, create_join_view: str = 'false', compute_mesh_metrics: str = 'true', *args) -> None:
     '''
     Main runtime. 
     '''
@@ -197,11 +299,14 @@ def main(log_dir_path: str, input_mtp_workspace: str, *args) -> None:
     if input_mtp_workspace:
         arcpy.env.workspace = input_mtp_workspace
         mtp_fcs = arcpy.ListFeatureClasses(feature_type='Multipatch')
+        output_workspace = output_workspace or input_mtp_workspace
+        # input gdb is cached only when results go elsewhere - side tables in input gdb change its fingerprint
+        gdb_path = input_mtp_workspace if os.path.abspath(output_workspace) != os.path.abspath(input_mtp_workspace) else None
         if mtp_fcs:
             for fc in mtp_fcs:
                 clear_selection(fc)
                 log_it(fc, 'info', __name__)
-                max_z_check(fc)
+                max_z_check(fc, output_workspace, str(create_join_view).lower() == 'true', gdb_path, str(compute_mesh_metrics).lower() == 'true')
         else:
             log_it("Input Workspace doesnt cointain featureclasses with Multipatch geometry or doesnt have flat sturcture - please input GDB with flat structure ommit datasets (only featureclasses with Multipatch geometry)", 'error', __name__)
     else:
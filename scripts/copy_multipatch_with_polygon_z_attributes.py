@@ -2,6 +2,7 @@ from toolbox_utils.gdb_getter import get_gdb_path_3D_geoms, get_gdb_path_3D_geom
 from toolbox_utils.config_handler import get_config_data
 # log_it printuje jak do arcgis console tak do souboru
 from toolbox_utils.messages_print import aprint, log_it, setup_logging
+from toolbox_utils.parallel import run_localities
 import os
 import sys
 import arcpy
@@ -135,6 +136,55 @@ def get_fc_from_gdb_direct(gdb_path, fc_name=None) -> str:
         return fc
 
 
+def copy_locality(location_folder: str, output_mtp_workspace: str, fields_to_be_joined: List[str]) -> None:
+    '''
+    Creates copy of multipatch featureclass of one locality in output workspace and joins attributes from its PolygonZ featureclass.
+    '''
+    geoms = ['PolygonZ', 'Multipatch']
+
+    polygon_z_gdb, multipatch_gdb = get_gdb_path_3D_geoms_multiple(
+        location_folder, geoms, __name__)
+
+    log_it(f'{"-"*100}', 'info', __name__)
+
+    poly_dataset_name = get_dataset_from_gdb(
+        polygon_z_gdb)  # name of first Polygon_Z dataset
+    poly_z_fc_name = get_fc_from_gdb_within_dataset(
+        polygon_z_gdb)  # name of first polygon z featureclass
+
+
+    mtp_fc = get_fc_from_gdb_within_dataset(
+        multipatch_gdb)  # name of first mtp fc
+    mtp_fc_name = f'{mtp_fc}_attrs'  # name of new fc with joined attrs
+    key_field = 'ID_SEG'  # id field on which join will be based on
+
+    if get_fc_from_gdb_direct(output_mtp_workspace, mtp_fc_name) == None:
+        arcpy.env.workspace = multipatch_gdb
+        log_it(
+            f"CURRENT WORKSPACE: {arcpy.env.workspace}", 'info', __name__)
+
+
+        arcpy.conversion.FeatureClassToFeatureClass(
+            mtp_fc, output_mtp_workspace, mtp_fc_name)  # create copy of mtp fc
+        log_it(
+            f'Copy FeatureClass {mtp_fc} created in {output_mtp_workspace}', 'info', __name__)
+
+        # change working env and get name of new copied mtp fc
+        mtp_attrs_in_new_workspace = get_fc_from_gdb_direct(
+            output_mtp_workspace, fc_name=mtp_fc_name)
+        # build path to original polygon z fc with attributes to join to mtp
+        path_to_polygon_z_fc = os.path.join(
+            polygon_z_gdb, poly_dataset_name, poly_z_fc_name)
+
+
+        arcpy.management.JoinField(mtp_attrs_in_new_workspace, key_field, path_to_polygon_z_fc,
+                                   key_field, fields_to_be_joined)  # join attrs from polygon z fc to mtp fc
+        log_it(
+            f'Attributes {fields_to_be_joined} joined to {mtp_attrs_in_new_workspace}', 'info', __name__)
+    else:
+        log_it(f'{mtp_fc_name} already exists in chosen workspace:\n{output_mtp_workspace}\n{mtp_fc_name} will not be created', 'warning', __name__)
+
+
 def main(log_dir_path: str, location_root_folder_paths: str, output_mtp_workspace: str) -> None:
     '''
     Main runtime. Creates copy multipatch feature class in chosen workspace (gdb) and joins given attribute information to it from equivalent PolygonZ featureclass. 
@@ -143,54 +193,14 @@ def main(log_dir_path: str, location_root_folder_paths: str, output_mtp_workspac
     fields_to_be_joined = ['RUIAN_IBO', 'STRECHA_KOD',
                            'PATA_SEG_VYSKA', 'HORIZ_VYSKA', 'ABS_SEG_VYSKA']
 
-    geoms = ['PolygonZ', 'Multipatch']
-
     # setup file logging
     init_logging(log_dir_path)
 
     # parse out multiple parameters (multiple folder paths)
-    for location_folder in location_root_folder_paths.split(';'):
-        polygon_z_gdb, multipatch_gdb = get_gdb_path_3D_geoms_multiple(
-            location_folder, geoms, __name__)
-
-        log_it(f'{"-"*100}', 'info', __name__)
-
-        poly_dataset_name = get_dataset_from_gdb(
-            polygon_z_gdb)  # name of first Polygon_Z dataset
-        poly_z_fc_name = get_fc_from_gdb_within_dataset(
-            polygon_z_gdb)  # name of first polygon z featureclass
-        
-        
-        mtp_fc = get_fc_from_gdb_within_dataset(
-            multipatch_gdb)  # name of first mtp fc
-        mtp_fc_name = f'{mtp_fc}_attrs'  # name of new fc with joined attrs
-        key_field = 'ID_SEG'  # id field on which join will be based on
-
-        if get_fc_from_gdb_direct(output_mtp_workspace, mtp_fc_name) == None:
-            arcpy.env.workspace = multipatch_gdb
-            log_it(
-                f"CURRENT WORKSPACE: {arcpy.env.workspace}", 'info', __name__)
-
-           
-            arcpy.conversion.FeatureClassToFeatureClass(
-                mtp_fc, output_mtp_workspace, mtp_fc_name)  # create copy of mtp fc
-            log_it(
-                f'Copy FeatureClass {mtp_fc} created in {output_mtp_workspace}', 'info', __name__)
-
-            # change working env and get name of new copied mtp fc
-            mtp_attrs_in_new_workspace = get_fc_from_gdb_direct(
-                output_mtp_workspace, fc_name=mtp_fc_name)
-            # build path to original polygon z fc with attributes to join to mtp
-            path_to_polygon_z_fc = os.path.join(
-                polygon_z_gdb, poly_dataset_name, poly_z_fc_name)
-
-
-            arcpy.management.JoinField(mtp_attrs_in_new_workspace, key_field, path_to_polygon_z_fc,
-                                       key_field, fields_to_be_joined)  # join attrs from polygon z fc to mtp fc
-            log_it(
-                f'Attributes {fields_to_be_joined} joined to {mtp_attrs_in_new_workspace}', 'info', __name__)
-        else:
-            log_it(f'{mtp_fc_name} already exists in chosen workspace:\n{output_mtp_workspace}\n{mtp_fc_name} will not be created', 'warning', __name__)
+    # single worker - every locality creates featureclass and joins fields in the same output file gdb, which allows only one writer of schema
+    for _ in run_localities(copy_locality, location_root_folder_paths.split(';'), 1,
+                            output_mtp_workspace, fields_to_be_joined):
+        pass
 
 ###################################################
 ############# Run the tool from IDE ###############
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# tool modules import toolbox_utils from scripts folder - same as buildings_validation.pyt
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
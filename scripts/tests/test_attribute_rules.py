@@ -0,0 +1,158 @@
+'''
+Rule engine of check_attributes (attribute_rules.json) against the original hard-coded per-feature checks on synthetic tables.
+Both have to report the same rules with the same ids in the same order.
+'''
+import json
+import os
+import numpy as np
+import pytest
+from toolbox_utils.attribute_rules import REQUIRED_COLUMNS, evaluate_rules, load_rules
+from toolbox_utils.columnar import cursor_to_columns
+from toolbox_utils.violations import ViolationStore
+
+RULES_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'attribute_rules.json')
+
+
+def legacy_check_conditions(data: list) -> dict:
+    '''
+    Per-feature checks of check_attributes before the rule engine - {rule name: [ids]} in order of first violation.
+    '''
+    def check_codelist(feature, column, start, stop):
+        return feature[column] not in range(start, stop + 1)
+
+    problems = {}
+    for feature in data:
+        conditions = {}
+        has_null = False
+        rimsa = 'HORIZ_VYSKA' if 'HORIZ_VYSKA' in feature else 'RIMSA_VYSKA'
+
+        for col, val in feature.items():
+            if val is None:
+                has_null = True
+                conditions[f'NULL VALUES FOUND IN {col}'] = True
+
+        if not has_null:
+            rimsa_vyska_frac = (feature[rimsa] - feature['PATA_SEG_VYSKA']) / (feature['ABS_SEG_VYSKA'] - feature['PATA_SEG_VYSKA'])
+            conditions = {
+                'PATA_VYSKA >= ABS_VYSKA': feature['PATA_VYSKA'] >= feature['ABS_VYSKA'],
+                'PATA_VYSKA >= HREBEN_VYSKA': feature['PATA_VYSKA'] >= feature['HREBEN_VYSKA'],
+                'PATA_SEG_VYSKA >= ABS_SEG_VYSKA': feature['PATA_SEG_VYSKA'] >= feature['ABS_SEG_VYSKA'],
+                'HORIZ_VYSKA ("RIMSA_VYSKA") > ABS_SEG_VYSKA': round(feature[rimsa], 2) > round(feature['ABS_SEG_VYSKA'], 2),
+                'PATA_SEG_VYSKA >= HORIZ_VYSKA ("RIMSA_VYSKA")': feature['PATA_SEG_VYSKA'] >= feature[rimsa],
+                'STRECHA_KOD CONTAINS INVALID VALUES': check_codelist(feature, 'STRECHA_KOD', 1, 7),
+                'PLOCHA_KOD CONTAINS INVALID VALUES': check_codelist(feature, 'PLOCHA_KOD', 1, 4),
+                'RIMSA_VYSKA HAS ABNORMALY SMALL VALUES': rimsa_vyska_frac < 0.3,
+            }
+
+        if 'CAST_OBJEKTU' in feature:
+            conditions['CAST_OBJEKTU CONTAINS INVALID VALUES'] = check_codelist(feature, 'CAST_OBJEKTU', 1, 5)
+
+        for cond_name, cond_val in conditions.items():
+            if cond_val:
+                id_field = 'ID_SEG' if cond_name == 'RIMSA_VYSKA HAS ABNORMALY SMALL VALUES' else 'ID_PLO'
+                problems.setdefault(cond_name, []).append(int(feature[id_field]))
+
+    return problems
+
+
+def engine_check_conditions(rows: list, cols: list) -> dict:
+    '''
+    check_conditions of check_attributes - rules of attribute_rules.json over columns read as by read_columns, without rules the legacy checks dont have.
+    '''
+    with open(RULES_PATH) as f:
+        group_rules = {rule['name'] for rule in json.load(f)['rules'] if rule['type'] == 'group_constant'}
+    columns = cursor_to_columns(rows, cols)
+    store = ViolationStore(len(rows))
+    for name, mask, id_field in evaluate_rules(load_rules(RULES_PATH), columns):
+        if name not in group_rules:
+            store.add(name, mask, id_field)
+    return {rule: store.ids(rule, columns[store.id_field(rule)]) for rule in store.rules()}
+
+
+def valid_row(i: int) -> dict:
+    return {'OBJECTID': i + 1, 'RUIAN_IBO': 5000 + i, 'ID_SEG': 100 + i // 2, 'ID_PLO': 1000 + i,
+            'PATA_VYSKA': 300.0, 'HREBEN_VYSKA': 315.0, 'ABS_VYSKA': 315.0, 'HORIZ_VYSKA': 308.0,
+            'STRECHA_KOD': 2, 'PATA_SEG_VYSKA': 300.0, 'ABS_SEG_VYSKA': 310.0, 'PLOCHA_KOD': 1, 'CAST_OBJEKTU': 1,
+            'Shape_Area': 50.0, 'Shape': (-700000.0 - i, -1100000.0), 'Shape_Length': 30.0}
+
+
+# every rule violated, values on boundaries of rules and NULL values which skip the other rules
+CASES = [
+    {},
+    {'PATA_VYSKA': 315.0},
+    {'PATA_VYSKA': 314.99},
+    {'PATA_VYSKA': 316.0, 'ABS_VYSKA': 320.0},
+    {'PATA_SEG_VYSKA': 310.5, 'HORIZ_VYSKA': 309.0, 'PATA_VYSKA': 299.0},
+    {'PATA_SEG_VYSKA': 311.0},
+    {'HORIZ_VYSKA': 310.004},
+    {'HORIZ_VYSKA': 310.006},
+    {'HORIZ_VYSKA': 310.5},
+    {'HORIZ_VYSKA': 300.0},
+    {'HORIZ_VYSKA': 299.0},
+    {'HORIZ_VYSKA': 303.0},
+    {'HORIZ_VYSKA': 302.999},
+    {'STRECHA_KOD': 0}, {'STRECHA_KOD': 1}, {'STRECHA_KOD': 7}, {'STRECHA_KOD': 8}, {'STRECHA_KOD': 2.5},
+    {'PLOCHA_KOD': 0}, {'PLOCHA_KOD': 4}, {'PLOCHA_KOD': 5},
+    {'CAST_OBJEKTU': 0}, {'CAST_OBJEKTU': 5}, {'CAST_OBJEKTU': 6},
+    {'PATA_VYSKA': None},
+    {'HORIZ_VYSKA': None, 'STRECHA_KOD': 9},
+    {'CAST_OBJEKTU': None},
+    {'Shape': None},
+    {'RUIAN_IBO': None, 'PATA_VYSKA': 400.0},
+    {'STRECHA_KOD': None, 'PLOCHA_KOD': None, 'CAST_OBJEKTU': 8},
+]
+
+
+def case_rows() -> list:
+    rows = []
+    for i, case in enumerate(CASES):
+        row = valid_row(i)
+        row.update(case)
+        rows.append(row)
+    return rows
+
+
+def random_rows(seed: int, num_rows: int = 400) -> list:
+    '''
+    Random rows from few values so equal values (boundaries of comparisons) and NULL values are frequent.
+    '''
+    rng = np.random.default_rng(seed)
+    heights = [None, 300.0, 303.0, 305.0, 310.0, 310.004, 312.0]
+    codes = [None, 0, 1, 2, 4, 5, 7, 8]
+    rows = []
+    for i in range(num_rows):
+        row = valid_row(i)
+        for col in ('PATA_VYSKA', 'HREBEN_VYSKA', 'ABS_VYSKA', 'HORIZ_VYSKA', 'PATA_SEG_VYSKA', 'ABS_SEG_VYSKA'):
+            row[col] = heights[rng.integers(len(heights))] if rng.random() < 0.3 else row[col]
+        for col in ('STRECHA_KOD', 'PLOCHA_KOD', 'CAST_OBJEKTU'):
+            row[col] = codes[rng.integers(len(codes))] if rng.random() < 0.2 else row[col]
+        # legacy checks divide by zero for segment without height
+        if row['PATA_SEG_VYSKA'] is not None and row['PATA_SEG_VYSKA'] == row['ABS_SEG_VYSKA']:
+            row['ABS_SEG_VYSKA'] += 1.0
+        rows.append(row)
+    return rows
+
+
+def assert_same_problems(rows: list, cols: list) -> None:
+    legacy = legacy_check_conditions([{col: row[col] for col in cols} for row in rows])
+    engine = engine_check_conditions([tuple(row[col] for col in cols) for row in rows], cols)
+    assert list(engine.items()) == list(legacy.items())
+
+
+def test_every_rule_is_covered_by_cases():
+    legacy = legacy_check_conditions([{col: row[col] for col in REQUIRED_COLUMNS} for row in case_rows()])
+    with open(RULES_PATH) as f:
+        rules = [rule for rule in json.load(f)['rules'] if rule['type'] not in ('null', 'group_constant') and rule.get('enabled', True)]
+    assert {rule['name'] for rule in rules} <= set(legacy)
+    assert {f'NULL VALUES FOUND IN {col}' for col in ('PATA_VYSKA', 'CAST_OBJEKTU', 'Shape', 'RUIAN_IBO')} <= set(legacy)
+
+
+@pytest.mark.parametrize('rimsa', ['HORIZ_VYSKA', 'RIMSA_VYSKA'])
+def test_engine_matches_legacy_checks_on_cases(rimsa):
+    rows = [{(rimsa if col == 'HORIZ_VYSKA' else col): val for col, val in row.items()} for row in case_rows()]
+    assert_same_problems(rows, [rimsa if col == 'HORIZ_VYSKA' else col for col in REQUIRED_COLUMNS])
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_engine_matches_legacy_checks_on_random_table(seed):
+    assert_same_problems(random_rows(seed), REQUIRED_COLUMNS)
@@ -0,0 +1,82 @@
+'''
+DMR sampling engines of check_flying against synthetic in-memory raster - no DMR file, featureclass or Spatial Analyst needed.
+Raster values grow linearly with column and row (value = col + 100 * row), so zonal statistics and bilinear samples are known exactly.
+'''
+import numpy as np
+from toolbox_utils.dmr_statistics import compute_vertex_statistics, compute_zonal_statistics
+from toolbox_utils.pyramid import MinMaxPyramid
+from toolbox_utils.raster import ArrayRaster
+from toolbox_utils.zonal import feature_zonal_statistics
+
+NODATA = -9999.0
+
+
+def make_raster() -> ArrayRaster:
+    '''
+    20 x 20 cells of 1 m, upper left corner (0, 20), cell at row 5 col 12 is NoData.
+    '''
+    rows, cols = np.mgrid[0:20, 0:20]
+    values = (cols + 100 * rows).astype(np.float32)
+    values[5, 12] = NODATA
+    return ArrayRaster(values, 0.0, 20.0, 1.0, NODATA)
+
+
+def square(x: float, y: float, size: float, z: float = 0.0) -> list:
+    return [(x, y, z), (x, y + size, z), (x + size, y + size, z), (x + size, y, z), (x, y, z)]
+
+
+def make_table() -> dict:
+    '''
+    Flat vertex arrays (wkb_to_arrays layout) of three features - bases of ID_PLO 1 and 2, wall of segment 10 which is not sampled.
+    '''
+    rings = [square(2, 2, 4), square(10, 12, 4), square(2, 2, 4, 5)]
+    coords = np.array([vertex for ring in rings for vertex in ring], dtype=float)
+    ring_offsets = np.r_[0, np.cumsum([len(ring) for ring in rings])]
+    return {'coords': coords, 'ring_offsets': ring_offsets, 'part_offsets': np.arange(4), 'feature_offsets': np.arange(4),
+            'PLOCHA_KOD': np.array([4.0, 4.0, 1.0]), 'ID_PLO': np.array([1.0, 2.0, 3.0]),
+            'ID_SEG': np.array([10.0, 20.0, 10.0]), 'PATA_SEG_VYSKA': np.array([1760.0, 800.0, 1760.0])}
+
+
+def test_zonal_statistics_of_cell_centers_inside_bases():
+    zonal = compute_zonal_statistics(None, 'ID_PLO', make_raster(), table=make_table())
+
+    # base 1 covers cols 2..5 and rows 14..17, base 2 cols 10..13 and rows 4..7 without NoData cell
+    np.testing.assert_array_equal(zonal['ID_PLO'], [1, 2])
+    np.testing.assert_array_equal(zonal['COUNT'], [16, 15])
+    np.testing.assert_array_equal(zonal['MIN'], [1402, 410])
+    np.testing.assert_array_equal(zonal['MAX'], [1705, 713])
+    np.testing.assert_allclose(zonal['MEAN'], [1553.5, (np.sum(np.arange(10, 14)[None, :] + 100 * np.arange(4, 8)[:, None]) - 512) / 15])
+
+
+def test_zonal_statistics_only_keys():
+    zonal = compute_zonal_statistics(None, 'ID_PLO', make_raster(), only_keys=np.array([2.0]), table=make_table())
+    np.testing.assert_array_equal(zonal['ID_PLO'], [2])
+
+
+def test_pyramid_gives_same_statistics():
+    raster = make_raster()
+    table = make_table()
+    feature_zones = np.array([0, 1, -1])
+    plain = feature_zonal_statistics(table, feature_zones, 2, raster)
+    with_pyramid = feature_zonal_statistics(table, feature_zones, 2, raster, MinMaxPyramid.build(raster, tile=2))
+
+    for name in ('COUNT', 'MIN', 'MAX', 'MEAN'):
+        np.testing.assert_allclose(with_pyramid[name], plain[name])
+
+
+def test_vertex_statistics_bilinear_at_base_vertices():
+    base_stats, vertices, segments = compute_vertex_statistics(None, 'ID_PLO', make_raster(), table=make_table())
+
+    # bilinear interpolation of linear surface is exact - value at (x, y) is (x - 0.5) + 100 * (19.5 - y), closing vertices are skipped
+    np.testing.assert_array_equal(vertices['ID_PLO'], [1, 1, 1, 1, 2, 2, 2, 2])
+    np.testing.assert_allclose(vertices['DMR_Z'][:4], [1751.5, 1351.5, 1355.5, 1755.5])
+    np.testing.assert_allclose(vertices['GAP'][:4], [8.5, 408.5, 404.5, 4.5])
+
+    np.testing.assert_array_equal(base_stats['ID_PLO'], [1, 2])
+    np.testing.assert_allclose(base_stats['MIN'][0], 1351.5)
+    np.testing.assert_allclose(base_stats['MAX'][0], 1755.5)
+    np.testing.assert_allclose(base_stats['MEAN'][0], 1553.5)
+
+    np.testing.assert_array_equal(segments['ID_SEG'], [10, 20])
+    np.testing.assert_allclose(segments['MIN_GAP'][0], 4.5)
+    np.testing.assert_allclose(segments['MAX_GAP'][0], 408.5)
@@ -0,0 +1,55 @@
+'''
+Streaming duplicate detection of duplicates_engine against collections.Counter baseline.
+'''
+import random
+from collections import Counter
+from toolbox_utils.duplicates_engine import find_duplicates, format_duplicates, scan_columns
+
+
+def random_rows(seed: int, num_rows: int = 5000) -> list:
+    '''
+    Rows (OBJECTID, ID_PLO, ID_SEG, RUIAN_IBO) with few duplicated ID_PLO and many repeated ID_SEG, RUIAN_IBO.
+    '''
+    rng = random.Random(seed)
+    rows = []
+    for oid in range(1, num_rows + 1):
+        id_plo = rng.randrange(num_rows) if rng.random() < 0.02 else num_rows + oid
+        rows.append((oid, id_plo, rng.randrange(num_rows // 4), rng.choice([None, rng.randrange(300)])))
+    return rows
+
+
+def counter_duplicates(rows: list, col_i: int) -> dict:
+    counts = Counter(row[col_i] for row in rows)
+    duplicates = {}
+    for row in rows:
+        if counts[row[col_i]] > 1:
+            duplicates.setdefault(row[col_i], []).append(row[0])
+    return duplicates
+
+
+def test_duplicates_match_counter():
+    rows = random_rows(0)
+    duplicates = find_duplicates(iter(rows), 0, [1, 2, 3])
+
+    for found, col_i in zip(duplicates, [1, 2, 3]):
+        expected = counter_duplicates(rows, col_i)
+        assert found == expected
+        # values in order of their first duplicate occurrence, OBJECTIDs in order of rows
+        assert list(found) == sorted(expected, key=lambda val: expected[val][1])
+
+
+def test_distinct_counts_exact_and_approximate():
+    rows = random_rows(1, 20000)
+    duplicates, counts = scan_columns(iter(rows), 0, [1], count_indexes=[1, 2, 3], approximate_indexes=[2])
+
+    assert counts[1] == len(Counter(row[1] for row in rows))
+    assert counts[3] == len(Counter(row[3] for row in rows))
+    exact = len(Counter(row[2] for row in rows))
+    assert abs(counts[2] - exact) <= 0.04 * exact
+
+
+def test_format_duplicates():
+    lines = format_duplicates({7: [1, 3, 4], 9: [2, 5]}, 'ID_PLO')
+    assert lines == ['DUPLICATE VALUES OF ID_PLO: [7, 9]',
+                     'ID_PLO 7 occurs 3x - OBJECTID (1, 3, 4)',
+                     'ID_PLO 9 occurs 2x - OBJECTID (2, 5)']
@@ -0,0 +1,76 @@
+'''
+Cache entries of fc_cache against cursor-like rows - what read_columns stores has to come back unchanged from the cache.
+'''
+import numpy as np
+import pytest
+from toolbox_utils import fc_cache
+from toolbox_utils.attribute_rules import REQUIRED_COLUMNS
+from toolbox_utils.fc_cache import _rows_to_columns, cached_read, decode_arrays, encode_arrays
+
+
+def cursor_rows() -> list:
+    '''
+    Rows as returned by SearchCursor for check_attributes columns - ints, floats, strings, NULLs and Shape centroid as (x, y).
+    '''
+    rows = []
+    for i in range(5):
+        row = {col: float(i) for col in REQUIRED_COLUMNS}
+        row.update({'OBJECTID': i + 1, 'RUIAN_IBO': 1000 + i, 'STRECHA_KOD': 2, 'Shape': (-700000.5 + i, -1100000.25)})
+        rows.append(row)
+    rows[1]['PATA_VYSKA'] = None
+    rows[2]['Shape'] = None
+    rows[3]['RUIAN_IBO'] = None
+    return [tuple(row[col] for col in REQUIRED_COLUMNS) for row in rows]
+
+
+def assert_same_columns(loaded: dict, original: dict) -> None:
+    assert list(loaded) == list(original)
+    for col, values in original.items():
+        assert loaded[col].dtype == values.dtype
+        if values.dtype == object:
+            assert loaded[col].tolist() == values.tolist()
+        else:
+            np.testing.assert_array_equal(loaded[col], values)
+
+
+@pytest.mark.parametrize('raw', [False, True])
+def test_check_attributes_columns_round_trip_through_cache(tmp_path, monkeypatch, raw):
+    gdb = tmp_path / 'locality.gdb'
+    gdb.mkdir()
+    (gdb / 'a00000001.gdbtable').write_bytes(b'table')
+    monkeypatch.setattr(fc_cache, 'CACHE_DIR', str(tmp_path / 'cache'))
+    rows = cursor_rows()
+    calls = []
+
+    def reader():
+        # body of read_columns reader without the cursor
+        calls.append(1)
+        return _rows_to_columns(rows, REQUIRED_COLUMNS, raw)
+
+    kind = 'raw' if raw else 'columns'
+    stored = cached_read(str(gdb), 'fc', kind, REQUIRED_COLUMNS, reader)
+    loaded = cached_read(str(gdb), 'fc', kind, REQUIRED_COLUMNS, reader)
+
+    assert len(calls) == 1
+    assert_same_columns(loaded, stored)
+    assert loaded['Shape'][2] is None
+    assert loaded['Shape'][0] == (-700000.5, -1100000.25)
+
+
+def test_columns_which_cant_be_stored_raise_type_error():
+    column = np.empty(2, dtype=object)
+    column[:] = [object(), None]
+    with pytest.raises(TypeError):
+        encode_arrays({'DATUM': column})
+
+
+def test_point_columns_of_different_size_are_not_stored():
+    column = np.empty(2, dtype=object)
+    column[0], column[1] = (1.0, 2.0), (1.0, 2.0, 3.0)
+    with pytest.raises(TypeError):
+        encode_arrays({'Shape': column})
+
+
+def test_empty_object_column_round_trip():
+    column = np.empty(0, dtype=object)
+    assert decode_arrays(encode_arrays({'Shape': column}))['Shape'].tolist() == []
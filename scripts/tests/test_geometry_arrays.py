@@ -0,0 +1,73 @@
+'''
+WKB parsing of geometry_arrays against hand-built WKB blobs.
+'''
+import struct
+import numpy as np
+import pytest
+from toolbox_utils.geometry_arrays import feature_rings, segment_index, segment_reduce, wkb_to_arrays
+
+SQUARE = [(0.0, 0.0, 1.0), (0.0, 2.0, 1.0), (2.0, 2.0, 1.5), (2.0, 0.0, 1.5), (0.0, 0.0, 1.0)]
+HOLE = [(0.5, 0.5, 1.0), (1.0, 0.5, 1.0), (1.0, 1.0, 1.0), (0.5, 0.5, 1.0)]
+
+
+def polygon_wkb(rings: list, geom_type: int = 1003, order: str = '<') -> bytes:
+    '''
+    WKB polygon of rings of XYZ points - ISO type 1003 (PolygonZ), 3 (Polygon) and 2003 (PolygonM) drop Z, M is always 7.
+    '''
+    has_z, has_m = geom_type // 1000 in (1, 3), geom_type // 1000 in (2, 3)
+    blob = struct.pack(order + 'BII', order == '<', geom_type, len(rings))
+    for ring in rings:
+        blob += struct.pack(order + 'I', len(ring))
+        for x, y, z in ring:
+            point = (x, y) + ((z,) if has_z else ()) + ((7.0,) if has_m else ())
+            blob += struct.pack(order + 'd' * len(point), *point)
+    return blob
+
+
+def multi_wkb(parts: list, geom_type: int = 1006) -> bytes:
+    return struct.pack('<BII', 1, geom_type, len(parts)) + b''.join(parts)
+
+
+def test_polygons_with_holes_and_multiparts():
+    arrays = wkb_to_arrays([polygon_wkb([SQUARE, HOLE]), None, multi_wkb([polygon_wkb([SQUARE]), polygon_wkb([HOLE], order='>')])])
+
+    np.testing.assert_array_equal(arrays['coords'], SQUARE + HOLE + SQUARE + HOLE)
+    np.testing.assert_array_equal(arrays['ring_offsets'], [0, 5, 9, 14, 18])
+    np.testing.assert_array_equal(arrays['part_offsets'], [0, 2, 3, 4])
+    np.testing.assert_array_equal(arrays['feature_offsets'], [0, 1, 1, 3])
+
+
+def test_m_values_are_dropped():
+    arrays = wkb_to_arrays([polygon_wkb([SQUARE], geom_type=3003)])
+    np.testing.assert_array_equal(arrays['coords'], SQUARE)
+
+
+def test_empty_rings_are_left_out():
+    arrays = wkb_to_arrays([polygon_wkb([[], SQUARE])])
+    np.testing.assert_array_equal(arrays['ring_offsets'], [0, 5])
+    np.testing.assert_array_equal(arrays['part_offsets'], [0, 1])
+
+
+@pytest.mark.parametrize('wkb', [polygon_wkb([SQUARE], geom_type=3), polygon_wkb([SQUARE], geom_type=2003)])
+def test_geometry_without_z_raises(wkb):
+    with pytest.raises(ValueError, match='feature 1: .*no Z'):
+        wkb_to_arrays([polygon_wkb([SQUARE]), wkb])
+
+
+def test_geometry_without_polygons_raises():
+    with pytest.raises(ValueError, match='no polygons'):
+        wkb_to_arrays([struct.pack('<BIddd', 1, 1001, 0.0, 0.0, 0.0)])
+
+
+def test_segment_reduce_with_empty_segments():
+    values = np.array([3.0, 1.0, 2.0, 5.0, 4.0])
+    offsets = np.array([0, 2, 2, 5, 5])
+    np.testing.assert_array_equal(segment_reduce(np.minimum, values, offsets), [1.0, np.nan, 2.0, np.nan])
+    np.testing.assert_array_equal(segment_reduce(np.add, values, offsets, empty=0.0), [4.0, 0.0, 11.0, 0.0])
+    np.testing.assert_array_equal(segment_index(offsets), [0, 0, 2, 2, 2])
+
+
+def test_feature_rings_inverse_of_wkb_to_arrays():
+    features = [[SQUARE, HOLE], [], [SQUARE]]
+    wkbs = [polygon_wkb(rings) if rings else None for rings in features]
+    assert list(feature_rings(wkb_to_arrays(wkbs))) == [[list(map(list, ring)) for ring in rings] for rings in features]
@@ -0,0 +1,60 @@
+'''
+Geometry hashing of geometry_hash - invariance to vertex order and tolerance of quantization.
+'''
+from toolbox_utils.geometry_hash import find_geometric_duplicates, geometry_hash
+
+SQUARE = [(0.0, 0.0, 1.0), (0.0, 2.0, 1.0), (2.0, 2.0, 1.5), (2.0, 0.0, 1.5), (0.0, 0.0, 1.0)]
+HOLE = [(0.5, 0.5, 1.0), (1.0, 0.5, 1.0), (1.0, 1.0, 1.0), (0.5, 0.5, 1.0)]
+
+
+def rotated(ring: list, shift: int) -> list:
+    open_ring = ring[:-1]
+    open_ring = open_ring[shift:] + open_ring[:shift]
+    return open_ring + open_ring[:1]
+
+
+def shifted(rings: list, dx: float) -> list:
+    return [[(x + dx, y, z) for x, y, z in ring] for ring in rings]
+
+
+def test_hash_ignores_start_vertex_orientation_and_ring_order():
+    reference = geometry_hash([SQUARE, HOLE], 0.01)
+    assert geometry_hash([rotated(SQUARE, 2), HOLE], 0.01) == reference
+    assert geometry_hash([SQUARE[::-1], rotated(HOLE[::-1], 1)], 0.01) == reference
+    assert geometry_hash([HOLE, SQUARE], 0.01) == reference
+
+
+def test_hash_differs_for_different_geometry():
+    assert geometry_hash([SQUARE], 0.01) != geometry_hash([SQUARE, HOLE], 0.01)
+    assert geometry_hash([SQUARE], 0.01) != geometry_hash(shifted([SQUARE], 0.1), 0.01)
+
+
+def test_duplicates_per_quantum():
+    features = [(1, [SQUARE]), (2, [rotated(SQUARE, 1)]), (3, shifted([SQUARE], 0.003)), (4, [SQUARE, HOLE])]
+    exact, tolerant = find_geometric_duplicates(features, [0.001, 0.01])
+
+    assert list(exact.values()) == [[1, 2]]
+    assert list(tolerant.values()) == [[1, 2, 3]]
+
+
+def test_near_duplicates_straddling_grid_line():
+    # 0.004 m apart across line x = 0.005 of 0.01 m grid - different cells of grid aligned with origin, same cell of shifted grid
+    features = [(1, shifted([SQUARE], 0.0031)), (2, shifted([SQUARE], 0.0071)), (3, shifted([SQUARE], 0.03))]
+    assert geometry_hash(features[0][1], 0.01) != geometry_hash(features[1][1], 0.01)
+
+    tolerant, = find_geometric_duplicates(features, [0.01])
+    assert list(tolerant.values()) == [[1, 2]]
+
+
+def test_groups_of_both_grids_are_joined():
+    # 1, 2 share cells only on grid aligned with origin, 2, 3 only on shifted grid, 1, 3 on none of them
+    features = [(1, shifted([SQUARE], -0.0004)), (2, shifted([SQUARE], 0.0004)), (3, shifted([SQUARE], 0.0054)), (4, [HOLE])]
+    tolerant, = find_geometric_duplicates(features, [0.01])
+    assert list(tolerant.values()) == [[1, 2, 3]]
+
+
+def test_hash_collision_is_not_reported(monkeypatch):
+    from toolbox_utils import geometry_hash as module
+    monkeypatch.setattr(module, 'geometry_hash', lambda rings, quantum, offset=0.0: 0)
+    exact, = module.find_geometric_duplicates([(1, [SQUARE]), (2, [HOLE]), (3, [rotated(SQUARE, 1)])], [0.001])
+    assert list(exact.values()) == [[1, 3]]
@@ -0,0 +1,35 @@
+'''
+Error bounds of HyperLogLog distinct counting.
+'''
+import pytest
+from toolbox_utils.hyperloglog import HyperLogLog
+
+
+@pytest.mark.parametrize('precision, cardinality', [(14, 100), (14, 5000), (14, 100000), (10, 100000)])
+def test_estimate_within_four_standard_errors(precision, cardinality):
+    sketch = HyperLogLog(precision)
+    for value in range(cardinality):
+        sketch.add(value * 7919)
+    standard_error = 1.04 / (1 << precision) ** 0.5
+    assert abs(sketch.count() - cardinality) <= 4 * standard_error * cardinality + 1
+
+
+def test_repeated_values_dont_change_estimate():
+    sketch = HyperLogLog()
+    for value in range(3000):
+        sketch.add(f'value {value}')
+    estimate = sketch.count()
+    for _ in range(3):
+        for value in range(3000):
+            sketch.add(f'value {value}')
+    assert sketch.count() == estimate
+
+
+def test_empty_sketch_counts_zero():
+    assert HyperLogLog().count() == 0
+
+
+@pytest.mark.parametrize('precision', [3, 19])
+def test_precision_out_of_range(precision):
+    with pytest.raises(ValueError):
+        HyperLogLog(precision)
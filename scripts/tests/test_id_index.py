@@ -0,0 +1,24 @@
+'''
+Cross-locality ID index against in-memory SQLite database.
+'''
+import os
+from toolbox_utils.id_index import find_collisions, locality_key, open_id_index, update_locality
+
+
+def test_locality_key_drops_delivery_date():
+    assert locality_key(os.path.join('data', 'Lokalita_43_2022_08_11')) == 'Lokalita_43'
+    assert locality_key(os.path.join('data', 'Lokalita_43_2023_10_03') + os.sep) == 'Lokalita_43'
+    assert locality_key(os.path.join('data', 'Lokalita_43')) == 'Lokalita_43'
+
+
+def test_redelivered_locality_is_not_flagged_against_its_old_ids():
+    conn = open_id_index(':memory:')
+    update_locality(conn, locality_key('Lokalita_43_2022_08_11'), 'ID_SEG', [1, 2, 3])
+    update_locality(conn, locality_key('Lokalita_44_2022_08_11'), 'ID_SEG', [3, 4])
+
+    redelivered = locality_key('Lokalita_43_2023_10_03')
+    assert find_collisions(conn, redelivered, 'ID_SEG', [1, 2, 3, 5]) == {3: ['Lokalita_44']}
+
+    # ids of the new delivery replace the old ones
+    update_locality(conn, redelivered, 'ID_SEG', [5])
+    assert find_collisions(conn, 'Lokalita_45', 'ID_SEG', [1, 4, 5]) == {4: ['Lokalita_44'], 5: ['Lokalita_43']}
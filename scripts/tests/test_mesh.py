@@ -0,0 +1,46 @@
+'''
+Mesh metrics of multipatch features on closed boxes with known volume and areas.
+'''
+import numpy as np
+import pytest
+from toolbox_utils.mesh import mesh_metrics
+
+# S-JTSK sized origin - metrics are computed relative to first vertex of feature
+ORIGIN = np.array([-600000.0, -1160000.0, 250.0])
+
+
+def box_faces(size: tuple, inward: bool = False) -> list:
+    '''
+    Six outward oriented (counter-clockwise seen from outside) rectangles of box with corner in ORIGIN.
+    '''
+    dx, dy, dz = size
+    c = [ORIGIN + np.array([x, y, z]) for z in (0, dz) for y in (0, dy) for x in (0, dx)]
+    faces = [[0, 2, 3, 1], [4, 5, 7, 6], [0, 1, 5, 4], [2, 6, 7, 3], [0, 4, 6, 2], [1, 3, 7, 5]]
+    return [[tuple(c[i]) for i in (face[::-1] if inward else face)] for face in faces]
+
+
+def to_arrays(features: list) -> dict:
+    rings = [ring + ring[:1] for faces in features for ring in faces]
+    return {'coords': np.array([vertex for ring in rings for vertex in ring]),
+            'ring_offsets': np.r_[0, np.cumsum([len(ring) for ring in rings])],
+            'part_offsets': np.arange(len(rings) + 1),
+            'feature_offsets': np.r_[0, np.cumsum([len(faces) for faces in features])]}
+
+
+@pytest.mark.parametrize('inward', [False, True])
+def test_closed_box(inward):
+    metrics = mesh_metrics(to_arrays([box_faces((2.0, 3.0, 4.0), inward), box_faces((1.0, 1.0, 1.0))]))
+
+    np.testing.assert_allclose(metrics['VOLUME'], [24.0, 1.0])
+    np.testing.assert_allclose(metrics['AREA'], [52.0, 6.0])
+    np.testing.assert_allclose(metrics['ROOF_AREA'], [6.0, 1.0])
+    np.testing.assert_allclose(metrics['FOOTPRINT'], [6.0, 1.0])
+    np.testing.assert_allclose(metrics['CLOSURE'], [0.0, 0.0], atol=1e-9)
+    np.testing.assert_allclose(metrics['Z_MIN'], [250.0, 250.0])
+    np.testing.assert_allclose(metrics['Z_MAX'], [254.0, 251.0])
+
+
+def test_open_box_is_not_closed():
+    metrics = mesh_metrics(to_arrays([box_faces((1.0, 1.0, 1.0))[:5]]))
+    np.testing.assert_allclose(metrics['AREA'], [5.0])
+    np.testing.assert_allclose(metrics['CLOSURE'], [0.2])
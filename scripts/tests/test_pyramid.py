@@ -0,0 +1,92 @@
+'''
+Min/max pyramid - exact MIN, MAX of every level and build of GeoTIFF pyramid outside of shared tile cache.
+'''
+import struct
+import numpy as np
+import pytest
+from toolbox_utils.pyramid import MinMaxPyramid
+from toolbox_utils.raster import TILE_CACHE, ArrayRaster, GeoTiffRaster
+
+
+def write_geotiff(path: str, values: np.ndarray, block: int = 8) -> None:
+    '''
+    Minimal little-endian tiled uncompressed single band GeoTIFF with 1 m cells, upper left corner (0, 100).
+    '''
+    rows, cols = values.shape
+    tiles = []
+    for top in range(0, rows, block):
+        for left in range(0, cols, block):
+            tile = np.zeros((block, block), dtype=values.dtype)
+            part = values[top:top + block, left:left + block]
+            tile[:part.shape[0], :part.shape[1]] = part
+            tiles.append(tile.astype('<' + values.dtype.str[1:]).tobytes())
+
+    tags = [(256, 4, [cols]), (257, 4, [rows]), (258, 3, [values.dtype.itemsize * 8]), (259, 3, [1]), (277, 3, [1]),
+            (322, 3, [block]), (323, 3, [block]), (324, 4, None), (325, 4, [len(tile) for tile in tiles]),
+            (339, 3, [3]), (33550, 12, [1.0, 1.0, 0.0]), (33922, 12, [0.0, 0.0, 0.0, 0.0, 100.0, 0.0])]
+    formats = {3: 'H', 4: 'I', 12: 'd'}
+    ifd_size = 2 + 12 * len(tags) + 4
+    # values longer than 4 bytes go behind IFD, tiles behind them
+    extra_size = sum(struct.calcsize('<' + formats[kind] * len(vals if vals else tiles)) for _, kind, vals in tags
+                     if struct.calcsize('<' + formats[kind] * len(vals if vals else tiles)) > 4)
+    data_offset = 8 + ifd_size + extra_size
+    offsets = np.r_[0, np.cumsum([len(tile) for tile in tiles])][:-1] + data_offset
+
+    entries, extra = b'', b''
+    for tag, kind, vals in tags:
+        packed = struct.pack('<' + formats[kind] * len(vals if vals else offsets), *(vals if vals else offsets.tolist()))
+        if len(packed) <= 4:
+            entries += struct.pack('<HHI', tag, kind, len(packed) // struct.calcsize(formats[kind])) + packed.ljust(4, b'\x00')
+        else:
+            entries += struct.pack('<HHII', tag, kind, len(packed) // struct.calcsize(formats[kind]), 8 + ifd_size + len(extra))
+            extra += packed
+    with open(path, 'wb') as f:
+        f.write(b'II' + struct.pack('<HI', 42, 8) + struct.pack('<H', len(tags)) + entries + struct.pack('<I', 0) + extra + b''.join(tiles))
+
+
+def assert_exact_levels(pyramid: MinMaxPyramid, values: np.ndarray) -> None:
+    '''
+    Every node of every level holds exact MIN and MAX of raster cells it covers.
+    '''
+    for k, level in enumerate(pyramid.levels):
+        size = pyramid.tile * 2 ** k
+        for row, col in np.ndindex(level['COUNT'].shape):
+            cells = values[row * size:(row + 1) * size, col * size:(col + 1) * size]
+            assert level['MIN'][row, col] == cells.min()
+            assert level['MAX'][row, col] == cells.max()
+
+
+def test_float64_values_keep_exact_min_max():
+    # values with more digits than float32 holds - float32 pyramid would round MIN up or MAX down
+    values = 250.0 + np.random.default_rng(0).random((40, 24)) / 3
+    pyramid = MinMaxPyramid.build(ArrayRaster(values, 0.0, 40.0, 1.0), tile=4)
+    assert pyramid.levels[0]['MIN'].dtype == np.float64
+    assert_exact_levels(pyramid, values)
+
+
+def test_float32_values_are_stored_as_float32():
+    values = (250.0 + np.random.default_rng(1).random((20, 20)) / 3).astype(np.float32)
+    pyramid = MinMaxPyramid.build(ArrayRaster(values, 0.0, 20.0, 1.0), tile=4)
+    assert pyramid.levels[0]['MIN'].dtype == np.float32
+    assert_exact_levels(pyramid, values)
+
+
+@pytest.mark.parametrize('dtype', [np.float32, np.float64])
+def test_geotiff_pyramid_is_built_outside_shared_cache(tmp_path, dtype):
+    values = (300.0 + np.random.default_rng(2).random((37, 29)) / 7).astype(dtype)
+    path = str(tmp_path / 'dmr.tif')
+    write_geotiff(path, values)
+
+    TILE_CACHE.clear()
+    raster = GeoTiffRaster(path)
+    # block read by zonal statistics before the build
+    raster.read_window(0, 0, 2, 2)
+    try:
+        pyramid = MinMaxPyramid.build(raster, tile=4)
+    finally:
+        raster.close()
+
+    assert TILE_CACHE.stats()['blocks'] == 1
+    assert TILE_CACHE.stats()['misses'] == 1
+    assert_exact_levels(pyramid, values)
+    TILE_CACHE.clear()
@@ -0,0 +1,50 @@
+'''
+Candidate pairs of GridIndex against brute force intersection of bounding boxes.
+'''
+import numpy as np
+from toolbox_utils.spatial_index import GridIndex
+
+
+def brute_force_pairs(boxes: np.ndarray) -> set:
+    return {(i, j) for i in range(len(boxes)) for j in range(i + 1, len(boxes))
+            if boxes[i, 0] <= boxes[j, 2] and boxes[j, 0] <= boxes[i, 2] and boxes[i, 1] <= boxes[j, 3] and boxes[j, 1] <= boxes[i, 3]}
+
+
+def random_boxes(seed: int, num_boxes: int = 300) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    corners = rng.uniform(-600000, -599000, (num_boxes, 2))
+    sizes = rng.exponential(20, (num_boxes, 2))
+    return np.hstack((corners, corners + sizes))
+
+
+def test_candidate_pairs_match_brute_force():
+    for seed in range(3):
+        boxes = random_boxes(seed)
+        first, second = GridIndex(boxes).candidate_pairs()
+        assert np.all(first < second)
+        assert len(set(zip(first.tolist(), second.tolist()))) == len(first)
+        assert set(zip(first.tolist(), second.tolist())) == brute_force_pairs(boxes)
+
+
+def test_touching_and_degenerate_boxes():
+    boxes = np.array([[0, 0, 1, 1], [1, 1, 2, 2], [3, 3, 3, 3], [3, 0, 3, 5], [5, 5, 6, 6]], dtype=float)
+    first, second = GridIndex(boxes, cell_size=1.0).candidate_pairs()
+    assert set(zip(first.tolist(), second.tolist())) == brute_force_pairs(boxes) == {(0, 1), (2, 3)}
+
+
+def test_empty_index():
+    first, second = GridIndex(np.empty((0, 4))).candidate_pairs()
+    assert len(first) == len(second) == 0
+
+
+def test_oversize_boxes_are_not_registered():
+    boxes = random_boxes(3, 1000)
+    # huge outliers over whole area and over each other
+    boxes[:3] = [[-600500, -600500, -598000, -598000], [-601000, -600200, -599100, -599900], [-1e6, -1e6, 1e6, 1e6]]
+    index = GridIndex(boxes)
+
+    assert set(index.oversize.tolist()) >= {0, 1, 2}
+    assert not np.isin(index.items, index.oversize).any()
+    assert len(index.cells) < 4 * len(boxes)
+    first, second = index.candidate_pairs()
+    assert set(zip(first.tolist(), second.tolist())) == brute_force_pairs(boxes)
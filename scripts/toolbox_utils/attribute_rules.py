@@ -0,0 +1,237 @@
+import os
+import json
+import numpy as np
+from typing import (Callable, Dict, List, Tuple)
+from toolbox_utils.columnar import null_mask
+
+
+OPERATORS = {
+    '>': np.greater,
+    '>=': np.greater_equal,
+    '<': np.less,
+    '<=': np.less_equal,
+    '==': np.equal,
+    '!=': np.not_equal,
+}
+
+RULE_TYPES = ('null', 'compare', 'codelist', 'ratio', 'group_constant')
+
+# columns of PolygonZ featureclass read for the rules (Shape token returns centroid as (x, y) tuple, used only by null rule)
+# TODO - NUTNE VYRESIT V DATECH TAKHLE TO NEJDE
+REQUIRED_COLUMNS = ["OBJECTID", "RUIAN_IBO", "ID_SEG", "ID_PLO", 'PATA_VYSKA', 'HREBEN_VYSKA', 'ABS_VYSKA', 'HORIZ_VYSKA',
+                    'STRECHA_KOD', 'PATA_SEG_VYSKA', 'ABS_SEG_VYSKA', 'PLOCHA_KOD', 'CAST_OBJEKTU', 'Shape_Area', 'Shape', 'Shape_Length']
+
+# compiled rules of already loaded rule files {(path, mtime): rules}
+_compiled_cache = {}
+
+
+def resolve_column(columns: dict, column) -> str:
+    '''
+    Returns column name - for list of alternative names (e.g. ["HORIZ_VYSKA", "RIMSA_VYSKA"]) first one present in columns.
+    '''
+    if isinstance(column, str):
+        return column
+    for alternative in column:
+        if alternative in columns:
+            return alternative
+    return column[-1]
+
+
+def check_codelist(values: np.ndarray, start: int, stop: int) -> np.ndarray:
+    '''
+    Mask of values which are not whole numbers in range start - stop (NULL values included).
+    '''
+    with np.errstate(invalid='ignore'):
+        return ~((values >= start) & (values <= stop) & (values == np.floor(values)))
+
+
+def check_rounded(op: Callable, first: np.ndarray, second: np.ndarray, ndigits: int) -> np.ndarray:
+    '''
+    Mask of op(round(first, ndigits), round(second, ndigits)) - rounded values are compared as whole numbers of 10 ** -ndigits,
+    python round is used only for values lying (almost) exactly half way, where scaling by 10 ** ndigits could change the result.
+    '''
+    scale = 10 ** ndigits
+    first = np.broadcast_to(first, np.broadcast(first, second).shape)
+    second = np.broadcast_to(second, first.shape)
+    with np.errstate(invalid='ignore'):
+        first_scaled = first * scale
+        second_scaled = second * scale
+        result = op(np.rint(first_scaled), np.rint(second_scaled))
+        half_way = (np.abs(first_scaled - np.floor(first_scaled) - 0.5) < 1e-6) | (np.abs(second_scaled - np.floor(second_scaled) - 0.5) < 1e-6)
+    for i in np.flatnonzero(half_way):
+        result[i] = op(round(float(first[i]), ndigits), round(float(second[i]), ndigits))
+    return result
+
+
+def group_order(keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    '''
+    Sorts rows by group keys - returns (order of rows, start of every group in sorted order).
+    '''
+    order = np.argsort(keys, kind='stable')
+    if len(keys) == 0:
+        return order, np.empty(0, dtype=np.int64)
+    sorted_keys = keys[order]
+    starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+    return order, starts
+
+
+def check_group_constant(values: np.ndarray, order: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    '''
+    Mask of rows of groups in which values are not constant (min != max per group, or NULL mixed with values).
+    '''
+    mask = np.zeros(len(values), dtype=bool)
+    if len(values) == 0:
+        return mask
+
+    sorted_values = values[order]
+    nulls = np.isnan(sorted_values)
+    sizes = np.diff(np.r_[starts, len(values)])
+    with np.errstate(invalid='ignore'):
+        mins = np.fmin.reduceat(sorted_values, starts)
+        maxs = np.fmax.reduceat(sorted_values, starts)
+        null_counts = np.add.reduceat(nulls, starts)
+        inconsistent = (mins < maxs) | ((null_counts > 0) & (null_counts < sizes))
+
+    mask[order] = np.repeat(inconsistent, sizes)
+    return mask
+
+
+def _operand(rule: dict, key: str) -> Callable:
+    '''
+    Compiles operand of rule - column name, list of alternative column names or number.
+    '''
+    operand = rule[key]
+    if isinstance(operand, (int, float)):
+        return lambda columns, memo: operand
+    return lambda columns, memo: columns[resolve_column(columns, operand)]
+
+
+def _columns_of(rule: dict) -> List:
+    '''
+    Returns columns (or lists of alternative columns) used by rule.
+    '''
+    used = []
+    for key in ('left', 'right', 'column', 'group'):
+        if isinstance(rule.get(key), (str, list)):
+            used.append(rule[key])
+    used.extend(rule.get('numerator', []) + rule.get('denominator', []))
+    return used
+
+
+def compile_rule(rule: dict) -> Callable:
+    '''
+    Compiles one rule definition into predicate predicate(columns, memo) -> mask. Intermediate results are shared between predicates thru memo.
+    '''
+    rule_type = rule.get('type')
+
+    if rule_type == 'compare':
+        op = OPERATORS[rule['op']]
+        left = _operand(rule, 'left')
+        right = _operand(rule, 'right') if 'right' in rule else _operand(rule, 'value')
+        ndigits = rule.get('round')
+
+        def predicate(columns, memo):
+            with np.errstate(invalid='ignore'):
+                if ndigits is None:
+                    return op(left(columns, memo), right(columns, memo))
+                return check_rounded(op, left(columns, memo), right(columns, memo), ndigits)
+        return predicate
+
+    if rule_type == 'codelist':
+        column, start, stop = rule['column'], rule['start'], rule['stop']
+        return lambda columns, memo: check_codelist(columns[resolve_column(columns, column)], start, stop)
+
+    if rule_type == 'ratio':
+        op = OPERATORS[rule['op']]
+        value = rule['value']
+        numerator, denominator = rule['numerator'], rule['denominator']
+
+        def predicate(columns, memo):
+            names = tuple(resolve_column(columns, col) for col in numerator + denominator)
+            key = ('ratio', names)
+            if key not in memo:
+                a, b, c, d = (columns[name] for name in names)
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    memo[key] = (a - b) / (c - d)
+            with np.errstate(invalid='ignore'):
+                return op(memo[key], value)
+        return predicate
+
+    if rule_type == 'group_constant':
+        column, group = rule['column'], rule['group']
+
+        def predicate(columns, memo):
+            # rows are sorted by group only once for all group rules
+            key = ('group', resolve_column(columns, group))
+            if key not in memo:
+                memo[key] = group_order(columns[key[1]])
+            return check_group_constant(columns[resolve_column(columns, column)], *memo[key])
+        return predicate
+
+    raise ValueError(f'Unknown type of attribute rule {rule.get("name")}: {rule_type}, use one of {RULE_TYPES}')
+
+
+def compile_rules(definitions: dict) -> List[dict]:
+    '''
+    Compiles enabled rule definitions (parsed rule file) into list of {name, predicate, id_field, check_nulls, optional, columns}.
+    '''
+    compiled = []
+    for rule in definitions.get('rules', []):
+        if not rule.get('enabled', True):
+            continue
+        if 'name' not in rule:
+            raise ValueError(f'Attribute rule {rule} has no name')
+        if rule.get('type') == 'ratio' and (len(rule.get('numerator', [])) != 2 or len(rule.get('denominator', [])) != 2):
+            raise ValueError(f'Ratio rule {rule["name"]} needs two columns in numerator and denominator')
+        if 'op' in rule and rule['op'] not in OPERATORS:
+            raise ValueError(f'Unknown operator of attribute rule {rule["name"]}: {rule["op"]}')
+
+        compiled.append({
+            'name': rule['name'],
+            'predicate': None if rule.get('type') == 'null' else compile_rule(rule),
+            'id_field': rule.get('id_field', 'ID_PLO'),
+            'check_nulls': rule.get('check_nulls', rule.get('type') == 'null'),
+            'optional': rule.get('optional', False),
+            'columns': _columns_of(rule),
+        })
+
+    return compiled
+
+
+def load_rules(rules_path: str) -> List[dict]:
+    '''
+    Returns compiled rules of given rule file (.json), compiled rules are cached until the file changes.
+    '''
+    key = (os.path.abspath(rules_path), os.path.getmtime(rules_path))
+    if key not in _compiled_cache:
+        with open(rules_path) as f:
+            _compiled_cache[key] = compile_rules(json.load(f))
+    return _compiled_cache[key]
+
+
+def evaluate_rules(rules: List[dict], columns: Dict[str, np.ndarray]) -> List[Tuple[str, np.ndarray, str]]:
+    '''
+    Evaluates all compiled rules over columns in one pass - returns list of (rule name, mask of faulty features, id field).
+    Rules with check_nulls false are evaluated only for features without NULL values.
+    '''
+    null_masks = {col: null_mask(values) for col, values in columns.items()}
+    no_null = ~np.logical_or.reduce(list(null_masks.values()))
+    memo = {}
+
+    conds = []
+    for rule in rules:
+        if rule['predicate'] is None:
+            # null rule expands to every column
+            conds.extend((rule['name'].format(column=col), mask, rule['id_field']) for col, mask in null_masks.items())
+            continue
+
+        missing = [col for col in rule['columns'] if resolve_column(columns, col) not in columns]
+        if missing:
+            if rule['optional']:
+                continue
+            raise ValueError(f'Attribute rule {rule["name"]} needs missing columns {missing}')
+
+        mask = rule['predicate'](columns, memo)
+        conds.append((rule['name'], mask if rule['check_nulls'] else no_null & mask, rule['id_field']))
+
+    return conds
@@ -0,0 +1,37 @@
+import numpy as np
+from typing import (Dict, Iterable, List)
+
+
+def to_column(values: list) -> np.ndarray:
+    '''
+    Converts list of values of one column into numpy array - numeric columns as float (NULL -> nan), others (e.g. Shape) as object array.
+    '''
+    try:
+        column = np.array(values, dtype=float)
+        if column.ndim == 1:
+            return column
+    except (TypeError, ValueError):
+        pass
+
+    column = np.empty(len(values), dtype=object)
+    for i, val in enumerate(values):
+        column[i] = val
+    return column
+
+
+def cursor_to_columns(cursor: Iterable[tuple], cols: List[str]) -> Dict[str, np.ndarray]:
+    '''
+    Reads rows of cursor into dict {column name: numpy array}.
+    '''
+    rows = list(cursor)
+    values = list(zip(*rows)) if rows else [() for _ in cols]
+    return {col: to_column(list(col_values)) for col, col_values in zip(cols, values)}
+
+
+def null_mask(column: np.ndarray) -> np.ndarray:
+    '''
+    Returns boolean mask of NULL values of given column.
+    '''
+    if column.dtype == object:
+        return np.array([val is None for val in column], dtype=bool)
+    return np.isnan(column)
@@ -0,0 +1,92 @@
+import numpy as np
+from toolbox_utils.fc_cache import read_geometry
+from toolbox_utils.geometry_arrays import feature_vertex_offsets, segment_index
+from toolbox_utils.pyramid import MinMaxPyramid
+from toolbox_utils.raster import open_raster
+from toolbox_utils.sampling import bilinear_sample
+from toolbox_utils.zonal import feature_zonal_statistics
+
+
+def base_table(fc: str, key_field: str, gdb_path: str = None) -> dict:
+    '''
+    Reads geometry and attributes needed for comparison with DMR (cached) - one read shared by zonal and vertex statistics and content hashes.
+    '''
+    return read_geometry(fc, ['PLOCHA_KOD', key_field, 'ID_SEG', 'PATA_SEG_VYSKA'], gdb_path)
+
+
+def compute_zonal_statistics(fc: str, key_field: str, ground_dmr, gdb_path: str = None, use_pyramid: bool = False, only_keys: np.ndarray = None,
+                             table: dict = None) -> dict:
+    '''
+    Computes MIN, MAX, MEAN of DMR under every base polygon (PLOCHA_KOD = 4) per key_field - polygons are rasterized onto DMR grid (cell centers) in-process.
+    With use_pyramid interiors of polygons are answered from min/max pyramid of DMR and only border cells are read. With only_keys just bases of given keys are computed.
+    Already read arrays (base_table) can be passed as table, ground_dmr can be opened raster (e.g. synthetic ArrayRaster).
+    Returns columns of zonal table {key_field, COUNT, AREA, MIN, MAX, MEAN}, zones without any DMR cell are left out as in ZonalStatisticsAsTable.
+    '''
+    if table is None:
+        table = base_table(fc, key_field, gdb_path)
+    bases = (table['PLOCHA_KOD'] == 4) & ~np.isnan(table[key_field])
+    if only_keys is not None:
+        bases &= np.isin(table[key_field], only_keys)
+
+    keys, inverse = np.unique(table[key_field][bases], return_inverse=True)
+    feature_zones = np.full(len(bases), -1, dtype=np.int64)
+    feature_zones[bases] = inverse.reshape(-1)
+
+    raster = open_raster(ground_dmr)
+    pyramid = MinMaxPyramid.for_raster(raster) if use_pyramid else None
+    stats = feature_zonal_statistics(table, feature_zones, len(keys), raster, pyramid)
+    covered = stats['COUNT'] > 0
+    return {key_field: keys[covered], **{name: column[covered] for name, column in stats.items()}}
+
+
+def segment_gaps(seg_ids: np.ndarray, gaps: np.ndarray) -> dict:
+    '''
+    Reduces height gaps of vertices into columns of table of segments {ID_SEG, COUNT, MIN_GAP, MAX_GAP}, vertices without gap or segment are skipped.
+    '''
+    has_gap = ~np.isnan(gaps) & ~np.isnan(seg_ids)
+    ids, index = np.unique(seg_ids[has_gap], return_inverse=True)
+    index = index.reshape(-1)
+    segments = {'ID_SEG': ids, 'COUNT': np.bincount(index, minlength=len(ids)).astype(float),
+                'MIN_GAP': np.full(len(ids), np.inf), 'MAX_GAP': np.full(len(ids), -np.inf)}
+    np.minimum.at(segments['MIN_GAP'], index, gaps[has_gap])
+    np.maximum.at(segments['MAX_GAP'], index, gaps[has_gap])
+    return segments
+
+
+def compute_vertex_statistics(fc: str, key_field: str, ground_dmr, gdb_path: str = None, only_keys: np.ndarray = None, table: dict = None) -> tuple:
+    '''
+    Samples DMR by bilinear interpolation at every vertex of base polygons (PLOCHA_KOD = 4) and computes height gaps PATA_SEG_VYSKA - DMR.
+    With only_keys just bases of given keys are sampled. Already read arrays (base_table) can be passed as table, ground_dmr can be opened raster.
+    Returns columns of (table per key_field {key_field, COUNT, MIN, MAX, MEAN} of DMR at vertices - same form as zonal table,
+    table of vertices {key_field, ID_SEG, X, Y, DMR_Z, GAP}, table of segments {ID_SEG, COUNT, MIN_GAP, MAX_GAP}).
+    '''
+    if table is None:
+        table = base_table(fc, key_field, gdb_path)
+    vertex_features = segment_index(feature_vertex_offsets(table))
+    bases = (table['PLOCHA_KOD'] == 4) & ~np.isnan(table[key_field])
+    if only_keys is not None:
+        bases &= np.isin(table[key_field], only_keys)
+
+    # closing vertex of ring repeats the first one
+    selected = bases[vertex_features]
+    selected[table['ring_offsets'][1:] - 1] = False
+    vertex_features = vertex_features[selected]
+    coords = table['coords'][selected]
+
+    dmr_z = bilinear_sample(open_raster(ground_dmr), coords[:, 0], coords[:, 1])
+    gap = table['PATA_SEG_VYSKA'][vertex_features] - dmr_z
+    valid = ~np.isnan(dmr_z)
+
+    keys, zones = np.unique(table[key_field][vertex_features][valid], return_inverse=True)
+    zones = zones.reshape(-1)
+    count = np.bincount(zones, minlength=len(keys)).astype(float)
+    base_stats = {key_field: keys, 'COUNT': count,
+                  'MIN': np.full(len(keys), np.inf), 'MAX': np.full(len(keys), -np.inf),
+                  'MEAN': np.bincount(zones, weights=dmr_z[valid], minlength=len(keys)) / count}
+    np.minimum.at(base_stats['MIN'], zones, dmr_z[valid])
+    np.maximum.at(base_stats['MAX'], zones, dmr_z[valid])
+
+    vertices = {key_field: table[key_field][vertex_features], 'ID_SEG': table['ID_SEG'][vertex_features],
+                'X': coords[:, 0], 'Y': coords[:, 1], 'DMR_Z': dmr_z, 'GAP': gap}
+
+    return base_stats, vertices, segment_gaps(vertices['ID_SEG'], gap)
@@ -0,0 +1,55 @@
+from typing import (Dict, Iterable, List, Tuple)
+from toolbox_utils.hyperloglog import HyperLogLog
+
+
+def scan_columns(rows: Iterable[tuple], oid_index: int, check_indexes: List[int], count_indexes: List[int] = (), approximate_indexes: List[int] = ()) -> Tuple[List[Dict], Dict[int, int]]:
+    '''
+    Single streaming pass over rows (e.g. SearchCursor).
+    For every checked column (check_indexes) collects dict {duplicated value: [OBJECTIDs]} - multiplicity of value is length of its OBJECTID list.
+    For every statistics column (count_indexes) counts distinct values exactly, for columns in approximate_indexes with HyperLogLog sketch in bounded memory.
+    Returns (duplicates per checked column, {column index: number of distinct values}).
+    '''
+    # first OBJECTID of every value seen so far, per checked column
+    seen = [{} for _ in check_indexes]
+    duplicates = [{} for _ in check_indexes]
+    # checked columns already know their distinct values
+    counters = {col_i: (HyperLogLog() if col_i in approximate_indexes else set())
+                for col_i in count_indexes if col_i not in check_indexes}
+    adders = [(col_i, c.add) for col_i, c in counters.items()]
+
+    for row in rows:
+        oid = row[oid_index]
+        for i, col_i in enumerate(check_indexes):
+            val = row[col_i]
+            first_oid = seen[i].setdefault(val, oid)
+            if first_oid != oid:
+                dups = duplicates[i].get(val)
+                if dups is None:
+                    duplicates[i][val] = [first_oid, oid]
+                else:
+                    dups.append(oid)
+        for col_i, add in adders:
+            add(row[col_i])
+
+    distinct_counts = {col_i: len(s) for col_i, s in zip(check_indexes, seen)}
+    for col_i, c in counters.items():
+        distinct_counts[col_i] = len(c) if isinstance(c, set) else c.count()
+
+    return duplicates, distinct_counts
+
+
+def find_duplicates(rows: Iterable[tuple], oid_index: int, check_indexes: List[int]) -> List[Dict]:
+    '''
+    Single pass hash based duplicate detection. For every checked column (check_indexes) returns dict {duplicated value: [OBJECTIDs]}.
+    '''
+    return scan_columns(rows, oid_index, check_indexes)[0]
+
+
+def format_duplicates(duplicates: Dict, id_field: str) -> List[str]:
+    '''
+    Returns list of strings - first one with all duplicate values of id_field (parsable by sql_generator), then one line per value with its multiplicity and OBJECTIDs.
+    '''
+    lines = [f'DUPLICATE VALUES OF {id_field}: {list(duplicates.keys())}']
+    for val, oids in duplicates.items():
+        lines.append(f'{id_field} {val} occurs {len(oids)}x - OBJECTID {tuple(oids)}')
+    return lines
@@ -0,0 +1,302 @@
+import os
+import glob
+import hashlib
+import argparse
+import numpy as np
+from typing import (Callable, Dict, List)
+from toolbox_utils.columnar import cursor_to_columns
+from toolbox_utils.geometry_arrays import wkb_to_arrays
+from toolbox_utils.messages_print import log_it
+
+# cache entries are plain numpy arrays (never pickled objects) - keep the directory private to the user
+CACHE_DIR = os.environ.get('KAM_TOOLBOX_CACHE_DIR', os.path.join(
+    os.environ.get('LOCALAPPDATA', os.path.expanduser('~')), 'kam_toolbox_cache'))
+CACHE_SIZE_BUDGET = int(os.environ.get('KAM_TOOLBOX_CACHE_SIZE', 4 * 1024 ** 3))
+CACHE_ENABLED = os.environ.get('KAM_TOOLBOX_CACHE', '1') != '0'
+# suffix of stored NULL mask of object column
+NULL_SUFFIX = '__null'
+
+
+def _digest(*parts) -> str:
+    return hashlib.sha1('\x00'.join(map(str, parts)).encode('utf-8')).hexdigest()[:16]
+
+
+def gdb_fingerprint(gdb_path: str) -> str:
+    '''
+    Fingerprint of geodatabase - path, names, sizes and modification times of all its files (lock files of readers are ignored).
+    Any edit of the geodatabase changes the fingerprint.
+    '''
+    files = []
+    for subdir, dirs, names in os.walk(gdb_path):
+        for name in names:
+            if name.endswith('.lock'):
+                continue
+            stat = os.stat(os.path.join(subdir, name))
+            files.append((os.path.relpath(os.path.join(subdir, name), gdb_path), stat.st_size, stat.st_mtime_ns))
+    return _digest(os.path.abspath(gdb_path), *sorted(files))
+
+
+def entry_path(gdb_path: str, fc: str, kind: str, fields: List[str], cache_dir: str = None) -> str:
+    '''
+    Path of cache entry - {gdb}_{featureclass and fields}_{fingerprint}.npz, stale entries of the same featureclass differ only in fingerprint.
+    '''
+    source = f'{_digest(os.path.abspath(gdb_path).lower())}_{_digest(fc, kind, *fields)}'
+    return os.path.join(cache_dir or CACHE_DIR, f'{source}_{gdb_fingerprint(gdb_path)}.npz')
+
+
+def load_entry(path: str) -> Dict[str, np.ndarray]:
+    '''
+    Loads cache entry and marks it as recently used, returns None for missing or broken entry.
+    '''
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            arrays = decode_arrays({name: data[name] for name in data.files})
+        os.utime(path)
+        return arrays
+    except (OSError, ValueError, EOFError):
+        return None
+
+
+def encode_arrays(arrays: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    '''
+    Converts object columns into fixed-width string, integer or float arrays with NULL mask ({name}__null) so entries can be loaded without pickle.
+    Columns of coordinate tuples (Shape token) are stored as float (n, k) arrays.
+    Raises TypeError for columns of other values (e.g. dates), such arrays are not cached.
+    '''
+    encoded = {}
+    for name, array in arrays.items():
+        if array.dtype != object:
+            if array.dtype.hasobject:
+                raise TypeError(f'{name} cant be stored without pickle')
+            encoded[name] = array
+            continue
+
+        nulls = np.array([val is None for val in array], dtype=bool)
+        values = [val for val in array if val is not None]
+        if all(isinstance(val, str) for val in values):
+            encoded[name] = np.array([val if val is not None else '' for val in array], dtype=str)
+        elif all(isinstance(val, int) and not isinstance(val, bool) for val in values):
+            encoded[name] = np.array([val if val is not None else 0 for val in array], dtype=np.int64)
+        elif all(isinstance(val, (int, float)) and not isinstance(val, bool) for val in values):
+            encoded[name] = np.array([val if val is not None else np.nan for val in array], dtype=float)
+        elif values and _is_point_column(values):
+            encoded[name] = np.array([val if val is not None else (np.nan,) * len(values[0]) for val in array], dtype=float)
+        else:
+            raise TypeError(f'{name} cant be stored without pickle')
+        encoded[name + NULL_SUFFIX] = nulls
+    return encoded
+
+
+def _is_point_column(values: list) -> bool:
+    '''
+    True for values which are numeric tuples of the same length (e.g. (x, y) of Shape token).
+    '''
+    size = len(values[0]) if isinstance(values[0], tuple) else 0
+    return size > 0 and all(isinstance(val, tuple) and len(val) == size and
+                            all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in val) for val in values)
+
+
+def decode_arrays(arrays: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    '''
+    Restores object columns stored by encode_arrays - original python values with None for NULL.
+    '''
+    decoded = {}
+    for name, array in arrays.items():
+        if name.endswith(NULL_SUFFIX):
+            continue
+        if name + NULL_SUFFIX not in arrays:
+            decoded[name] = array
+            continue
+
+        column = np.empty(len(array), dtype=object)
+        if array.ndim == 2:
+            for i, val in enumerate(array.tolist()):
+                column[i] = tuple(val)
+        else:
+            column[:] = array.tolist()
+        column[arrays[name + NULL_SUFFIX]] = None
+        decoded[name] = column
+    return decoded
+
+
+def store_entry(path: str, arrays: Dict[str, np.ndarray], size_budget: int = None) -> None:
+    '''
+    Stores arrays into cache entry (atomic replace - parallel workers can store the same entry), removes stale entries of the same source and evicts least recently used entries over size budget.
+    '''
+    cache_dir = os.path.dirname(path)
+    os.makedirs(cache_dir, exist_ok=True)
+
+    encoded = encode_arrays(arrays)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, **encoded)
+    os.replace(tmp_path, path)
+
+    source = os.path.basename(path).rsplit('_', 1)[0]
+    for stale in glob.glob(os.path.join(cache_dir, f'{source}_*.npz')):
+        if stale != path:
+            _remove(stale)
+
+    evict(cache_dir, CACHE_SIZE_BUDGET if size_budget is None else size_budget)
+
+
+def _remove(path: str) -> bool:
+    try:
+        os.remove(path)
+        return True
+    except OSError:
+        # entry can be opened by another process
+        return False
+
+
+def evict(cache_dir: str = None, size_budget: int = None) -> None:
+    '''
+    Removes least recently used entries until total size of cache fits into size_budget (bytes).
+    '''
+    size_budget = CACHE_SIZE_BUDGET if size_budget is None else size_budget
+    entries = []
+    for path in glob.glob(os.path.join(cache_dir or CACHE_DIR, '*.npz')):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= size_budget:
+            break
+        if _remove(path):
+            total -= size
+
+
+def invalidate(gdb_path: str = None, cache_dir: str = None) -> int:
+    '''
+    Removes all cache entries of given geodatabase (all entries without gdb_path), returns number of removed entries.
+    '''
+    pattern = f'{_digest(os.path.abspath(gdb_path).lower())}_*.npz' if gdb_path else '*.npz'
+    return sum(_remove(path) for path in glob.glob(os.path.join(cache_dir or CACHE_DIR, pattern)))
+
+
+def cached_read(gdb_path: str, fc: str, kind: str, fields: List[str], reader: Callable[[], Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+    '''
+    Returns arrays of featureclass fc from cache entry valid for current state of gdb_path, reader is called (and its result stored) only when the entry is missing or stale.
+    kind distinguishes different readers of the same fields. Without gdb_path or with disabled cache reader is always called.
+    '''
+    if not CACHE_ENABLED or not gdb_path:
+        return reader()
+
+    path = entry_path(gdb_path, fc, kind, fields)
+    arrays = load_entry(path)
+    if arrays is not None:
+        log_it(f'{fc} loaded from cache {path}', 'info', __name__)
+        return arrays
+
+    arrays = reader()
+    try:
+        store_entry(path, arrays)
+    except TypeError as err:
+        # columns which cant be stored without pickle - featureclass is read again next time
+        log_it(f'{fc} is not cacheable: {err}', 'info', __name__)
+    except OSError as err:
+        log_it(f'{fc} couldnt be cached: {err}', 'warning', __name__)
+    return arrays
+
+
+def read_columns(fc: str, fields: List[str], gdb_path: str = None, raw: bool = False) -> Dict[str, np.ndarray]:
+    '''
+    Reads fields of featureclass (cached) into {field: numpy array} - numeric columns as float (cursor_to_columns), with raw as object arrays of original values.
+    '''
+    def reader():
+        import arcpy
+        with arcpy.da.SearchCursor(fc, fields) as cursor:
+            return _rows_to_columns(list(cursor), fields, raw)
+
+    return cached_read(gdb_path, fc, 'raw' if raw else 'columns', fields, reader)
+
+
+def read_geometry(fc: str, fields: List[str], gdb_path: str = None, raw: bool = False) -> Dict[str, np.ndarray]:
+    '''
+    Single pass over featureclass (cached) - flat vertex arrays of PolygonZ WKB geometries (wkb_to_arrays) together with columns of fields.
+    '''
+    def reader():
+        import arcpy
+        rows = []
+
+        def split_rows(cursor):
+            # geometry is collected as WKB while rows come off the cursor, attributes are kept aside
+            for row in cursor:
+                rows.append(row[1:])
+                yield row[0]
+
+        with arcpy.da.SearchCursor(fc, ["SHAPE@WKB"] + fields) as cursor:
+            arrays = _wkb_to_arrays(fc, split_rows(cursor))
+        arrays.update(_rows_to_columns(rows, fields, raw))
+        return arrays
+
+    return cached_read(gdb_path, fc, 'raw_wkb_geometry' if raw else 'wkb_geometry', fields, reader)
+
+
+def read_mesh(fc: str, fields: List[str], gdb_path: str = None) -> Dict[str, np.ndarray]:
+    '''
+    Single pass over multipatch featureclass (cached) - flat vertex arrays of polygons (triangles) of WKB geometries (wkb_to_arrays) together with columns of fields.
+    '''
+    def reader():
+        import arcpy
+        rows = []
+
+        def split_rows(cursor):
+            for row in cursor:
+                rows.append(row[1:])
+                yield row[0]
+
+        with arcpy.da.SearchCursor(fc, ["SHAPE@WKB"] + fields) as cursor:
+            arrays = _wkb_to_arrays(fc, split_rows(cursor))
+        arrays.update(_rows_to_columns(rows, fields, False))
+        return arrays
+
+    return cached_read(gdb_path, fc, 'mesh', fields, reader)
+
+
+def _wkb_to_arrays(fc: str, wkbs) -> Dict[str, np.ndarray]:
+    '''
+    wkb_to_arrays with featureclass named in the error - geometries without Z cant be checked.
+    '''
+    try:
+        return wkb_to_arrays(wkbs)
+    except ValueError as err:
+        log_it(f'{fc} has invalid geometry - {err}', 'error', __name__)
+        raise
+
+
+def _rows_to_columns(rows: List[tuple], fields: List[str], raw: bool) -> Dict[str, np.ndarray]:
+    '''
+    Converts rows into columns - numeric as float (cursor_to_columns), with raw as object arrays of original values.
+    '''
+    if not raw:
+        return cursor_to_columns(rows, fields)
+    columns = {field: np.empty(len(rows), dtype=object) for field in fields}
+    for j, row in enumerate(rows):
+        for field, val in zip(fields, row):
+            columns[field][j] = val
+    return columns
+
+
+def main() -> None:
+    '''
+    Command line maintenance of the cache - python -m toolbox_utils.fc_cache --invalidate [GDB]
+    '''
+    parser = argparse.ArgumentParser(description='Cache of featureclasses read by the toolbox')
+    parser.add_argument('--cache-dir', default=CACHE_DIR)
+    parser.add_argument('--invalidate', nargs='?', const='', metavar='GDB', help='remove entries of given gdb (all entries without GDB)')
+    parser.add_argument('--evict', type=int, metavar='BYTES', help='remove least recently used entries over given size')
+    args = parser.parse_args()
+
+    if args.invalidate is not None:
+        print(f'Removed {invalidate(args.invalidate or None, args.cache_dir)} entries')
+    if args.evict is not None:
+        evict(args.cache_dir, args.evict)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+import struct
+import numpy as np
+from typing import (Dict, Iterable, List)
+
+# OGC WKB geometry types (without Z/M flags) - Polygon, Triangle
+WKB_POLYGONS = (3, 17)
+# MultiPolygon, GeometryCollection, PolyhedralSurface, TIN
+WKB_COLLECTIONS = (6, 7, 15, 16)
+# unpacking of uint32 by byte order
+_UINT32 = {'<': struct.Struct('<I').unpack_from, '>': struct.Struct('>I').unpack_from}
+
+
+def _read_wkb(buf: bytes, offset: int, base: int, rings: List[tuple], polygon_rings: List[int]) -> int:
+    '''
+    Walks one WKB geometry from offset - appends (base + offset, number of points, dimensions, byte order) of every ring and number of rings of every polygon.
+    Returns offset behind the geometry, raises ValueError for geometry without polygons or rings without Z.
+    '''
+    order = '<' if buf[offset] == 1 else '>'
+    unpack = _UINT32[order]
+    geom_type = unpack(buf, offset + 1)[0]
+    num_items = unpack(buf, offset + 5)[0]
+    offset += 9
+    # ISO (1000 Z, 2000 M, 3000 ZM) and EWKB (0x80000000 Z, 0x40000000 M) flags
+    base_type = (geom_type & 0x0FFFFFFF) % 1000
+    iso = (geom_type & 0x0FFFFFFF) // 1000
+    has_z = iso in (1, 3) or bool(geom_type & 0x80000000)
+    dims = 2 + has_z + (iso in (2, 3) or bool(geom_type & 0x40000000))
+
+    if base_type in WKB_POLYGONS:
+        point_size = dims * 8
+        num_rings = 0
+        for _ in range(num_items):
+            num_points = unpack(buf, offset)[0]
+            # empty rings and polygons are left out as in parts of arcpy geometries
+            if num_points:
+                if not has_z:
+                    raise ValueError(f'WKB geometry type {geom_type} has no Z coordinates')
+                rings.append((base + offset + 4, num_points, dims, order))
+                num_rings += 1
+            offset += 4 + num_points * point_size
+        if num_rings:
+            polygon_rings.append(num_rings)
+    elif base_type in WKB_COLLECTIONS:
+        for _ in range(num_items):
+            offset = _read_wkb(buf, offset, base, rings, polygon_rings)
+    else:
+        raise ValueError(f'WKB geometry type {geom_type} has no polygons')
+    return offset
+
+
+def wkb_to_arrays(wkbs: Iterable[bytes]) -> Dict[str, np.ndarray]:
+    '''
+    Converts WKB geometries (SHAPE@WKB of PolygonZ or multipatch - polygons, triangles and their collections, None for missing geometry) into flat arrays (CSR-like layout):
+    coords - (number of vertices, 3) XYZ of all vertices, geometries without Z raise ValueError (M values are dropped)
+    ring_offsets - start of every ring in coords (+ end), exterior ring of polygon is followed by its interior rings
+    part_offsets - start of every part (polygon, triangle) in rings (+ end)
+    feature_offsets - start of every feature in parts (+ end)
+    Only headers are walked in python, points of all rings are gathered from joined buffers by numpy at once.
+    '''
+    buffers = []
+    rings = []
+    polygon_rings = []
+    feature_offsets = [0]
+    size = 0
+
+    for i, wkb in enumerate(wkbs):
+        if wkb is not None:
+            buf = bytes(wkb)
+            try:
+                _read_wkb(buf, 0, size, rings, polygon_rings)
+            except ValueError as err:
+                raise ValueError(f'feature {i}: {err}') from err
+            buffers.append(buf)
+            size += len(buf)
+        feature_offsets.append(len(polygon_rings))
+
+    ring_offsets = np.r_[0, np.cumsum([num_points for _, num_points, _, _ in rings], dtype=np.int64)]
+    coords = np.zeros((ring_offsets[-1], 3))
+    blob = np.frombuffer(b''.join(buffers), dtype=np.uint8)
+
+    ring_starts = np.array([offset for offset, _, _, _ in rings], dtype=np.int64)
+    ring_layouts = np.array([dims * 2 + (order == '<') for _, _, dims, order in rings], dtype=np.int64)
+    for layout in np.unique(ring_layouts):
+        dims, order = layout // 2, '<' if layout % 2 else '>'
+        selected = np.flatnonzero(ring_layouts == layout)
+        counts = np.diff(ring_offsets)[selected]
+        within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        # every point is window of dims doubles starting at arbitrary byte of the blob
+        windows = np.lib.stride_tricks.as_strided(blob, shape=(len(blob) - dims * 8 + 1, dims * 8), strides=(1, 1))
+        points = windows[np.repeat(ring_starts[selected], counts) + within * dims * 8].view(order + 'f8')
+        coords[np.repeat(ring_offsets[:-1][selected], counts) + within] = points[:, :3]
+
+    return {
+        'coords': coords,
+        'ring_offsets': ring_offsets,
+        'part_offsets': np.r_[0, np.cumsum(polygon_rings, dtype=np.int64)],
+        'feature_offsets': np.array(feature_offsets, dtype=np.int64),
+    }
+
+
+def segment_reduce(ufunc: np.ufunc, values: np.ndarray, offsets: np.ndarray, empty=np.nan) -> np.ndarray:
+    '''
+    Reduces values in segments given by offsets (start of every segment + end) with ufunc (e.g. np.minimum) - empty segments get value empty.
+    '''
+    starts = offsets[:-1]
+    non_empty = offsets[1:] > starts
+    result = np.full((len(starts),) + values.shape[1:], empty, dtype=np.result_type(values, type(empty)))
+    if non_empty.any():
+        result[non_empty] = ufunc.reduceat(values, starts[non_empty], axis=0)
+    return result
+
+
+def segment_index(offsets: np.ndarray) -> np.ndarray:
+    '''
+    Returns index of segment for every element of segmented array.
+    '''
+    return np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+
+
+def part_vertex_offsets(arrays: Dict[str, np.ndarray]) -> np.ndarray:
+    '''
+    Returns start of every part in coords (+ end).
+    '''
+    return arrays['ring_offsets'][arrays['part_offsets']]
+
+
+def feature_vertex_offsets(arrays: Dict[str, np.ndarray]) -> np.ndarray:
+    '''
+    Returns start of every feature in coords (+ end).
+    '''
+    return arrays['ring_offsets'][arrays['part_offsets'][arrays['feature_offsets']]]
+
+
+def feature_rings(arrays: Dict[str, np.ndarray]) -> Iterable[list]:
+    '''
+    Yields list of rings (lists of XYZ vertices) of every feature - inverse of wkb_to_arrays, input form of geometry_hash.find_geometric_duplicates.
+    '''
+    coords = arrays['coords'].tolist()
+    ring_offsets = arrays['ring_offsets'].tolist()
+    ring_bounds = arrays['part_offsets'][arrays['feature_offsets']].tolist()
+
+    for first_ring, last_ring in zip(ring_bounds[:-1], ring_bounds[1:]):
+        yield [coords[ring_offsets[ring]:ring_offsets[ring + 1]] for ring in range(first_ring, last_ring)]
@@ -0,0 +1,84 @@
+from typing import (Dict, Iterable, List, Tuple)
+
+Point = Tuple[float, float, float]
+
+
+def _canonical_ring(ring: List[Tuple[int, int, int]]) -> Tuple:
+    '''
+    Returns rotation and orientation invariant form of a closed ring - lexicographically smallest rotation of both directions.
+    '''
+    if len(ring) > 1 and ring[0] == ring[-1]:
+        ring = ring[:-1]
+    if not ring:
+        return ()
+
+    candidates = []
+    for direction in (ring, ring[::-1]):
+        smallest = min(direction)
+        for i, vertex in enumerate(direction):
+            if vertex == smallest:
+                candidates.append(tuple(direction[i:] + direction[:i]))
+
+    return min(candidates)
+
+
+def canonical_form(rings: Iterable[List[Point]], quantum: float, offset: float = 0.0) -> Tuple:
+    '''
+    Canonical form of PolygonZ feature - XYZ vertices of every ring are quantized to grid of size quantum (m) shifted by offset, rings are made rotation invariant and sorted.
+    '''
+    canonical = []
+    for ring in rings:
+        quantized = [(round((x - offset) / quantum), round((y - offset) / quantum), round((z - offset) / quantum)) for x, y, z in ring]
+        canonical.append(_canonical_ring(quantized))
+
+    return tuple(sorted(canonical))
+
+
+def geometry_hash(rings: Iterable[List[Point]], quantum: float, offset: float = 0.0) -> int:
+    '''
+    Hash of canonical form of PolygonZ feature on grid of size quantum shifted by offset.
+    '''
+    return hash(canonical_form(rings, quantum, offset))
+
+
+def _find(parents: List[int], i: int) -> int:
+    while parents[i] != i:
+        parents[i] = parents[parents[i]]
+        i = parents[i]
+    return i
+
+
+def find_geometric_duplicates(features: Iterable[Tuple[int, List[List[Point]]]], quanta: List[float]) -> List[Dict[int, List[int]]]:
+    '''
+    For every quantum returns dict {group key: [ids]} of geometries matching on grid of size quantum, ids in order of features.
+    Every feature is hashed on grid aligned with origin and on grid shifted by half of quantum - vertices closer than half of quantum
+    which straddle line of one grid share cell of the other one. Features sharing hash are verified by comparing their canonical forms
+    (no hash collisions), groups verified on either grid are joined.
+    '''
+    features = list(features)
+    tables = []
+
+    for quantum in quanta:
+        parents = list(range(len(features)))
+        for offset in (0.0, quantum / 2):
+            buckets = {}
+            for i, (_, rings) in enumerate(features):
+                buckets.setdefault(geometry_hash(rings, quantum, offset), []).append(i)
+
+            for members in buckets.values():
+                if len(members) < 2:
+                    continue
+                # only features of the same canonical form are joined
+                forms = {}
+                for i in members:
+                    forms.setdefault(canonical_form(features[i][1], quantum, offset), []).append(i)
+                for same in forms.values():
+                    for i in same[1:]:
+                        parents[_find(parents, i)] = _find(parents, same[0])
+
+        groups = {}
+        for i, (feature_id, _) in enumerate(features):
+            groups.setdefault(_find(parents, i), []).append(feature_id)
+        tables.append({root: ids for root, ids in groups.items() if len(ids) > 1})
+
+    return tables
@@ -0,0 +1,87 @@
+import numpy as np
+from typing import (Dict, Tuple)
+from toolbox_utils.geometry_arrays import feature_vertex_offsets, segment_index, segment_reduce
+
+
+def ring_closing_mask(arrays: Dict[str, np.ndarray]) -> np.ndarray:
+    '''
+    Mask of vertices which only close the ring (last vertex equal to the first one).
+    '''
+    coords = arrays['coords']
+    ring_offsets = arrays['ring_offsets']
+    mask = np.zeros(len(coords), dtype=bool)
+    starts, ends = ring_offsets[:-1], ring_offsets[1:] - 1
+    closed = (ends > starts) & np.all(coords[ends] == coords[starts], axis=1)
+    mask[ends[closed]] = True
+    return mask
+
+
+def fit_planes(arrays: Dict[str, np.ndarray], offsets: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    '''
+    Least squares plane of every segment of vertices (by default every feature) computed in batch.
+    Returns (centroids, unit normals, maximal distance of vertex from the plane) - normal is eigenvector of the smallest eigenvalue of vertex covariance.
+    '''
+    coords = arrays['coords']
+    offsets = feature_vertex_offsets(arrays) if offsets is None else offsets
+    weights = (~ring_closing_mask(arrays)).astype(float)
+    index = segment_index(offsets)
+
+    counts = segment_reduce(np.add, weights, offsets, 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        centroids = segment_reduce(np.add, coords * weights[:, None], offsets, 0.0) / counts[:, None]
+
+    # coordinates relative to centroid - also keeps precision for large S-JTSK coordinates
+    relative = coords - centroids[index]
+    weighted = relative * weights[:, None]
+    covariance = segment_reduce(np.add, weighted[:, :, None] * weighted[:, None, :], offsets, 0.0)
+    normals = np.linalg.eigh(covariance)[1][:, :, 0]
+
+    deviation = np.abs(np.einsum('ij,ij->i', relative, normals[index]))
+    max_deviation = segment_reduce(np.maximum, deviation, offsets, 0.0)
+
+    return centroids, normals, max_deviation
+
+
+def newell_normals(arrays: Dict[str, np.ndarray], offsets: np.ndarray = None) -> np.ndarray:
+    '''
+    Newell area vectors of every segment of vertices (by default every feature) - sum of cross products of edges of all its rings.
+    Length of the vector is twice the (3D) area, direction is the normal of the polygon (interior rings with opposite orientation are subtracted).
+    '''
+    coords = arrays['coords']
+    ring_offsets = arrays['ring_offsets']
+    offsets = feature_vertex_offsets(arrays) if offsets is None else offsets
+
+    # coordinates relative to first vertex of the segment keep precision of the products
+    non_empty = offsets[1:] > offsets[:-1]
+    reference = np.zeros((len(offsets) - 1, 3))
+    reference[non_empty] = coords[offsets[:-1][non_empty]]
+    relative = coords - reference[segment_index(offsets)]
+
+    following = np.arange(1, len(coords) + 1)
+    following[ring_offsets[1:] - 1] = ring_offsets[:-1]
+    x, y, z = relative.T
+    nx, ny, nz = relative[following].T
+    terms = np.column_stack(((y - ny) * (z + nz), (z - nz) * (x + nx), (x - nx) * (y + ny)))
+
+    return segment_reduce(np.add, terms, offsets, 0.0)
+
+
+def unit_vectors(vectors: np.ndarray) -> np.ndarray:
+    '''
+    Normalizes vectors to unit length, zero vectors (degenerate polygons) become nan.
+    '''
+    length = np.linalg.norm(vectors, axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(length[:, None] > 0, vectors / length[:, None], np.nan)
+
+
+def slope_and_azimuth(normals: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    '''
+    Slope (degrees from horizontal plane, 90 for vertical walls) and azimuth (degrees clockwise from north) of unit normals.
+    Normals are turned upwards first so azimuth of roof face is the direction it slopes down to, azimuth of horizontal faces is nan.
+    '''
+    nx, ny, nz = np.where(normals[:, 2:] < 0, -normals, normals).T
+    slope = np.degrees(np.arccos(np.clip(np.abs(nz), 0, 1)))
+    azimuth = np.degrees(np.arctan2(nx, ny)) % 360
+    azimuth[np.hypot(nx, ny) < 1e-9] = np.nan
+    return slope, azimuth
@@ -0,0 +1,48 @@
+import math
+
+
+MASK_64 = (1 << 64) - 1
+
+
+def _mix64(value: int) -> int:
+    '''
+    splitmix64 finalizer - spreads python hash (identity for ints) over all 64 bits.
+    '''
+    value = (value + 0x9E3779B97F4A7C15) & MASK_64
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & MASK_64
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & MASK_64
+    return value ^ (value >> 31)
+
+
+class HyperLogLog(object):
+    '''
+    HyperLogLog sketch for approximate distinct counting in bounded memory (2**precision bytes).
+    Standard error is about 1.04 / sqrt(2**precision) - 0.8 % for default precision 14.
+    '''
+
+    def __init__(self, precision: int = 14):
+        if not 4 <= precision <= 18:
+            raise ValueError('HyperLogLog precision has to be in range 4 - 18')
+        self.precision = precision
+        self.num_registers = 1 << precision
+        self.registers = bytearray(self.num_registers)
+
+    def add(self, value) -> None:
+        hashed = _mix64(hash(value) & MASK_64)
+        register_i = hashed >> (64 - self.precision)
+        remainder = hashed & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - remainder.bit_length() + 1
+        if rank > self.registers[register_i]:
+            self.registers[register_i] = rank
+
+    def count(self) -> int:
+        m = self.num_registers
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+
+        # small range correction - linear counting while there are empty registers
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)
+
+        return int(round(estimate))
@@ -0,0 +1,59 @@
+import os
+import re
+import sqlite3
+from typing import (Dict, Iterable, List)
+
+# delivery date suffix of locality folder (Lokalita_00_YYYY_MM_DD)
+DELIVERY_DATE = re.compile(r'_\d{4}_\d{2}_\d{2}$')
+
+
+def locality_key(location_folder: str) -> str:
+    '''
+    Stable identifier of locality in the index - folder name without delivery date, re-delivered locality replaces its previous ids.
+    '''
+    return DELIVERY_DATE.sub('', os.path.basename(os.path.normpath(location_folder)))
+
+
+def open_id_index(index_path: str) -> sqlite3.Connection:
+    '''
+    Opens (creates if needed) on-disk SQLite index of IDs (ID_SEG, ID_PLO, RUIAN_IBO) of already checked localities.
+    '''
+    conn = sqlite3.connect(index_path)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS ids (
+            id_field TEXT NOT NULL,
+            value INTEGER NOT NULL,
+            locality TEXT NOT NULL,
+            PRIMARY KEY (id_field, value, locality)
+        ) WITHOUT ROWID''')
+    return conn
+
+
+def find_collisions(conn: sqlite3.Connection, locality: str, id_field: str, values: Iterable[int]) -> Dict[int, List[str]]:
+    '''
+    Bulk lookup - returns {value: [other localities]} for values of id_field which were already indexed in any other locality.
+    '''
+    conn.execute('CREATE TEMP TABLE IF NOT EXISTS lookup (value INTEGER PRIMARY KEY)')
+    conn.execute('DELETE FROM lookup')
+    conn.executemany('INSERT OR IGNORE INTO lookup VALUES (?)', ((v,) for v in values))
+
+    collisions = {}
+    for value, other_locality in conn.execute('''
+            SELECT ids.value, ids.locality FROM lookup
+            JOIN ids ON ids.id_field = ? AND ids.value = lookup.value
+            WHERE ids.locality != ?
+            ORDER BY ids.value, ids.locality''', (id_field, locality)):
+        collisions.setdefault(value, []).append(other_locality)
+
+    conn.execute('DELETE FROM lookup')
+    return collisions
+
+
+def update_locality(conn: sqlite3.Connection, locality: str, id_field: str, values: Iterable[int]) -> None:
+    '''
+    Incrementally (re)indexes values of id_field for given locality - previous entries of the locality are replaced.
+    '''
+    with conn:
+        conn.execute('DELETE FROM ids WHERE id_field = ? AND locality = ?', (id_field, locality))
+        conn.executemany('INSERT OR IGNORE INTO ids VALUES (?, ?, ?)',
+                         ((id_field, v, locality) for v in values))
@@ -0,0 +1,67 @@
+import numpy as np
+from typing import (Dict, Tuple)
+from toolbox_utils.geometry_arrays import feature_vertex_offsets, segment_index, segment_reduce
+
+# normal of roof face is closer than ~84 degrees to vertical
+ROOF_MIN_NORMAL_Z = 0.1
+
+
+def fan_triangles(arrays: Dict[str, np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    '''
+    Triangulates every ring as fan from its first vertex (closing vertex is skipped) - signed areas and volumes of fan triangles sum up exactly
+    also for concave rings. Returns (vertex indexes (number of triangles, 3), ring of every triangle).
+    '''
+    coords = arrays['coords']
+    starts, ends = arrays['ring_offsets'][:-1], arrays['ring_offsets'][1:]
+    closed = (ends - starts > 1) & np.all(coords[starts % max(len(coords), 1)] == coords[np.maximum(ends - 1, 0)], axis=1)
+    counts = np.maximum(ends - starts - closed - 2, 0)
+
+    triangle_rings = np.repeat(np.arange(len(starts)), counts)
+    k = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + 1
+    first = starts[triangle_rings]
+    return np.stack((first, first + k, first + k + 1), axis=1), triangle_rings
+
+
+def mesh_metrics(arrays: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    '''
+    Per-feature metrics of multipatch meshes computed from fan triangles of all features at once:
+    VOLUME - enclosed volume (signed tetrahedra, orientation of shell is taken from the sign), AREA - surface area,
+    ROOF_AREA - area of faces facing upwards, FOOTPRINT - horizontal projection of faces facing upwards,
+    CLOSURE - length of sum of area vectors relative to AREA (0 for closed shell), X_MIN ... Z_MAX - 3D bounding box.
+    '''
+    coords = arrays['coords']
+    num_features = len(arrays['feature_offsets']) - 1
+    vertex_offsets = feature_vertex_offsets(arrays)
+    metrics = {}
+    for axis, name in enumerate('XYZ'):
+        metrics[f'{name}_MIN'] = segment_reduce(np.minimum, coords[:, axis], vertex_offsets)
+        metrics[f'{name}_MAX'] = segment_reduce(np.maximum, coords[:, axis], vertex_offsets)
+
+    triangles, triangle_rings = fan_triangles(arrays)
+    ring_parts = segment_index(arrays['part_offsets'])
+    part_features = segment_index(arrays['feature_offsets'])
+    triangle_parts = ring_parts[triangle_rings]
+    triangle_features = part_features[triangle_parts]
+
+    # coordinates relative to first vertex of feature - large S-JTSK coordinates would swallow precision of products
+    origins = coords[np.minimum(vertex_offsets[:-1], max(len(coords) - 1, 0))] if len(coords) else np.zeros((num_features, 3))
+    a, b, c = (coords[triangles[:, i]] - origins[triangle_features] for i in range(3))
+    cross = np.cross(b - a, c - a)
+    signed_volume = np.bincount(triangle_features, weights=np.einsum('ij,ij->i', a, np.cross(b, c)) / 6, minlength=num_features)
+
+    # area vectors of polygons (holes have opposite orientation and are subtracted)
+    part_vectors = np.stack([np.bincount(triangle_parts, weights=cross[:, i] / 2, minlength=len(part_features)) for i in range(3)], axis=1)
+    part_areas = np.linalg.norm(part_vectors, axis=1)
+    metrics['AREA'] = np.bincount(part_features, weights=part_areas, minlength=num_features)
+    total_vectors = np.stack([np.bincount(part_features, weights=part_vectors[:, i], minlength=num_features) for i in range(3)], axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        metrics['CLOSURE'] = np.linalg.norm(total_vectors, axis=1) / metrics['AREA']
+
+        # outward normals point up on roofs - inward oriented shells have negative volume
+        orientation = np.where(signed_volume < 0, -1.0, 1.0)
+        normal_z = part_vectors[:, 2] * orientation[part_features] / part_areas
+    upward = np.nan_to_num(normal_z) > ROOF_MIN_NORMAL_Z
+    metrics['VOLUME'] = np.abs(signed_volume)
+    metrics['ROOF_AREA'] = np.bincount(part_features[upward], weights=part_areas[upward], minlength=num_features)
+    metrics['FOOTPRINT'] = np.bincount(part_features[upward], weights=np.abs(part_vectors[upward, 2]), minlength=num_features)
+    return metrics
@@ -1,9 +1,32 @@
-import arcpy
 import os
 import logging
 from datetime import datetime
 
 
+# when set to list, log_it only collects messages (used in worker processes, replayed by parent process)
+_captured_messages = None
+
+
+def capture_messages(captured: list = None) -> None:
+    '''
+    Starts (list given) or stops (None) collecting of log_it messages instead of printing them.
+    '''
+    global _captured_messages
+    _captured_messages = captured
+
+
+def _add_message(kind: str, message: str) -> None:
+    '''
+    Adds message of given kind (AddMessage, AddWarning, AddError) to arcpy tool messages, outside of ArcGIS (e.g. tests) prints it.
+    '''
+    try:
+        import arcpy
+    except ImportError:
+        print(message)
+        return
+    getattr(arcpy, kind)(message)
+
+
 def aprint(*args):
     '''Print message for python and arcpy tool.
     Parameters
@@ -14,7 +37,7 @@ def aprint(*args):
     args = [str(arg) for arg in args]
     m = f'{", ".join(args)}'
     # print(m)
-    arcpy.AddMessage(m)
+    _add_message('AddMessage', m)
 
 
 
@@ -41,8 +64,11 @@ def log_it(message: str, level: str, tool_name: str, arcgis_log=True, file_log=T
     '''
     Print on steroids - by default logs out given message into specified file and also prints out message into argis messges when the tool is ran.
     '''
-    logger = logging.getLogger(tool_name)
+    if _captured_messages is not None:
+        _captured_messages.append((message, level, tool_name, arcgis_log, file_log))
+        return
 
+    logger = logging.getLogger(tool_name)
 
     if level == 'info':
         if arcgis_log:
@@ -51,12 +77,12 @@ def log_it(message: str, level: str, tool_name: str, arcgis_log=True, file_log=T
             logger.info(_replace_n(message))
     elif level == 'warning':
         if arcgis_log:
-            arcpy.AddWarning(message)
+            _add_message('AddWarning', message)
         if file_log:
             logger.warning(_replace_n(message))
     elif level == 'error':
         if arcgis_log:
-            arcpy.AddError(message)
+            _add_message('AddError', message)
         if file_log:
             logger.error(_replace_n(message))
     else:
@@ -0,0 +1,65 @@
+import os
+import sys
+import multiprocessing
+from functools import partial
+from typing import (Callable, Iterator, List, Tuple)
+from toolbox_utils.messages_print import capture_messages, log_it
+
+
+def get_workers(workers) -> int:
+    '''
+    Parses worker count tool parameter - empty parameter means number of cores.
+    '''
+    if workers in (None, '', '#'):
+        return os.cpu_count() or 1
+    return max(1, int(workers))
+
+
+def _run_captured(func: Callable, args: tuple, location_folder: str) -> tuple:
+    '''
+    Runs func for one locality in worker process, log_it messages are collected and returned to parent process together with result.
+    '''
+    captured = []
+    capture_messages(captured)
+    try:
+        return captured, func(location_folder, *args), None
+    except Exception as err:
+        return captured, None, err
+    finally:
+        capture_messages(None)
+
+
+def _set_python_executable() -> None:
+    '''
+    Inside ArcGIS Pro sys.executable is ArcGISPro.exe - worker processes have to be spawned with python of the active environment.
+    '''
+    for exe in ('pythonw.exe', 'python.exe'):
+        python_path = os.path.join(sys.exec_prefix, exe)
+        if os.path.isfile(python_path):
+            multiprocessing.set_executable(python_path)
+            return
+
+
+def run_localities(func: Callable, location_folders: List[str], workers: int, *args) -> Iterator[Tuple[str, object]]:
+    '''
+    Runs func(location_folder, *args) for every locality in pool of worker processes (sequentially in current process for one worker).
+    Yields (location_folder, result) in order of location_folders, messages logged by workers are replayed in the same order.
+    func has to be top level function of tool module so it can be pickled.
+    '''
+    if workers <= 1 or len(location_folders) <= 1:
+        for location_folder in location_folders:
+            yield location_folder, func(location_folder, *args)
+        return
+
+    _set_python_executable()
+    workers = min(workers, len(location_folders))
+    log_it(f'Processing {len(location_folders)} localities in {workers} worker processes', 'info', __name__)
+
+    with multiprocessing.get_context('spawn').Pool(workers) as pool:
+        # imap keeps order of input while workers run ahead
+        for location_folder, (captured, result, err) in zip(location_folders, pool.imap(partial(_run_captured, func, args), location_folders)):
+            for message in captured:
+                log_it(*message)
+            if err is not None:
+                raise err
+            yield location_folder, result
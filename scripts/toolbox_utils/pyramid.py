@@ -0,0 +1,197 @@
+import os
+import hashlib
+import numpy as np
+from typing import (Dict, List)
+from toolbox_utils.messages_print import log_it
+from toolbox_utils.fc_cache import CACHE_DIR
+from toolbox_utils.raster import GeoTiffRaster, TileCache
+
+# number of raster cells along side of finest pyramid tile
+PYRAMID_TILE = 16
+PYRAMID_SUFFIX = '.minmax_pyramid.npz'
+# stored pyramids of older layout are rebuilt
+PYRAMID_VERSION = 2
+STATS = ('MIN', 'MAX', 'SUM', 'COUNT')
+
+
+class MinMaxPyramid(object):
+    '''
+    Quadtree of raster tiles - level 0 holds MIN, MAX, SUM and COUNT of valid cells of every tile x tile block, every next level reduces 2 x 2 nodes of previous one.
+    Statistics of area fully covering pyramid node are taken from the node, raster cells are listed and read only along borders of polygons.
+    '''
+
+    def __init__(self, levels: List[Dict[str, np.ndarray]], tile: int, rows: int, cols: int, source_key: str = ''):
+        self.levels = levels
+        self.tile = tile
+        self.rows = rows
+        self.cols = cols
+        self.source_key = source_key
+
+    @classmethod
+    def build(cls, raster, tile: int = PYRAMID_TILE, source_key: str = '') -> 'MinMaxPyramid':
+        '''
+        Builds pyramid from one pass over raster read by bands of tile rows.
+        MIN and MAX are exact - kept as float32 only when all of them fit into it without rounding (e.g. float32 DMR), float64 otherwise.
+        '''
+        if isinstance(raster, GeoTiffRaster):
+            # every block is read once in order - thru private cache of one row of blocks, blocks of shared TILE_CACHE stay for zonal statistics
+            scan = GeoTiffRaster(raster.path, TileCache(raster.block_rows * raster.blocks_across * raster.block_cols * raster.dtype.itemsize))
+            try:
+                return cls._build(scan, tile, source_key)
+            finally:
+                scan.close()
+        return cls._build(raster, tile, source_key)
+
+    @classmethod
+    def _build(cls, raster, tile: int, source_key: str) -> 'MinMaxPyramid':
+        tile_rows, tile_cols = -(-raster.rows // tile), -(-raster.cols // tile)
+        base = {'MIN': np.full((tile_rows, tile_cols), np.nan),
+                'MAX': np.full((tile_rows, tile_cols), np.nan),
+                'SUM': np.zeros((tile_rows, tile_cols)),
+                'COUNT': np.zeros((tile_rows, tile_cols), dtype=np.int64)}
+
+        for tile_row in range(tile_rows):
+            row = tile_row * tile
+            band = np.full((tile, tile_cols * tile), np.nan)
+            rows = min(tile, raster.rows - row)
+            band[:rows, :raster.cols] = raster.read_window(row, 0, rows, raster.cols)
+            blocks = band.reshape(tile, tile_cols, tile).swapaxes(0, 1).reshape(tile_cols, -1)
+            valid = ~np.isnan(blocks)
+            base['MIN'][tile_row] = np.where(valid, blocks, np.inf).min(axis=1)
+            base['MAX'][tile_row] = np.where(valid, blocks, -np.inf).max(axis=1)
+            base['SUM'][tile_row] = np.where(valid, blocks, 0).sum(axis=1)
+            base['COUNT'][tile_row] = valid.sum(axis=1)
+
+        for name in ('MIN', 'MAX'):
+            base[name][base['COUNT'] == 0] = np.nan
+            narrow = base[name].astype(np.float32)
+            if np.array_equal(narrow, base[name], equal_nan=True):
+                base[name] = narrow
+
+        levels = [base]
+        while levels[-1]['COUNT'].shape != (1, 1):
+            levels.append(cls._reduce(levels[-1]))
+        return cls(levels, tile, raster.rows, raster.cols, source_key)
+
+    @staticmethod
+    def _reduce(level: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        '''
+        Reduces 2 x 2 nodes of level into one node of next level.
+        '''
+        rows, cols = level['COUNT'].shape
+        reduced = {}
+        for name, fill, ufunc in (('MIN', np.nan, np.fmin), ('MAX', np.nan, np.fmax), ('SUM', 0, np.add), ('COUNT', 0, np.add)):
+            padded = np.full((rows + rows % 2, cols + cols % 2), fill, dtype=level[name].dtype)
+            padded[:rows, :cols] = level[name]
+            reduced[name] = ufunc.reduce(ufunc.reduce(padded.reshape(len(padded) // 2, 2, -1, 2), axis=3), axis=1)
+        return reduced
+
+    def save(self, path: str) -> None:
+        arrays = {f'{name}_{k}': level[name] for k, level in enumerate(self.levels) for name in STATS}
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, tile=self.tile, rows=self.rows, cols=self.cols, source_key=self.source_key, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'MinMaxPyramid':
+        with np.load(path) as data:
+            num_levels = sum(name.startswith('COUNT_') for name in data.files)
+            levels = [{name: data[f'{name}_{k}'] for name in STATS} for k in range(num_levels)]
+            return cls(levels, int(data['tile']), int(data['rows']), int(data['cols']), str(data['source_key']))
+
+    @classmethod
+    def for_raster(cls, raster, tile: int = PYRAMID_TILE) -> 'MinMaxPyramid':
+        '''
+        Returns pyramid of raster file - stored next to the raster (or in cache directory when not writable), rebuilt whenever the raster file changes.
+        Rasters which are not files (layers) get no pyramid (None).
+        '''
+        path = getattr(raster, 'path', None)
+        if not path or not os.path.isfile(path):
+            return None
+
+        stat = os.stat(path)
+        source_key = f'{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}|{tile}|{PYRAMID_VERSION}'
+        candidates = [f'{path}{PYRAMID_SUFFIX}',
+                      os.path.join(CACHE_DIR, hashlib.sha1(os.path.abspath(path).lower().encode('utf-8')).hexdigest()[:16] + PYRAMID_SUFFIX)]
+
+        for pyramid_path in candidates:
+            if os.path.isfile(pyramid_path):
+                try:
+                    pyramid = cls.load(pyramid_path)
+                    if pyramid.source_key == source_key:
+                        return pyramid
+                except (OSError, ValueError, KeyError):
+                    pass
+
+        log_it(f'Building min/max pyramid of {path}...', 'info', __name__)
+        pyramid = cls.build(raster, tile, source_key)
+        for pyramid_path in candidates:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(pyramid_path)), exist_ok=True)
+                pyramid.save(pyramid_path)
+                log_it(f'Min/max pyramid stored in {pyramid_path}', 'info', __name__)
+                break
+            except OSError:
+                continue
+        return pyramid
+
+    def split_spans(self, zones: np.ndarray, rows: np.ndarray, first_col: np.ndarray, end_col: np.ndarray) -> tuple:
+        '''
+        Splits spans of zones (zonal.polygon_spans) into nodes fully covered by zone (coarsest possible level) and remaining spans of border cells.
+        Finest tiles covered by spans in all their rows are found without listing cells, 2 x 2 covered nodes are merged into node of next level.
+        Returns ([(level, (zone, node row, node col) array) of covered nodes], (zone, row, first col, end col) of remaining spans in original order).
+        '''
+        tile = self.tile
+        tile_rows, tile_cols = self.levels[0]['COUNT'].shape
+        # tiles whose whole row lies in span - from first tile starting inside span up to last tile ending inside span (or at raster edge)
+        first_tile = -(-first_col // tile)
+        end_tile = np.where(end_col >= self.cols, tile_cols, end_col // tile)
+        counts = np.maximum(end_tile - first_tile, 0)
+        if counts.sum() == 0:
+            return [], (zones, rows, first_col, end_col)
+
+        span_of = np.repeat(np.arange(len(counts)), counts)
+        tile_col = first_tile[span_of] + np.arange(len(span_of)) - np.repeat(np.cumsum(counts) - counts, counts)
+        keys = (zones[span_of] * tile_rows + rows[span_of] // tile) * tile_cols + tile_col
+        unique_keys, inverse, row_counts = np.unique(keys, return_inverse=True, return_counts=True)
+        node_zones, node = np.divmod(unique_keys, tile_rows * tile_cols)
+        node_rows, node_cols = np.divmod(node, tile_cols)
+        covered = row_counts == np.minimum(tile, self.rows - node_rows * tile)
+        nodes = self._merge_nodes(np.stack((node_zones, node_rows, node_cols), axis=1)[covered])
+
+        # remaining parts of spans - before first, at not covered and after last tile
+        within = counts > 0
+        partial = np.flatnonzero(~covered[inverse.reshape(-1)])
+        partial_start = tile_col[partial] * tile
+        piece_spans = np.concatenate((np.arange(len(counts)), span_of[partial], np.arange(len(counts))))
+        piece_first = np.concatenate((first_col, partial_start, np.where(within, np.minimum(end_tile * tile, end_col), end_col)))
+        piece_end = np.concatenate((np.where(within, np.minimum(first_tile * tile, end_col), end_col), np.minimum(partial_start + tile, self.cols), end_col))
+
+        # stable sort keeps pieces of every span in order of columns
+        order = np.argsort(piece_spans, kind='stable')
+        order = order[piece_end[order] > piece_first[order]]
+        piece_spans = piece_spans[order]
+        return nodes, (zones[piece_spans], rows[piece_spans], piece_first[order], piece_end[order])
+
+    def _merge_nodes(self, keys: np.ndarray) -> List[tuple]:
+        '''
+        Merges covered finest tiles (zone, row, col) into coarsest covering nodes - node is covered when all its existing children are covered.
+        '''
+        nodes = []
+        level = 0
+        for k in range(1, len(self.levels)):
+            if len(keys) == 0:
+                break
+            child_rows, child_cols = self.levels[k - 1]['COUNT'].shape
+            level_rows, level_cols = self.levels[k]['COUNT'].shape
+            parents = (keys[:, 0] * level_rows + keys[:, 1] // 2) * level_cols + keys[:, 2] // 2
+            unique_parents, inverse, counts = np.unique(parents, return_inverse=True, return_counts=True)
+            parent_zones, parent = np.divmod(unique_parents, level_rows * level_cols)
+            parent_rows, parent_cols = np.divmod(parent, level_cols)
+            merged = counts == np.minimum(2, child_rows - parent_rows * 2) * np.minimum(2, child_cols - parent_cols * 2)
+            nodes.append((k - 1, keys[~merged[inverse.reshape(-1)]]))
+            keys = np.stack((parent_zones, parent_rows, parent_cols), axis=1)[merged]
+            level = k
+        nodes.append((level, keys))
+        return [(k, level_keys) for k, level_keys in nodes if len(level_keys)]
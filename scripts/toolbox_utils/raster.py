@@ -0,0 +1,262 @@
+import os
+import mmap
+import zlib
+import struct
+import numpy as np
+from collections import OrderedDict
+from toolbox_utils.messages_print import log_it
+
+# TIFF field types - struct format of one value
+TIFF_TYPES = {1: 'B', 2: 'c', 3: 'H', 4: 'I', 5: 'II', 6: 'b', 7: 'B', 8: 'h', 9: 'i', 10: 'ii', 11: 'f', 12: 'd', 16: 'Q', 17: 'q', 18: 'Q'}
+# numpy dtype kind of TIFF SampleFormat
+SAMPLE_FORMATS = {1: 'u', 2: 'i', 3: 'f'}
+
+
+class ArrayRaster(object):
+    '''
+    Raster held in memory - numpy array of values with grid given by upper left corner (x_min, y_max) and square cell size.
+    Base of other raster sources, synthetic rasters for testing of zonal statistics.
+    '''
+
+    def __init__(self, values: np.ndarray, x_min: float, y_max: float, cell_size: float, nodata=None):
+        self.values = values
+        self.x_min = x_min
+        self.y_max = y_max
+        self.cell_size = cell_size
+        self.rows, self.cols = values.shape if values is not None else (0, 0)
+        self.nodata = nodata
+
+    def read_window(self, row: int, col: int, rows: int, cols: int) -> np.ndarray:
+        '''
+        Returns window of values as float array (NoData as nan), window has to lie inside the raster.
+        '''
+        return self._to_float(self.values[row:row + rows, col:col + cols])
+
+    def _to_float(self, values: np.ndarray) -> np.ndarray:
+        window = values.astype(float)
+        if self.nodata is not None:
+            window[values == self.nodata] = np.nan
+        return window
+
+
+class ArcpyRaster(ArrayRaster):
+    '''
+    Raster dataset read by windows thru arcpy.RasterToNumPyArray (no Spatial Analyst licence needed).
+    '''
+
+    def __init__(self, path: str):
+        # arcpy is imported only for rasters which are not read directly - engines stay usable (and testable) without ArcGIS
+        import arcpy
+        raster = arcpy.Raster(path)
+        super().__init__(None, raster.extent.XMin, raster.extent.YMax, raster.meanCellWidth, raster.noDataValue)
+        self.rows, self.cols = raster.height, raster.width
+        self.path = path
+
+    def read_window(self, row: int, col: int, rows: int, cols: int) -> np.ndarray:
+        import arcpy
+        # center of lower left cell of the window - corner coordinates could snap to neighbouring cell
+        lower_left = arcpy.Point(self.x_min + (col + 0.5) * self.cell_size, self.y_max - (row + rows - 0.5) * self.cell_size)
+        return self._to_float(arcpy.RasterToNumPyArray(self.path, lower_left, cols, rows))
+
+
+class TileCache(object):
+    '''
+    LRU cache of decoded raster blocks bounded by size in bytes - shared by all rasters (and localities) of one process, counts hits and misses.
+    '''
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._blocks = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, loader) -> np.ndarray:
+        '''
+        Returns block of given key, loader() is called only on miss.
+        '''
+        if key in self._blocks:
+            self.hits += 1
+            self._blocks.move_to_end(key)
+            return self._blocks[key]
+
+        self.misses += 1
+        block = loader()
+        self._blocks[key] = block
+        self.size += block.nbytes
+        while self.size > self.max_bytes and len(self._blocks) > 1:
+            _, evicted = self._blocks.popitem(last=False)
+            self.size -= evicted.nbytes
+        return block
+
+    def clear(self) -> None:
+        '''
+        Drops all cached blocks and resets counters.
+        '''
+        self._blocks.clear()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> dict:
+        requests = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_ratio': round(self.hits / requests, 3) if requests else None,
+                'blocks': len(self._blocks), 'megabytes': round(self.size / 1024 ** 2, 1)}
+
+
+TILE_CACHE = TileCache(int(os.environ.get('KAM_TOOLBOX_TILE_CACHE', 1024 ** 3)))
+
+
+class GeoTiffRaster(ArrayRaster):
+    '''
+    Single band GeoTIFF (classic or BigTIFF, tiled or stripped, uncompressed or deflate) read by windows from memory-mapped file.
+    Decoded blocks (tiles or strips) are kept in shared TileCache, so repeated reads of the same area dont touch the file.
+    '''
+
+    def __init__(self, path: str, cache: TileCache = None):
+        super().__init__(None, 0.0, 0.0, 1.0)
+        self.path = path
+        self.cache = TILE_CACHE if cache is None else cache
+        self.key = (os.path.abspath(path), os.stat(path).st_mtime_ns)
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._parse_header()
+
+    def close(self) -> None:
+        '''
+        Releases memory-mapped file - on Windows the file cant be replaced while it is mapped.
+        '''
+        self._map.close()
+
+    def _read(self, fmt: str, offset: int) -> tuple:
+        return struct.unpack_from(self.byte_order + fmt, self._map, offset)
+
+    def _parse_header(self) -> None:
+        order = self._map[:2]
+        if order not in (b'II', b'MM'):
+            raise ValueError(f'{self.path} is not a TIFF file')
+        self.byte_order = '<' if order == b'II' else '>'
+        magic = self._read('H', 2)[0]
+        if magic == 42:
+            ifd_offset, count_fmt, entry_fmt, entry_size, inline = self._read('I', 4)[0], 'H', 'HHI', 12, 4
+        elif magic == 43:
+            ifd_offset, count_fmt, entry_fmt, entry_size, inline = self._read('Q', 8)[0], 'Q', 'HHQ', 20, 8
+        else:
+            raise ValueError(f'{self.path} is not a TIFF file')
+
+        # first IFD only - full resolution image
+        tags = {}
+        entries = self._read(count_fmt, ifd_offset)[0]
+        first_entry = ifd_offset + struct.calcsize(self.byte_order + count_fmt)
+        for i in range(entries):
+            entry = first_entry + i * entry_size
+            tag, field_type, count = self._read(entry_fmt, entry)
+            if field_type not in TIFF_TYPES:
+                continue
+            fmt = TIFF_TYPES[field_type] * count
+            value_offset = entry + struct.calcsize(self.byte_order + entry_fmt)
+            if struct.calcsize(self.byte_order + fmt) > inline:
+                value_offset = self._read('I' if magic == 42 else 'Q', value_offset)[0]
+            tags[tag] = self._read(fmt, value_offset)
+
+        self._set_layout(tags)
+        self._set_georeference(tags)
+
+    def _set_layout(self, tags: dict) -> None:
+        self.cols, self.rows = tags[256][0], tags[257][0]
+        bits = tags.get(258, (8,))[0]
+        kind = SAMPLE_FORMATS.get(tags.get(339, (1,))[0])
+        if tags.get(277, (1,))[0] != 1 or kind is None:
+            raise ValueError(f'{self.path} - only single band rasters are supported')
+        self.compression = tags.get(259, (1,))[0]
+        if self.compression not in (1, 8, 32946) or tags.get(317, (1,))[0] != 1:
+            raise ValueError(f'{self.path} - unsupported compression or predictor')
+        self.dtype = np.dtype(f'{self.byte_order}{kind}{bits // 8}')
+
+        if 322 in tags:
+            self.block_cols, self.block_rows = tags[322][0], tags[323][0]
+            self.offsets, self.byte_counts = tags[324], tags[325]
+        else:
+            # strips are blocks over full width of raster
+            self.block_cols, self.block_rows = self.cols, min(tags.get(278, (self.rows,))[0], self.rows)
+            self.offsets, self.byte_counts = tags[273], tags[279]
+        self.blocks_across = -(-self.cols // self.block_cols)
+
+    def _set_georeference(self, tags: dict) -> None:
+        if 33550 not in tags or 33922 not in tags:
+            raise ValueError(f'{self.path} has no georeference')
+        scale_x, scale_y = tags[33550][:2]
+        i, j, _, x, y = tags[33922][:5]
+        self.cell_size = scale_x
+        self.x_min = x - i * scale_x
+        self.y_max = y + j * scale_y
+        # GTRasterTypeGeoKey = RasterPixelIsPoint - tiepoint is center of cell
+        geo_keys = tags.get(34735, ())
+        for k in range(4, len(geo_keys), 4):
+            if geo_keys[k] == 1025 and geo_keys[k + 3] == 2:
+                self.x_min -= scale_x / 2
+                self.y_max += scale_y / 2
+        nodata = b''.join(tags[42113]).strip(b'\x00 ') if 42113 in tags else b''
+        self.nodata = self.dtype.type(float(nodata)) if nodata else None
+
+    def _load_block(self, index: int) -> np.ndarray:
+        '''
+        Decodes one block into array of full block size (last strip can be shorter).
+        '''
+        offset, count = self.offsets[index], self.byte_counts[index]
+        data = self._map[offset:offset + count]
+        if self.compression != 1:
+            data = zlib.decompress(data)
+        values = np.frombuffer(data, dtype=self.dtype)
+        block_rows = len(values) // self.block_cols
+        return values[:block_rows * self.block_cols].reshape(block_rows, self.block_cols)
+
+    def block(self, block_row: int, block_col: int) -> np.ndarray:
+        index = block_row * self.blocks_across + block_col
+        return self.cache.get(self.key + (index,), lambda: self._load_block(index))
+
+    def read_window(self, row: int, col: int, rows: int, cols: int) -> np.ndarray:
+        window = np.empty((rows, cols), dtype=self.dtype)
+        for block_row in range(row // self.block_rows, (row + rows - 1) // self.block_rows + 1):
+            for block_col in range(col // self.block_cols, (col + cols - 1) // self.block_cols + 1):
+                top, left = block_row * self.block_rows, block_col * self.block_cols
+                r0, r1 = max(row, top), min(row + rows, top + self.block_rows)
+                c0, c1 = max(col, left), min(col + cols, left + self.block_cols)
+                window[r0 - row:r1 - row, c0 - col:c1 - col] = self.block(block_row, block_col)[r0 - top:r1 - top, c0 - left:c1 - left]
+        return self._to_float(window)
+
+
+# opened rasters of this process {(path, mtime): raster}
+_open_rasters = {}
+
+
+def open_raster(path: str) -> ArrayRaster:
+    '''
+    Opens raster for windowed reading - GeoTIFFs directly from memory-mapped file (reused while file doesnt change), other rasters and layers thru arcpy.
+    Already opened raster (e.g. synthetic ArrayRaster) is returned as it is.
+    '''
+    if isinstance(path, ArrayRaster):
+        return path
+    if os.path.splitext(str(path))[1].lower() in ('.tif', '.tiff') and os.path.isfile(path):
+        key = (os.path.abspath(path), os.stat(path).st_mtime_ns)
+        if key not in _open_rasters:
+            try:
+                _open_rasters[key] = GeoTiffRaster(path)
+            except (ValueError, KeyError, struct.error, zlib.error) as err:
+                _open_rasters[key] = None
+                log_it(f'{path} will be read thru arcpy: {err}', 'info', __name__)
+        if _open_rasters[key] is not None:
+            return _open_rasters[key]
+    return ArcpyRaster(path)
+
+
+def close_rasters() -> None:
+    '''
+    Closes all rasters opened by open_raster and empties shared tile cache - to be called at the end of tool run,
+    so no file stays mapped (locked) and no blocks stay in memory of ArcGIS Pro process.
+    '''
+    for raster in _open_rasters.values():
+        if raster is not None:
+            raster.close()
+    _open_rasters.clear()
+    TILE_CACHE.clear()
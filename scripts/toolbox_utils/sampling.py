@@ -0,0 +1,34 @@
+import numpy as np
+from toolbox_utils.zonal import read_cells
+
+
+def bilinear_sample(raster, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    '''
+    Bilinear interpolation of raster values at points (x, y) between centers of four nearest cells - all points at once, every needed raster block is read once.
+    NoData cells are left out and weights of remaining cells renormalized, points outside the raster (or with all four cells NoData) get nan.
+    '''
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    values = np.full(len(x), np.nan)
+
+    # position in grid of cell centers
+    col = (x - raster.x_min) / raster.cell_size - 0.5
+    row = (raster.y_max - y) / raster.cell_size - 0.5
+    inside = (col >= -0.5) & (col < raster.cols - 0.5) & (row >= -0.5) & (row < raster.rows - 0.5)
+    if not inside.any():
+        return values
+    col, row = col[inside], row[inside]
+
+    col0, row0 = np.floor(col).astype(np.int64), np.floor(row).astype(np.int64)
+    tx, ty = col - col0, row - row0
+    # cells outside the raster along its border are replaced by the nearest cell
+    cols = np.clip(np.stack((col0, col0 + 1, col0, col0 + 1)), 0, raster.cols - 1)
+    rows = np.clip(np.stack((row0, row0, row0 + 1, row0 + 1)), 0, raster.rows - 1)
+    weights = np.stack(((1 - tx) * (1 - ty), tx * (1 - ty), (1 - tx) * ty, tx * ty))
+
+    corners = read_cells(raster, rows.reshape(-1), cols.reshape(-1)).reshape(4, -1)
+    valid = ~np.isnan(corners)
+    weights = np.where(valid, weights, 0)
+    total = weights.sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        values[inside] = np.where(total > 0, (np.where(valid, corners, 0) * weights).sum(axis=0) / total, np.nan)
+    return values
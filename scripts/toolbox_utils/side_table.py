@@ -0,0 +1,75 @@
+import os
+import arcpy
+import numpy as np
+from typing import Dict
+from toolbox_utils.columnar import cursor_to_columns
+
+
+def column_dtype(column: np.ndarray) -> str:
+    '''
+    Returns numpy dtype of table field for given column - whole number float columns without NULL values (ids, codes) are stored as integers.
+    '''
+    if column.dtype.kind == 'f' and len(column) and not np.isnan(column).any() and np.all(column == np.floor(column)) \
+            and np.abs(column).max() < 2 ** 31:
+        return '<i4'
+    if column.dtype.kind == 'i' and column.dtype.itemsize == 1:
+        # geodatabase has no 1-byte integer field - categorical codes are stored as SHORT
+        return '<i2'
+    return column.dtype.str
+
+
+def write_side_table(out_table: str, columns: Dict[str, np.ndarray]) -> str:
+    '''
+    Writes per-feature numeric columns {field name: numpy array} into new table (existing table of the same name is replaced), input data stay untouched.
+    NaN values of float columns are written as NULL.
+    '''
+    names = list(columns)
+    num_rows = len(columns[names[0]]) if names else 0
+    array = np.empty(num_rows, dtype=[(name, column_dtype(columns[name])) for name in names])
+    for name in names:
+        array[name] = columns[name]
+
+    if arcpy.Exists(out_table):
+        arcpy.management.Delete(out_table)
+    arcpy.da.NumPyArrayToTable(array, out_table)
+
+    return out_table
+
+
+def merge_side_table(out_table: str, key_field: str, replaced_keys: np.ndarray, columns: Dict[str, np.ndarray]) -> str:
+    '''
+    Replaces rows of existing side table whose key_field is in replaced_keys by recomputed numeric rows {field name: numpy array}, other rows stay as they are.
+    '''
+    fields = list(columns)
+    with arcpy.da.SearchCursor(out_table, fields) as cursor:
+        old = cursor_to_columns(cursor, fields)
+    keep = ~np.isin(old[key_field], replaced_keys)
+
+    return write_side_table(out_table, {name: np.concatenate((old[name][keep].astype(float), np.asarray(columns[name], dtype=float)))
+                                        for name in fields})
+
+
+def assign_coded_domain(out_table: str, field: str, domain: str, coded_values: Dict[int, str]) -> None:
+    '''
+    Attaches coded value domain {code: description} to SHORT field of side table, the domain is created in workspace of the table when missing.
+    Table keeps the codes, ArcGIS shows their descriptions.
+    '''
+    workspace = os.path.dirname(out_table)
+    if domain not in [existing.name for existing in arcpy.da.ListDomains(workspace)]:
+        arcpy.management.CreateDomain(workspace, domain, domain, 'SHORT', 'CODED')
+        for code, description in coded_values.items():
+            arcpy.management.AddCodedValueToDomain(workspace, domain, code, description)
+    arcpy.management.AssignDomainToField(out_table, field, domain)
+
+
+def make_join_view(fc: str, key_field: str, side_table: str, layer_dir: str = None) -> str:
+    '''
+    Creates on-demand view of results - layer of fc joined with side table on key_field, neither of them is modified.
+    With layer_dir the layer is saved as {side table name}_view.lyrx into it. Returns name of the layer.
+    '''
+    layer = f'{os.path.basename(side_table)}_view'
+    arcpy.management.MakeFeatureLayer(fc, layer)
+    arcpy.management.AddJoin(layer, key_field, side_table, key_field, 'KEEP_ALL')
+    if layer_dir:
+        arcpy.management.SaveToLayerFile(layer, os.path.join(layer_dir, f'{layer}.lyrx'), 'RELATIVE')
+    return layer
@@ -0,0 +1,101 @@
+import numpy as np
+from typing import Tuple
+
+# boxes covering more grid cells (outliers much bigger than median box) are not registered, they are compared with all boxes
+MAX_CELLS_PER_BOX = 64
+
+
+class GridIndex(object):
+    '''
+    Uniform grid over 2D bounding boxes (minx, miny, maxx, maxy) - every box is registered in all cells it covers.
+    Oversize boxes covering more than max_cells cells are kept aside, so single huge box doesnt register in quadratic number of cells.
+    Built and queried in bulk with numpy, no python loop over boxes.
+    '''
+
+    def __init__(self, boxes: np.ndarray, cell_size: float = None, max_cells: int = MAX_CELLS_PER_BOX):
+        self.boxes = np.asarray(boxes, dtype=float).reshape(-1, 4)
+        if cell_size is None:
+            # median box size keeps number of cells per box and boxes per cell small
+            sizes = np.maximum(self.boxes[:, 2] - self.boxes[:, 0], self.boxes[:, 3] - self.boxes[:, 1])
+            cell_size = float(np.median(sizes)) if len(sizes) else 1.0
+        self.cell_size = cell_size if cell_size > 0 else 1.0
+        self.origin = self.boxes[:, :2].min(axis=0) if len(self.boxes) else np.zeros(2)
+
+        low, high = self._cell_ranges(self.boxes)
+        oversize = np.prod((high - low + 1).astype(float), axis=1) > max_cells
+        self.oversize = np.flatnonzero(oversize)
+        self.cells, self.items = self._register(self.boxes, np.flatnonzero(~oversize))
+        order = np.argsort(self.cells, kind='stable')
+        self.cells, self.items = self.cells[order], self.items[order]
+
+    def _cell_ranges(self, boxes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        '''
+        Returns (first cell, last cell) - integer column and row - covered by every box.
+        '''
+        low = np.floor((boxes[:, :2] - self.origin) / self.cell_size).astype(np.int64)
+        high = np.floor((boxes[:, 2:] - self.origin) / self.cell_size).astype(np.int64)
+        return low, np.maximum(high, low)
+
+    def _register(self, boxes: np.ndarray, indexes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        '''
+        Returns (cell key, index of box) for every cell covered by every box of given indexes.
+        '''
+        low, high = self._cell_ranges(boxes[indexes])
+        spans = high - low + 1
+        counts = spans[:, 0] * spans[:, 1]
+        local_items = np.repeat(np.arange(len(indexes)), counts)
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        columns = low[local_items, 0] + local // spans[local_items, 1]
+        rows = low[local_items, 1] + local % spans[local_items, 1]
+        return self._cell_key(columns, rows), indexes[local_items]
+
+    @staticmethod
+    def _cell_key(columns: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        return (columns << np.int64(32)) + rows
+
+    def candidate_pairs(self) -> Tuple[np.ndarray, np.ndarray]:
+        '''
+        Returns all pairs (first, second) of indexes of boxes (first < second) whose bounding boxes intersect, every pair once.
+        '''
+        # every box is paired with boxes behind it in the same cell
+        starts = np.flatnonzero(np.r_[True, self.cells[1:] != self.cells[:-1]]) if len(self.cells) else np.empty(0, dtype=np.int64)
+        sizes = np.diff(np.r_[starts, len(self.cells)])
+        rank = np.arange(len(self.cells)) - np.repeat(starts, sizes)
+        counts = np.repeat(sizes, sizes) - 1 - rank
+        first = np.repeat(np.arange(len(self.cells)), counts)
+        second = first + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + 1
+        first, second = self.items[first], self.items[second]
+
+        if len(self.oversize):
+            big_first, big_second = self._oversize_pairs()
+            first, second = np.concatenate((first, big_first)), np.concatenate((second, big_second))
+        if len(first) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        first, second = np.minimum(first, second), np.maximum(first, second)
+
+        # boxes sharing more cells give the same pair more times
+        codes = np.unique(first * np.int64(len(self.boxes)) + second)
+        first, second = codes // len(self.boxes), codes % len(self.boxes)
+
+        a, b = self.boxes[first], self.boxes[second]
+        overlap = (a[:, 0] <= b[:, 2]) & (b[:, 0] <= a[:, 2]) & (a[:, 1] <= b[:, 3]) & (b[:, 1] <= a[:, 3])
+        return first[overlap], second[overlap]
+
+    def _oversize_pairs(self) -> Tuple[np.ndarray, np.ndarray]:
+        '''
+        Returns pairs of oversize boxes with registered boxes in cells they cover and pairs among oversize boxes (unfiltered, possibly repeated).
+        Registered cells under oversize box are found column by column in sorted cell keys - no cell of the box is listed.
+        '''
+        low, high = self._cell_ranges(self.boxes[self.oversize])
+        widths = high[:, 0] - low[:, 0] + 1
+        owners = np.repeat(np.arange(len(self.oversize)), widths)
+        columns = low[owners, 0] + np.arange(widths.sum()) - np.repeat(np.cumsum(widths) - widths, widths)
+        begin = np.searchsorted(self.cells, self._cell_key(columns, low[owners, 1]))
+        end = np.searchsorted(self.cells, self._cell_key(columns, high[owners, 1]), side='right')
+        counts = end - begin
+        positions = np.repeat(begin, counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        first, second = self.oversize[np.repeat(owners, counts)], self.items[positions]
+
+        # oversize boxes among themselves - at most half of boxes is bigger than median, so recursion is shallow
+        among_first, among_second = GridIndex(self.boxes[self.oversize]).candidate_pairs()
+        return np.concatenate((first, self.oversize[among_first])), np.concatenate((second, self.oversize[among_second]))
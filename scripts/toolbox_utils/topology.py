@@ -0,0 +1,70 @@
+import numpy as np
+from typing import (Dict, Tuple)
+from toolbox_utils.geometry_arrays import feature_vertex_offsets, segment_index, segment_reduce
+
+
+def mix64(values: np.ndarray) -> np.ndarray:
+    '''
+    splitmix64 finalizer over numpy uint64 array (same as hyperloglog._mix64) - arithmetic wraps modulo 2 ** 64.
+    '''
+    values = values + np.uint64(0x9E3779B97F4A7C15)
+    values = (values ^ (values >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    values = (values ^ (values >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+
+def vertex_hashes(coords: np.ndarray, quantum: float) -> np.ndarray:
+    '''
+    64 bit hashes of XYZ vertices quantized to grid of size quantum (m) - vertices closer than quantum share the hash (unless split by grid line).
+    '''
+    quantized = np.rint(coords / quantum).astype(np.int64).view(np.uint64)
+    hashes = mix64(quantized[:, 0])
+    hashes = mix64(hashes ^ quantized[:, 1])
+    return mix64(hashes ^ quantized[:, 2])
+
+
+def edge_keys(arrays: Dict[str, np.ndarray], groups: np.ndarray, quantum: float) -> Tuple[np.ndarray, np.ndarray]:
+    '''
+    Hashes every edge of every ring of features (both directions give the same key) together with integer group of its feature (e.g. index of ID_SEG).
+    Features with negative group are skipped, zero length edges (closing vertex, repeated vertex) too.
+    Returns (edge keys, group of every edge).
+    '''
+    coords = arrays['coords']
+    ring_offsets = arrays['ring_offsets']
+    following = np.arange(1, len(coords) + 1)
+    following[ring_offsets[1:] - 1] = ring_offsets[:-1]
+
+    vertex_groups = groups[segment_index(feature_vertex_offsets(arrays))]
+    hashes = vertex_hashes(coords, quantum)
+    start, end = hashes, hashes[following]
+    valid = (vertex_groups >= 0) & (start != end)
+
+    low = np.minimum(start, end)[valid]
+    high = np.maximum(start, end)[valid]
+    edge_groups = vertex_groups[valid]
+    keys = mix64(mix64(low ^ mix64(edge_groups.astype(np.uint64))) ^ high)
+
+    return keys, edge_groups
+
+
+def count_edge_usage(keys: np.ndarray) -> np.ndarray:
+    '''
+    Returns number of uses of the edge for every edge key.
+    '''
+    _, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+    return counts[inverse.reshape(-1)]
+
+
+def feature_hashes(arrays: Dict[str, np.ndarray], quantum: float = 0.0001) -> np.ndarray:
+    '''
+    64 bit content hash of every feature - quantized XYZ vertices in their order together with split into rings, features without geometry get 0.
+    Any move of a vertex by more than quantum (m), added or removed vertex or ring changes the hash.
+    '''
+    coords = arrays['coords']
+    offsets = feature_vertex_offsets(arrays)
+    position = np.arange(len(coords)) - offsets[segment_index(offsets)]
+    ring_start = np.zeros(len(coords) + 1, dtype=np.uint64)
+    ring_start[arrays['ring_offsets'][:-1]] = 1
+
+    hashes = mix64(vertex_hashes(coords, quantum) ^ mix64(position.astype(np.uint64) * np.uint64(2) + ring_start[:-1]))
+    return segment_reduce(np.bitwise_xor, hashes, offsets, empty=np.uint64(0))
@@ -0,0 +1,79 @@
+import numpy as np
+from typing import List
+
+
+class ViolationStore(object):
+    '''
+    Stores violations of rules as packed bit-arrays (one bit per row) - 1/8 byte per row and rule instead of python ints in lists.
+    Counts are known in O(1), ids of violating features are materialised only when asked for.
+    '''
+
+    def __init__(self, num_rows: int):
+        self.num_rows = num_rows
+        self._bits = {}
+        self._counts = {}
+        self._id_fields = {}
+        self._first_rows = {}
+
+    def add(self, rule: str, mask: np.ndarray, id_field: str = 'ID_PLO') -> None:
+        '''
+        Adds boolean mask of violating rows of given rule, rules without any violation are not stored.
+        '''
+        count = int(np.count_nonzero(mask))
+        if count == 0:
+            return
+        self._bits[rule] = np.packbits(mask)
+        self._counts[rule] = count
+        self._id_fields[rule] = id_field
+        self._first_rows[rule] = int(np.argmax(mask))
+
+    def __bool__(self) -> bool:
+        return bool(self._bits)
+
+    def rules(self) -> List[str]:
+        '''
+        Returns violated rules ordered by first violating row (rules violated by the same row keep order in which they were added).
+        '''
+        order = {rule: i for i, rule in enumerate(self._bits)}
+        return sorted(self._bits, key=lambda rule: (self._first_rows[rule], order[rule]))
+
+    def count(self, rule: str) -> int:
+        return self._counts.get(rule, 0)
+
+    def id_field(self, rule: str) -> str:
+        return self._id_fields[rule]
+
+    def bits(self, rule: str) -> np.ndarray:
+        '''
+        Returns packed bit-array of given rule (all zeros for rule without violations).
+        '''
+        if rule in self._bits:
+            return self._bits[rule]
+        return np.zeros((self.num_rows + 7) // 8, dtype=np.uint8)
+
+    def mask(self, bits: np.ndarray) -> np.ndarray:
+        '''
+        Unpacks bit-array (of rule or result of set operation) into boolean mask of rows.
+        '''
+        return np.unpackbits(bits, count=self.num_rows).astype(bool)
+
+    def union(self, *rules: str) -> np.ndarray:
+        return np.bitwise_or.reduce([self.bits(rule) for rule in rules]) if rules else self.bits(None)
+
+    def intersection(self, *rules: str) -> np.ndarray:
+        return np.bitwise_and.reduce([self.bits(rule) for rule in rules]) if rules else self.bits(None)
+
+    def difference(self, rule: str, *others: str) -> np.ndarray:
+        return self.bits(rule) & ~self.union(*others)
+
+    def count_bits(self, bits: np.ndarray) -> int:
+        '''
+        Number of rows set in bit-array.
+        '''
+        return int(np.unpackbits(bits, count=self.num_rows).sum())
+
+    def ids(self, rule: str, id_column: np.ndarray) -> List[int]:
+        '''
+        Materialises ids (values of id_column) of rows violating given rule.
+        '''
+        return id_column[self.mask(self.bits(rule))].astype(np.int64).tolist()
@@ -0,0 +1,148 @@
+import numpy as np
+from typing import (Dict, Tuple)
+from toolbox_utils.geometry_arrays import segment_index
+
+# side of window read at once from rasters without own blocks
+READ_BLOCK = 512
+
+
+def polygon_spans(coords: np.ndarray, ring_offsets: np.ndarray, ring_zones: np.ndarray, raster) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    '''
+    Scanline rasterization of polygons (rings of all zones at once) onto raster grid - cell belongs to zone when its center lies inside (even-odd rule, holes excluded).
+    Returns (zone, row, first col, end col) of non-empty spans of covered cells [first col, end col) sorted by zone and row, spans of one zone and row dont overlap.
+    '''
+    empty = np.empty(0, dtype=np.int64)
+    if len(coords) == 0:
+        return empty, empty, empty, empty
+
+    # edges of all rings - from every vertex to the following one
+    following = np.arange(1, len(coords) + 1)
+    following[ring_offsets[1:] - 1] = ring_offsets[:-1]
+    x0, y0 = coords[:, 0], coords[:, 1]
+    x1, y1 = coords[following, 0], coords[following, 1]
+    edge_zones = ring_zones[segment_index(ring_offsets)]
+
+    # rows whose cell center line y_max - (row + 0.5) * cell_size lies in [min y, max y) of edge
+    cell = raster.cell_size
+    first_row = np.floor((raster.y_max - np.maximum(y0, y1)) / cell - 0.5).astype(np.int64) + 1
+    last_row = np.floor((raster.y_max - np.minimum(y0, y1)) / cell - 0.5).astype(np.int64)
+    first_row = np.maximum(first_row, 0)
+    last_row = np.minimum(last_row, raster.rows - 1)
+    counts = np.maximum(last_row - first_row + 1, 0)
+
+    # crossings of edges with cell center lines
+    edges = np.repeat(np.arange(len(coords)), counts)
+    rows = first_row[edges] + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    center_y = raster.y_max - (rows + 0.5) * cell
+    x = x0[edges] + (center_y - y0[edges]) * (x1[edges] - x0[edges]) / (y1[edges] - y0[edges])
+    zones = edge_zones[edges]
+
+    # consecutive crossings of one zone and row bound span of cells inside
+    order = np.lexsort((x, rows, zones))
+    zones, rows, x = zones[order], rows[order], x[order]
+    if len(x) == 0:
+        return empty, empty, empty, empty
+    starts = np.flatnonzero(np.r_[True, (zones[1:] != zones[:-1]) | (rows[1:] != rows[:-1])])
+    rank = np.arange(len(x)) - np.repeat(starts, np.diff(np.r_[starts, len(x)]))
+    span_start = np.flatnonzero((rank % 2 == 0) & (np.r_[rank[1:], 0] == rank + 1))
+
+    # cells with center x in [x in, x out)
+    first_col = np.maximum(np.ceil((x[span_start] - raster.x_min) / cell - 0.5).astype(np.int64), 0)
+    end_col = np.minimum(np.ceil((x[span_start + 1] - raster.x_min) / cell - 0.5).astype(np.int64), raster.cols)
+    filled = end_col > first_col
+    return zones[span_start][filled], rows[span_start][filled], first_col[filled], end_col[filled]
+
+
+def span_cells(zones: np.ndarray, rows: np.ndarray, first_col: np.ndarray, end_col: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    '''
+    Expands spans [first col, end col) into (zone, row, col) of their cells.
+    '''
+    widths = np.maximum(end_col - first_col, 0)
+    spans = np.repeat(np.arange(len(widths)), widths)
+    cols = first_col[spans] + np.arange(widths.sum()) - np.repeat(np.cumsum(widths) - widths, widths)
+    return zones[spans], rows[spans], cols
+
+
+def polygon_cells(coords: np.ndarray, ring_offsets: np.ndarray, ring_zones: np.ndarray, raster) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    '''
+    Cells of polygons (polygon_spans) - returns (zone, row, col) of all covered cells sorted by zone and row.
+    '''
+    return span_cells(*polygon_spans(coords, ring_offsets, ring_zones, raster))
+
+
+def read_cells(raster, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+    '''
+    Returns values of given cells - only blocks of raster (tiles of GeoTIFF, READ_BLOCK x READ_BLOCK windows otherwise) containing some cell are read.
+    '''
+    values = np.full(len(rows), np.nan)
+    if len(rows) == 0:
+        return values
+
+    block_rows = getattr(raster, 'block_rows', READ_BLOCK)
+    block_cols = getattr(raster, 'block_cols', READ_BLOCK)
+    keys = (rows // block_rows) * (raster.cols // block_cols + 1) + cols // block_cols
+    order = np.argsort(keys, kind='stable')
+    bounds = np.flatnonzero(np.r_[True, keys[order][1:] != keys[order][:-1], True])
+
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        cells = order[start:end]
+        first_row, first_col = int(rows[cells].min()), int(cols[cells].min())
+        window = raster.read_window(first_row, first_col, int(rows[cells].max()) - first_row + 1, int(cols[cells].max()) - first_col + 1)
+        values[cells] = window[rows[cells] - first_row, cols[cells] - first_col]
+    return values
+
+
+def zonal_statistics(coords: np.ndarray, ring_offsets: np.ndarray, ring_zones: np.ndarray, num_zones: int, raster, pyramid=None) -> Dict[str, np.ndarray]:
+    '''
+    Zonal statistics of raster under polygons - returns {COUNT, AREA, MIN, MAX, MEAN} arrays indexed by zone (nan for zones without any cell), NoData cells are ignored.
+    With min/max pyramid of the raster (MinMaxPyramid) interiors of polygons are taken from pyramid nodes, only cells along borders of polygons are listed and read.
+    '''
+    spans = polygon_spans(coords, ring_offsets, ring_zones, raster)
+    nodes = []
+    if pyramid is not None:
+        nodes, spans = pyramid.split_spans(*spans)
+
+    # statistics are reduced per zone
+    zones, rows, cols = span_cells(*spans)
+    values = read_cells(raster, rows, cols)
+    valid = ~np.isnan(values)
+    zones, values = zones[valid], values[valid]
+
+    count = np.bincount(zones, minlength=num_zones).astype(float)
+    total = np.zeros(num_zones)
+    stats = {'MIN': np.full(num_zones, np.nan), 'MAX': np.full(num_zones, np.nan)}
+
+    if len(zones):
+        starts = np.flatnonzero(np.r_[True, zones[1:] != zones[:-1]])
+        present = zones[starts]
+        stats['MIN'][present] = np.minimum.reduceat(values, starts)
+        stats['MAX'][present] = np.maximum.reduceat(values, starts)
+        total[present] = np.add.reduceat(values, starts)
+
+    # covered pyramid nodes are added to statistics of border cells
+    for k, keys in nodes:
+        level = pyramid.levels[k]
+        node = (keys[:, 1], keys[:, 2])
+        count += np.bincount(keys[:, 0], weights=level['COUNT'][node], minlength=num_zones)
+        total += np.bincount(keys[:, 0], weights=level['SUM'][node], minlength=num_zones)
+        np.fmin.at(stats['MIN'], keys[:, 0], level['MIN'][node])
+        np.fmax.at(stats['MAX'], keys[:, 0], level['MAX'][node])
+
+    stats['COUNT'] = count
+    stats['AREA'] = count * raster.cell_size ** 2
+    with np.errstate(invalid='ignore', divide='ignore'):
+        stats['MEAN'] = np.where(count > 0, total / count, np.nan)
+    return stats
+
+
+def feature_zonal_statistics(arrays: Dict[str, np.ndarray], feature_zones: np.ndarray, num_zones: int, raster, pyramid=None) -> Dict[str, np.ndarray]:
+    '''
+    Zonal statistics for features in flat vertex arrays (wkb_to_arrays) - feature_zones gives zone of every feature, features with negative zone are skipped.
+    '''
+    ring_zones = feature_zones[segment_index(arrays['feature_offsets'])][segment_index(arrays['part_offsets'])]
+    ring_offsets = arrays['ring_offsets']
+    selected = ring_zones >= 0
+
+    coords = arrays['coords'][selected[segment_index(ring_offsets)]]
+    selected_offsets = np.r_[0, np.cumsum(np.diff(ring_offsets)[selected])]
+    return zonal_statistics(coords, selected_offsets, ring_zones[selected], num_zones, raster, pyramid)